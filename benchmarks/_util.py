@@ -0,0 +1,59 @@
+import os, re, glob, json, time, resource, subprocess
+from typing import List, Dict, Any
+
+from src.utils.constants import ARTIFACTS_DIR
+
+_PAGE_HEADING = re.compile(r"^# \[Page (\d+)\]\n", flags=re.M)
+
+
+def shipped_docs(artifacts_dir: str = ARTIFACTS_DIR) -> List[str]:
+    return sorted(os.path.splitext(os.path.basename(p))[0]
+                  for p in glob.glob(os.path.join(artifacts_dir, "*.md")))
+
+
+def load_pages(doc_id: str, artifacts_dir: str = ARTIFACTS_DIR) -> List[Dict[str, Any]]:
+    """Page records for a shipped filing, without touching the PDF.
+    Prefers <DOC>.pages.jsonl; falls back to splitting <DOC>.md on its '# [Page N]' headings."""
+    jsonl = os.path.join(artifacts_dir, doc_id + ".pages.jsonl")
+    if os.path.exists(jsonl):
+        with open(jsonl, "r", encoding="utf-8") as f:
+            f.readline()  # header
+            return [json.loads(line) for line in f if line.strip()]
+    with open(os.path.join(artifacts_dir, doc_id + ".md"), "r", encoding="utf-8") as f:
+        md = f.read()
+    pieces = _PAGE_HEADING.split(md)
+    # pieces: [preamble, page, text, page, text, ...]
+    return [{"page": int(pieces[i]), "text": pieces[i + 1].strip(), "tables": []}
+            for i in range(1, len(pieces) - 1, 2)]
+
+
+def timed(fn, *args, repeat: int = 1, **kwargs):
+    """Returns (last result, best wall time in seconds)."""
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(*args, **kwargs)
+        best = min(best, time.perf_counter() - t0)
+    return out, best
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+def write_results(path: str | None, results: Dict[str, Any]):
+    results = {"commit": git_commit(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), **results}
+    text = json.dumps(results, indent=2)
+    print(text)
+    if path:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
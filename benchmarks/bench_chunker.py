@@ -0,0 +1,56 @@
+"""Offset-slicing chunker vs. the original encode/decode chunker on the shipped filings.
+
+The original pipeline loaded the tokenizer for every PDF, so the baseline clears the
+`get_tokenizer` cache before each run and its time includes the load; the offset chunker
+runs with the process-level tokenizer already loaded.
+
+    python -m benchmarks.bench_chunker [--docs MSFT_2023 ...] [--out results.json]
+"""
+import argparse
+from src.splitter import chunk_markdown_pages, _chunk_markdown_pages_decode, get_tokenizer
+from benchmarks._util import shipped_docs, load_pages, timed, write_results
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+def _chunk_decode_fresh_tokenizer(pages):
+    get_tokenizer.cache_clear()
+    return _chunk_markdown_pages_decode(pages)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--docs", nargs="*", help="Doc IDs (default: every shipped filing).")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--out", default=None, help="Write JSON results here.")
+    args = ap.parse_args()
+
+    _, tok_load = timed(get_tokenizer)
+    rows = []
+    for doc_id in args.docs or shipped_docs():
+        pages = load_pages(doc_id)
+        old, t_old = timed(_chunk_decode_fresh_tokenizer, pages, repeat=args.repeat)
+        new, t_new = timed(chunk_markdown_pages, pages, repeat=args.repeat)
+        same_pages = sum(a["page_start"] == b["page_start"] and a["page_end"] == b["page_end"]
+                         for a, b in zip(old, new))
+        same_text = sum(_normalize(a["text"]) == _normalize(b["text"]) for a, b in zip(old, new))
+        rows.append({
+            "doc_id": doc_id,
+            "pages": len(pages),
+            "chunks_decode": len(old),
+            "chunks_offsets": len(new),
+            "seconds_decode": round(t_old, 4),
+            "seconds_offsets": round(t_new, 4),
+            "speedup": round(t_old / t_new, 2) if t_new else None,
+            "page_range_agreement": round(same_pages / max(len(old), 1), 4),
+            "text_agreement_ws_normalized": round(same_text / max(len(old), 1), 4),
+        })
+        print(f"[BENCH] {doc_id}: decode {t_old:.3f}s, offsets {t_new:.3f}s")
+
+    write_results(args.out, {"benchmark": "chunker", "tokenizer_load_seconds": round(tok_load, 3), "docs": rows})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Index size, search latency and recall@k for Matryoshka-truncated and quantized embeddings,
+against the full-width float32 index.
+
+Passages and chat_history.json sub-queries are embedded once at full width; each configuration
+truncates and renormalizes both sides (as `EmbedStore` does for `embed_dim`) and stores the
+passages in a NumPy store at the given precision.
+
+    python -m benchmarks.bench_embedding_precision [--dims 768 512 256 128] [--out results.json]
+"""
+import argparse, os, tempfile
+import numpy as np
+from src.embed_store import EmbedStore
+from src.numpy_store import NumpyCollection, VECTOR_DTYPES
+from src.utils.constants import DFEAULT_TOP_K, EMBED_CACHE_DIR
+from benchmarks._util import write_results
+from benchmarks.bench_vector_backend import _corpus, _workload, _exact, _bench
+
+
+def _truncate(embs: np.ndarray, dim: int) -> np.ndarray:
+    embs = embs[:, :dim]
+    return embs / np.maximum(np.linalg.norm(embs, axis=1, keepdims=True), 1e-12)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dims", nargs="*", type=int, default=[768, 512, 256, 128])
+    ap.add_argument("--dtypes", nargs="*", default=list(VECTOR_DTYPES))
+    ap.add_argument("--k", type=int, default=DFEAULT_TOP_K)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_precision_")
+    store = EmbedStore(persist_dir=os.path.join(tmp, "embedder"), embed_cache_dir=EMBED_CACHE_DIR, backend="numpy")
+    ids, texts, metas, embs = _corpus(store)
+    work = _workload()
+    q_embs = store._embed_queries([sq for sq, _ in work])
+    # Reference: full width, float32, exact search.
+    exact = [_exact(embs, metas, ids, q, where, args.k) for q, (_, where) in zip(q_embs, work)]
+
+    configs = []
+    for dim in args.dims:
+        p_dim, q_dim = _truncate(embs, dim), _truncate(q_embs, dim)
+        for dtype in args.dtypes:
+            path = os.path.join(tmp, f"{dim}_{dtype}")
+            col = NumpyCollection(path, dtype=dtype)
+            col.upsert(ids, p_dim, texts, metas)
+            col.flush()
+            size = sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(path)
+                       for f in fs if not f.endswith(".json"))
+            lat, res = _bench(col, q_dim, work, args.k, args.repeat)
+            recall = [len(set(r) & set(e)) / max(len(e), 1) for r, e in zip(res, exact)]
+            lat = np.asarray(lat) * 1000
+            configs.append({
+                "dim": dim,
+                "dtype": dtype,
+                "vector_bytes": size,
+                "query_ms_p50": round(float(np.percentile(lat, 50)), 3),
+                "query_ms_p95": round(float(np.percentile(lat, 95)), 3),
+                "recall_at_k": round(float(np.mean(recall)), 4),
+            })
+            print(f"[BENCH] dim={dim} {dtype}: {size / 1e6:.1f}MB, recall@{args.k} {configs[-1]['recall_at_k']}")
+
+    write_results(args.out, {
+        "benchmark": "embedding_precision",
+        "chunks": len(ids),
+        "queries": len(work),
+        "k": args.k,
+        "configs": configs,
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""PDF extraction time per filing and table recall, pdfium engine vs the all-pages pdfplumber path.
+
+The "pdfplumber" engine runs pdfplumber's text and table extraction on every page. The
+"pdfium" engine takes text from pypdfium2 and hands a page to pdfplumber only when
+`table_likely` finds ruling lines on it. Table recall is the share of the tables
+found by the all-pages path that the pdfium engine also produced, compared page by page as
+markdown. Row facts (`fact_store.extract_row_facts`) are counted for both engines as a check
+that the pdfium text still carries the financial statement rows.
+
+    python -m benchmarks.bench_extract [--docs MSFT_2023 ...] [--out results.json]
+"""
+import argparse, glob, os, time
+from collections import Counter
+from src.pdf_ingest import open_engine
+from src.fact_store import extract_row_facts
+from src.utils.constants import PDF_DIR
+from benchmarks._util import peak_rss_mb, write_results
+
+
+def _extract(pdf_path: str, engine: str):
+    t0 = time.perf_counter()
+    with open_engine(pdf_path, engine) as eng:
+        pages = [eng.page(i) for i in range(len(eng))]
+        table_pages = getattr(eng, "table_pages", len(pages))
+    return pages, table_pages, time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--docs", nargs="*", help="Doc IDs (default: every PDF under --pdf-dir).")
+    ap.add_argument("--pdf-dir", default=PDF_DIR)
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+
+    pdfs = {os.path.splitext(os.path.basename(p))[0]: p
+            for p in sorted(glob.glob(os.path.join(args.pdf_dir, "*.pdf")))}
+    docs = args.docs or sorted(pdfs)
+    if not docs:
+        raise SystemExit(f"No PDFs found under {args.pdf_dir}.")
+
+    rows = []
+    for doc_id in docs:
+        year = doc_id.split("_")[-1]
+        ref, _, t_ref = _extract(pdfs[doc_id], "pdfplumber")
+        fast, table_pages, t_fast = _extract(pdfs[doc_id], "pdfium")
+        n_ref = sum(len(p["tables"]) for p in ref)
+        found = sum(sum((Counter(r["tables"]) & Counter(f["tables"])).values()) for r, f in zip(ref, fast))
+        row = {
+            "doc_id": doc_id,
+            "pages": len(ref),
+            "pdfplumber_seconds": round(t_ref, 3),
+            "pdfium_seconds": round(t_fast, 3),
+            "speedup": round(t_ref / t_fast, 2) if t_fast else None,
+            "table_pages_scanned": table_pages,
+            "pages_with_tables": sum(1 for p in ref if p["tables"]),
+            "tables": n_ref,
+            "table_recall": round(found / n_ref, 4) if n_ref else None,
+            "row_facts_pdfplumber": sum(len(extract_row_facts(p["text"], year)) for p in ref),
+            "row_facts_pdfium": sum(len(extract_row_facts(p["text"], year)) for p in fast),
+        }
+        rows.append(row)
+        print(f"[BENCH] {doc_id}: {row['pdfplumber_seconds']}s -> {row['pdfium_seconds']}s "
+              f"({table_pages}/{len(ref)} pages scanned for tables), table recall {row['table_recall']}")
+
+    t_ref = sum(r["pdfplumber_seconds"] for r in rows)
+    t_fast = sum(r["pdfium_seconds"] for r in rows)
+    n_tables = sum(r["tables"] for r in rows)
+    found = sum((r["table_recall"] or 0) * r["tables"] for r in rows)
+    write_results(args.out, {
+        "benchmark": "extract",
+        "pdfplumber_seconds_per_filing": round(t_ref / len(rows), 3),
+        "pdfium_seconds_per_filing": round(t_fast / len(rows), 3),
+        "speedup": round(t_ref / t_fast, 2) if t_fast else None,
+        "table_recall": round(found / n_tables, 4) if n_tables else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "docs": rows,
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Ingest throughput per stage: PDF extraction, chunking and embedding + upsert.
+
+Extraction runs on the PDFs under data/pdfs when present; otherwise (or with --no-pdf) the
+shipped page records in artifacts/processed are used and extraction is skipped. Chunks are
+added to a throwaway store, so the real index is untouched. The embedding cache is off by
+default so the encoder cost is measured.
+
+    python -m benchmarks.bench_ingest [--docs MSFT_2023 ...] [--workers 4] [--backend numpy] [--out results.json]
+"""
+import argparse, glob, os, tempfile
+from src.pdf_ingest import extract_pdf_to_markdown
+from src.splitter import chunk_markdown_pages, get_tokenizer
+from src.embed_store import EmbedStore
+from src.utils.constants import PDF_DIR, EMBED_CACHE_DIR, VECTOR_BACKEND
+from benchmarks._util import shipped_docs, load_pages, timed, peak_rss_mb, write_results
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--docs", nargs="*", help="Doc IDs (default: every PDF, else every shipped filing).")
+    ap.add_argument("--pdf-dir", default=PDF_DIR)
+    ap.add_argument("--no-pdf", action="store_true", help="Skip extraction; use shipped page records.")
+    ap.add_argument("--workers", type=int, default=1, help="Extraction processes per PDF.")
+    ap.add_argument("--backend", default=VECTOR_BACKEND)
+    ap.add_argument("--embed-cache", action="store_true", help="Embed through the on-disk embedding cache.")
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+
+    pdfs = {} if args.no_pdf else {os.path.splitext(os.path.basename(p))[0]: p
+                                   for p in sorted(glob.glob(os.path.join(args.pdf_dir, "*.pdf")))}
+    docs = args.docs or sorted(pdfs) or shipped_docs()
+
+    _, t_tok = timed(get_tokenizer)
+    store, t_store = timed(EmbedStore, persist_dir=tempfile.mkdtemp(prefix="bench_ingest_"),
+                           embed_cache_dir=EMBED_CACHE_DIR if args.embed_cache else None, backend=args.backend)
+
+    rows = []
+    for doc_id in docs:
+        company, year = doc_id.split("_")
+        if doc_id in pdfs:
+            (_, pages), t_extract = timed(extract_pdf_to_markdown, pdfs[doc_id], workers=args.workers)
+        else:
+            pages, t_extract = load_pages(doc_id), None
+        chunks, t_chunk = timed(chunk_markdown_pages, pages)
+        _, t_add = timed(store.add_chunks, doc_id, chunks, {"doc_id": doc_id, "company": company, "year": year})
+        total = (t_extract or 0.0) + t_chunk + t_add
+        rows.append({
+            "doc_id": doc_id,
+            "pages": len(pages),
+            "chunks": len(chunks),
+            "extract_seconds": round(t_extract, 3) if t_extract is not None else None,
+            "chunk_seconds": round(t_chunk, 3),
+            "add_chunks_seconds": round(t_add, 3),
+            "pages_per_second": round(len(pages) / total, 2) if total else None,
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        })
+        print(f"[BENCH] {doc_id}: {len(pages)} pages, {len(chunks)} chunks in {total:.2f}s")
+
+    n_pages = sum(r["pages"] for r in rows)
+    total = sum((r["extract_seconds"] or 0.0) + r["chunk_seconds"] + r["add_chunks_seconds"] for r in rows)
+    write_results(args.out, {
+        "benchmark": "ingest",
+        "extracted_from_pdf": sorted(d for d in docs if d in pdfs),
+        "workers": args.workers,
+        "backend": args.backend,
+        "embed_cache": args.embed_cache,
+        "load_seconds": {"tokenizer": round(t_tok, 3), "embed_store": round(t_store, 3)},
+        "pages": n_pages,
+        "seconds": round(total, 3),
+        "pages_per_second": round(n_pages / total, 2) if total else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "docs": rows,
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Peak memory and throughput of indexing one filing, whole-document lists vs the streaming path.
+
+`list` is the pre-streaming pipeline: every page record, chunk and embedding of the filing is
+built before the next stage starts. `stream` is `indexer._ingest_filing`: pages flow through
+chunking, fixed-size embedding batches and upserts as they are read. To show how each scales
+with document size, a shipped filing's page records are repeated `--scale` times (pages
+renumbered) into a synthetic page artifact. Every (mode, scale) runs in a fresh subprocess so
+peak RSS is its own; `baseline_rss_mb` is the RSS after the models are loaded, and
+`ingest_rss_mb` the growth on top of it. The BM25 index and the numpy backend keep what they
+index in memory, so part of that growth is the index itself; `--no-lexical` with the Chroma
+backend leaves only the pipeline's own working set.
+
+    python -m benchmarks.bench_ingest_memory [--doc MSFT_2023] [--scale 1 4 16] [--backend numpy] [--out results.json]
+"""
+import argparse, json, os, subprocess, sys, tempfile, time
+from src.utils.constants import VECTOR_BACKEND
+from benchmarks._util import shipped_docs, load_pages, peak_rss_mb, write_results
+
+MODES = ("list", "stream")
+
+
+def _current_rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024.0 * 1024.0)
+
+
+def _synthetic_artifact(doc_id: str, scale: int, out_dir: str) -> str:
+    """Writes <doc_id>x<scale>.pages.jsonl and returns the (nonexistent) PDF path it stands for."""
+    from src.pdf_ingest import write_page_artifact
+    pages = load_pages(doc_id)
+    n = len(pages)
+    big = ({**rec, "page": rec["page"] + k * n} for k in range(scale) for rec in pages)
+    name = f"{doc_id}x{scale}"
+    write_page_artifact(os.path.join(out_dir, name + ".pages.jsonl"), "bench", list(big))
+    return os.path.join(out_dir, name + ".pdf")
+
+
+def _child(args):
+    from src.embed_store import EmbedStore
+    from src.fact_store import FactStore, extract_facts
+    from src.pdf_ingest import stream_markdown, load_page_artifact, _records_to_markdown, _page_artifact_path
+    from src.splitter import chunk_markdown_pages, get_tokenizer
+    from src.indexer import _ingest_filing
+
+    tmp = tempfile.mkdtemp(prefix="bench_ingest_memory_")
+    get_tokenizer()
+    store = EmbedStore(persist_dir=os.path.join(tmp, "db"),
+                       lexical_path=None if args.no_lexical else os.path.join(tmp, "bm25.json"),
+                       embed_cache_dir=None, backend=args.backend)
+    facts = FactStore(os.path.join(tmp, "facts.sqlite"))
+    doc_id = os.path.splitext(os.path.basename(args.pdf))[0]
+    company, year = args.doc.split("_")
+    baseline = _current_rss_mb()
+
+    t0 = time.perf_counter()
+    if args.child == "list":
+        pages = load_page_artifact(_page_artifact_path(args.pdf, args.artifacts), "bench")
+        with open(os.path.join(tmp, doc_id + ".md"), "w", encoding="utf-8") as f:
+            f.write(_records_to_markdown(pages))
+        chunks = chunk_markdown_pages(pages)
+        ids = store.add_chunks(doc_id, chunks, {"doc_id": doc_id, "company": company, "year": year})
+        facts.replace_doc(doc_id, extract_facts(pages, chunks, ids, company, year))
+        counts = {"pages": len(pages), "chunks": len(chunks)}
+    else:
+        info = stream_markdown(args.pdf, args.artifacts, pdf_sha="bench")
+        info.update(company=company, year=year)
+        counts = _ingest_filing(store, facts, doc_id, args.pdf, info)
+    seconds = time.perf_counter() - t0
+
+    peak = peak_rss_mb()
+    print(json.dumps({"pages": counts["pages"], "chunks": counts["chunks"], "seconds": round(seconds, 3),
+                      "pages_per_second": round(counts["pages"] / seconds, 2) if seconds else None,
+                      "baseline_rss_mb": round(baseline, 1), "peak_rss_mb": round(peak, 1),
+                      "ingest_rss_mb": round(peak - baseline, 1)}))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--doc", default=None, help="Shipped filing to scale (default: the first one).")
+    ap.add_argument("--scale", nargs="*", type=int, default=[1, 4, 16], help="Times the filing is repeated.")
+    ap.add_argument("--modes", nargs="*", default=list(MODES), choices=MODES)
+    ap.add_argument("--backend", default=VECTOR_BACKEND)
+    ap.add_argument("--no-lexical", action="store_true", help="Index without the in-memory BM25 index.")
+    ap.add_argument("--out", default=None)
+    # Internal: run one measurement in this process.
+    ap.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    ap.add_argument("--pdf", help=argparse.SUPPRESS)
+    ap.add_argument("--artifacts", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    args.doc = args.doc or shipped_docs()[0]
+    if args.child:
+        return _child(args)
+
+    artifacts = tempfile.mkdtemp(prefix="bench_ingest_memory_artifacts_")
+    rows = []
+    for scale in args.scale:
+        pdf = _synthetic_artifact(args.doc, scale, artifacts)
+        for mode in args.modes:
+            out = subprocess.check_output(
+                [sys.executable, "-m", "benchmarks.bench_ingest_memory", "--child", mode, "--doc", args.doc,
+                 "--pdf", pdf, "--artifacts", artifacts, "--backend", args.backend]
+                + (["--no-lexical"] if args.no_lexical else []), text=True)
+            row = {"mode": mode, "scale": scale, **json.loads(out.strip().splitlines()[-1])}
+            rows.append(row)
+            print(f"[BENCH] {mode} x{scale}: {row['pages']} pages, {row['pages_per_second']} pages/s, "
+                  f"+{row['ingest_rss_mb']} MB over baseline")
+
+    write_results(args.out, {
+        "benchmark": "ingest_memory",
+        "doc": args.doc,
+        "backend": args.backend,
+        "lexical": not args.no_lexical,
+        "runs": rows,
+    })
+
+
+if __name__ == "__main__":
+    main()
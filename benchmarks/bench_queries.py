@@ -0,0 +1,175 @@
+"""End-to-end query replay: latency per stage, peak RSS and retrieval quality.
+
+Replays the questions in chat_history.json (and optionally a JSONL file) through `run_query`
+with `StubLLM`, so only local work is measured. Gold pages are the (company, year, page)
+sources of the saved responses. recall@k is the share of gold pages among the top-k returned
+sources, and MRR uses the rank of the first gold page. `candidate_recall` measures the same
+pages in the pre-rerank candidates.
+
+JSONL lines look like {"question": ..., "sources": [{"company", "year", "page"}, ...]}, with
+optional "sub_queries" used as the stub's plan when the local planner declines.
+
+    python -m benchmarks.bench_queries [--questions more.jsonl] [--k 10] [--no-facts] [--out results.json]
+"""
+import argparse, json, os, time
+import numpy as np
+from src.embed_store import EmbedStore
+from src.bge_reranker import BGEReranker
+from src.fact_store import FactStore
+from src.llm import StubLLM
+from src.query_engine import run_query
+from src.utils.constants import (OUT_PATH, PERSIST_DIR, DFEAULT_TOP_K, RERANK_TOP_K, FACTS_DB_PATH,
+                                 BM25_INDEX_PATH, VECTOR_BACKEND)
+from benchmarks._util import timed, peak_rss_mb, write_results
+
+
+class _StageTimer:
+    """Proxy that times calls to selected methods of the wrapped object; other attributes pass through."""
+
+    def __init__(self, obj, stages: dict, times: dict, outputs: dict | None = None):
+        self._obj, self._stages, self._times, self._outputs = obj, stages, times, outputs
+
+    def __getattr__(self, name):
+        attr = getattr(self._obj, name)
+        stage = self._stages.get(name)
+        if stage is None or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            t0 = time.perf_counter()
+            out = attr(*args, **kwargs)
+            self._times[stage] = self._times.get(stage, 0.0) + time.perf_counter() - t0
+            if self._outputs is not None:
+                self._outputs.setdefault(stage, []).append(out)
+            return out
+        return call
+
+
+def _gold(sources) -> list:
+    out = []
+    for s in sources or []:
+        key = (s.get("company"), str(s.get("year")), s.get("page"))
+        if None not in key and key not in out:
+            out.append(key)
+    return out
+
+
+def _questions(history_path: str, jsonl_path: str | None) -> list:
+    items = []
+    if history_path and os.path.exists(history_path):
+        with open(history_path, "r", encoding="utf-8") as f:
+            for item in json.load(f):
+                resp = item.get("response") or {}
+                items.append({"question": item["question"], "gold": _gold(resp.get("sources")),
+                              "sub_queries": resp.get("sub_queries")})
+    if jsonl_path:
+        with open(jsonl_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    items.append({"question": item["question"], "gold": _gold(item.get("sources")),
+                                  "sub_queries": item.get("sub_queries")})
+    return items
+
+
+def _ranked_pages(rows) -> list:
+    out = []
+    for r in rows:
+        key = (r.get("company"), str(r.get("year")), r.get("page") if "page" in r else r.get("page_start"))
+        if key not in out:
+            out.append(key)
+    return out
+
+
+def _quality(ranked: list, gold: list, k: int):
+    if not gold:
+        return None, None
+    hits = set(ranked[:k]) & set(gold)
+    rr = next((1.0 / (i + 1) for i, p in enumerate(ranked) if p in gold), 0.0)
+    return len(hits) / len(gold), rr
+
+
+def _pct(xs, q):
+    return round(float(np.percentile(xs, q)), 4) if xs else None
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--history", default=OUT_PATH, help="Saved chat history to replay.")
+    ap.add_argument("--questions", default=None, help="Extra questions as JSONL.")
+    ap.add_argument("--k", type=int, default=DFEAULT_TOP_K, help="Dense top-k per sub-query.")
+    ap.add_argument("--recall-k", type=int, default=RERANK_TOP_K * 3, help="Cutoff for recall@k over returned sources.")
+    ap.add_argument("--backend", default=VECTOR_BACKEND)
+    ap.add_argument("--no-facts", action="store_true", help="Always take the retrieval path.")
+    ap.add_argument("--no-lexical", action="store_true", help="Dense-only retrieval.")
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+
+    items = _questions(args.history, args.questions)
+    lexical = None if args.no_lexical or not os.path.exists(BM25_INDEX_PATH) else BM25_INDEX_PATH
+    store, t_store = timed(EmbedStore, persist_dir=PERSIST_DIR, lexical_path=lexical, backend=args.backend)
+    reranker, t_rerank = timed(BGEReranker)
+    facts = None if args.no_facts or not os.path.exists(FACTS_DB_PATH) else FactStore(FACTS_DB_PATH)
+    llm = StubLLM(plans={it["question"]: {"intent": "default", "sub_queries": it["sub_queries"]}
+                         for it in items if it["sub_queries"]})
+    rss_loaded = peak_rss_mb()
+
+    rows, stage_totals = [], {}
+    for it in items:
+        times, outputs = {}, {}
+        store_proxy = _StageTimer(store, {"query_many": "retrieve", "hybrid_query_many": "retrieve",
+                                            "get_chunks": "fetch_chunks"}, times, outputs)
+        t0 = time.perf_counter()
+        resp = run_query(it["question"], store_proxy, k=args.k,
+                         reranker=_StageTimer(reranker, {"rerank_many": "rerank"}, times),
+                         llm=_StageTimer(llm, {"decompose_query": "decompose", "synthesize": "synthesize"}, times),
+                         facts=_StageTimer(facts, {"lookup": "fact_lookup"}, times) if facts else None)
+        total = time.perf_counter() - t0
+        times["other"] = max(0.0, total - sum(times.values()))
+        for stage, sec in times.items():
+            stage_totals.setdefault(stage, []).append(sec)
+
+        candidates = [r for out in outputs.get("retrieve", []) for hits in out for r in hits]
+        recall, rr = _quality(_ranked_pages(resp["sources"]), it["gold"], args.recall_k)
+        # None on the fact-index path, which retrieves no candidates.
+        cand_recall = _quality(_ranked_pages(candidates), it["gold"], len(candidates))[0] if candidates else None
+        rows.append({
+            "question": it["question"],
+            "seconds": round(total, 4),
+            "stages": {s: round(v, 4) for s, v in times.items()},
+            "sub_queries": len(resp["sub_queries"]),
+            "candidates": len(candidates),
+            "gold_pages": len(it["gold"]),
+            f"recall_at_{args.recall_k}": recall,
+            "mrr": rr,
+            "candidate_recall": cand_recall,
+        })
+        print(f"[BENCH] {total:.2f}s recall={recall} mrr={rr} :: {it['question'][:60]}")
+
+    graded = [r for r in rows if r["gold_pages"]]
+    cands = [r["candidate_recall"] for r in graded if r["candidate_recall"] is not None]
+    totals = [r["seconds"] for r in rows]
+    write_results(args.out, {
+        "benchmark": "queries",
+        "questions": len(rows),
+        "graded_questions": len(graded),
+        "k": args.k,
+        "backend": args.backend,
+        "lexical": lexical is not None,
+        "facts": facts is not None,
+        "load_seconds": {"embed_store": round(t_store, 3), "reranker": round(t_rerank, 3)},
+        "seconds_p50": _pct(totals, 50),
+        "seconds_p95": _pct(totals, 95),
+        "seconds_mean": round(float(np.mean(totals)), 4) if totals else None,
+        "stage_seconds_mean": {s: round(float(np.mean(v)), 4) for s, v in stage_totals.items()},
+        f"recall_at_{args.recall_k}": round(float(np.mean([r[f"recall_at_{args.recall_k}"] for r in graded])), 4) if graded else None,
+        "mrr": round(float(np.mean([r["mrr"] for r in graded])), 4) if graded else None,
+        "candidate_recall": round(float(np.mean(cands)), 4) if cands else None,
+        "peak_rss_mb_loaded": round(rss_loaded, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "per_question": rows,
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Reranker latency and ranking agreement: length-bucketed bf16/int8 modes vs. the original
+single padded fp32 batch.
+
+Candidates per sub-query come from the shipped filings: the chunks of the sub-query's
+company/year ranked by term overlap, i.e. a stand-in for the dense top-k.
+
+    python -m benchmarks.bench_reranker [--modes fp32 bf16 int8] [--out results.json]
+"""
+import argparse, json, re
+import torch
+from src.bge_reranker import BGEReranker
+from src.splitter import chunk_markdown_pages
+from src.utils.constants import OUT_PATH, DFEAULT_TOP_K, RERANK_TOP_K
+from src.utils.parser import COMPANY_ALIASES
+from benchmarks._util import load_pages, timed, write_results
+
+
+def _reference_scores(reranker: BGEReranker, query: str, texts):
+    # The pre-bucketing path: one batch padded to the longest pair.
+    with torch.no_grad():
+        inputs = reranker.tokenizer([[query, t] for t in texts], padding=True, truncation=True,
+                                    return_tensors="pt", max_length=512)
+        return reranker.model(**inputs, return_dict=True).logits.view(-1, ).float().tolist()
+
+
+def _spearman(a, b) -> float:
+    def ranks(xs):
+        order = sorted(range(len(xs)), key=xs.__getitem__)
+        r = [0] * len(xs)
+        for rank, i in enumerate(order):
+            r[i] = rank
+        return r
+    ra, rb = ranks(a), ranks(b)
+    n = len(a)
+    if n < 2:
+        return 1.0
+    d2 = sum((x - y) ** 2 for x, y in zip(ra, rb))
+    return 1 - 6 * d2 / (n * (n * n - 1))
+
+
+def _workload(k: int):
+    with open(OUT_PATH, "r", encoding="utf-8") as f:
+        history = json.load(f)
+    chunk_cache, work = {}, []
+    for item in history:
+        resp = item["response"]
+        for sq in resp.get("sub_queries", []):
+            low = sq.lower()
+            company = next((canon for alias, canon in COMPANY_ALIASES.items() if alias.lower() in low), None)
+            year = re.search(r"20\d{2}", sq)
+            if not company or not year:
+                continue
+            doc_id = f"{company}_{year.group(0)}"
+            if doc_id not in chunk_cache:
+                chunk_cache[doc_id] = [c["text"] for c in chunk_markdown_pages(load_pages(doc_id))]
+            terms = set(re.findall(r"\w+", low))
+            ranked = sorted(chunk_cache[doc_id], key=lambda t: -len(terms & set(re.findall(r"\w+", t.lower()))))
+            work.append((sq, ranked[:k]))
+    return work
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--modes", nargs="*", default=["fp32", "bf16", "int8"])
+    ap.add_argument("--k", type=int, default=DFEAULT_TOP_K)
+    ap.add_argument("--threads", type=int, default=None)
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+
+    work = _workload(args.k)
+    ref = BGEReranker(precision="fp32", num_threads=args.threads)
+    ref_scores, t_ref = timed(lambda: [_reference_scores(ref, q, texts) for q, texts in work])
+
+    modes = []
+    for mode in args.modes:
+        rr, t_load = timed(BGEReranker, precision=mode, num_threads=args.threads)
+        scores, t = timed(lambda: [rr.score_pairs([(q, x) for x in texts]) for q, texts in work])
+        top_agree, rho = [], []
+        for s_ref, s in zip(ref_scores, scores):
+            top_ref = set(sorted(range(len(s_ref)), key=lambda i: -s_ref[i])[:RERANK_TOP_K])
+            top = set(sorted(range(len(s)), key=lambda i: -s[i])[:RERANK_TOP_K])
+            top_agree.append(len(top_ref & top) / max(len(top_ref), 1))
+            rho.append(_spearman(s_ref, s))
+        modes.append({
+            "mode": mode,
+            "load_seconds": round(t_load, 3),
+            "seconds": round(t, 3),
+            "speedup_vs_reference": round(t_ref / t, 2) if t else None,
+            f"top{RERANK_TOP_K}_agreement": round(sum(top_agree) / max(len(top_agree), 1), 4),
+            "spearman": round(sum(rho) / max(len(rho), 1), 4),
+        })
+        print(f"[BENCH] {mode}: {t:.2f}s (reference fp32 {t_ref:.2f}s)")
+
+    write_results(args.out, {
+        "benchmark": "reranker",
+        "sub_queries": len(work),
+        "candidates_per_sub_query": args.k,
+        "reference_fp32_seconds": round(t_ref, 3),
+        "modes": modes,
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Server throughput under concurrent load, with and without cross-request batching.
+
+Starts `RAGServer` in-process on a free port, backed by a pipeline whose LLM is `StubLLM`
+with an optional simulated round trip (`--llm-latency`, standing in for Gemini). The
+chat_history.json questions are fired at each concurrency level over HTTP, and throughput,
+latency and the batchers' mean batch sizes are reported.
+
+    python -m benchmarks.bench_server [--concurrency 1 4 16] [--requests 64] [--llm-latency 1.0] [--out results.json]
+"""
+import argparse, asyncio, json, time
+import numpy as np
+from src.llm import StubLLM
+from src.pipeline import RAGPipeline
+from src.server import RAGServer
+from src.utils.constants import OUT_PATH, BATCH_MAX_WAIT_MS
+from benchmarks._util import peak_rss_mb, write_results
+
+
+class _SlowStub(StubLLM):
+    def __init__(self, latency: float):
+        super().__init__()
+        self.latency = latency
+
+    def decompose_query(self, query):
+        time.sleep(self.latency)
+        return super().decompose_query(query)
+
+    def synthesize(self, query, sub_queries, rows):
+        time.sleep(self.latency)
+        return super().synthesize(query, sub_queries, rows)
+
+
+async def _post(port: int, question: str) -> float:
+    body = json.dumps({"question": question}).encode("utf-8")
+    t0 = time.perf_counter()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"POST /ask HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+    status = (await reader.readline()).decode("latin-1")
+    await reader.read()
+    writer.close()
+    if " 200 " not in status:
+        raise RuntimeError(f"request failed: {status.strip()}")
+    return time.perf_counter() - t0
+
+
+async def _load(port: int, questions, n_requests: int, concurrency: int):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with sem:
+            return await _post(port, questions[i % len(questions)])
+
+    t0 = time.perf_counter()
+    lat = await asyncio.gather(*[one(i) for i in range(n_requests)])
+    return time.perf_counter() - t0, lat
+
+
+async def _run(pipeline, questions, args, batching: bool):
+    rows = []
+    for c in args.concurrency:
+        server = await RAGServer(pipeline, port=0, workers=max(c, 1)).start()
+        before = {name: b.stats() for name, b in pipeline.batchers.items()}
+        wall, lat = await _load(server.port, questions, args.requests, c)
+        after = {name: b.stats() for name, b in pipeline.batchers.items()}
+        await server.stop()
+        lat_ms = np.asarray(lat) * 1000
+        row = {
+            "batching": batching,
+            "concurrency": c,
+            "requests": args.requests,
+            "throughput_rps": round(args.requests / wall, 3),
+            "latency_ms_p50": round(float(np.percentile(lat_ms, 50)), 1),
+            "latency_ms_p95": round(float(np.percentile(lat_ms, 95)), 1),
+        }
+        for name in after:
+            items = after[name]["items"] - before[name]["items"]
+            batches = after[name]["batches"] - before[name]["batches"]
+            row[f"{name}_mean_batch"] = round(items / batches, 2) if batches else 0.0
+        rows.append(row)
+        print(f"[BENCH] batching={batching} c={c}: {row['throughput_rps']} req/s, p50 {row['latency_ms_p50']}ms")
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--concurrency", nargs="*", type=int, default=[1, 4, 16])
+    ap.add_argument("--requests", type=int, default=64)
+    ap.add_argument("--llm-latency", type=float, default=1.0, help="Simulated seconds per LLM call.")
+    ap.add_argument("--batch-wait-ms", type=float, default=BATCH_MAX_WAIT_MS)
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+
+    with open(OUT_PATH, "r", encoding="utf-8") as f:
+        questions = [item["question"] for item in json.load(f)]
+
+    # No response caches, so every request does the full work.
+    pipeline = RAGPipeline(llm=_SlowStub(args.llm_latency), llm_cache_path=None, rerank_cache_path=None).load()
+    pipeline.llm = pipeline.llm.llm
+    pipeline.reranker.score_cache.entries.clear()
+    pipeline.reranker.score_cache.max_entries = 0
+
+    rows = asyncio.run(_run(pipeline, questions, args, batching=False))
+    pipeline.enable_batching(max_wait_ms=args.batch_wait_ms)
+    rows += asyncio.run(_run(pipeline, questions, args, batching=True))
+    pipeline.close()
+
+    write_results(args.out, {
+        "benchmark": "server",
+        "llm_latency_seconds": args.llm_latency,
+        "batch_wait_ms": args.batch_wait_ms,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "runs": rows,
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Vector backend latency and recall: Chroma (HNSW) vs. the in-process NumPy store.
+
+Every shipped filing is chunked and embedded once (through the embedding cache); the same
+vectors are then loaded into a temporary Chroma collection and into NumPy stores at each
+dtype. Queries are the sub-queries in chat_history.json with the `_build_where` filter that
+`_retrieve` would use. Recall@k is measured against exact float32 brute force.
+
+    python -m benchmarks.bench_vector_backend [--k 10] [--repeat 5] [--out results.json]
+"""
+import argparse, json, os, tempfile, time
+import numpy as np
+import chromadb
+from chromadb.config import Settings
+from src.embed_store import EmbedStore, chunk_id
+from src.numpy_store import NumpyCollection, VECTOR_DTYPES
+from src.planner import parse_sub_query
+from src.query_engine import _build_where
+from src.splitter import chunk_markdown_pages
+from src.utils.constants import OUT_PATH, DFEAULT_TOP_K, EMBED_CACHE_DIR
+from src.utils.filters import matches_where
+from benchmarks._util import shipped_docs, load_pages, timed, write_results
+
+
+def _corpus(store: EmbedStore):
+    ids, texts, metas = [], [], []
+    for doc_id in shipped_docs():
+        company, year = doc_id.split("_")
+        for i, c in enumerate(chunk_markdown_pages(load_pages(doc_id))):
+            ids.append(chunk_id(doc_id, i, c["text"]))
+            texts.append(c["text"])
+            metas.append({"doc_id": doc_id, "company": company, "year": year,
+                          "page_start": c["page_start"], "page_end": c["page_end"]})
+    embs = np.asarray(store._embed_passages(texts), dtype=np.float32)
+    return ids, texts, metas, embs
+
+
+def _workload():
+    with open(OUT_PATH, "r", encoding="utf-8") as f:
+        history = json.load(f)
+    work = []
+    for item in history:
+        for sq in item["response"].get("sub_queries", []):
+            company, _, year = parse_sub_query(sq)
+            work.append((sq, _build_where([company] if company else None, [year] if year else None)))
+    return work
+
+
+def _exact(embs, metas, ids, q, where, k):
+    rows = [i for i, m in enumerate(metas) if matches_where(m, where)]
+    sims = embs[rows] @ q
+    return [ids[rows[j]] for j in np.argsort(-sims)[:k]]
+
+
+def _bench(collection, q_embs, work, k, repeat):
+    latencies, results = [], []
+    for q, (_, where) in zip(q_embs, work):
+        res, t = timed(collection.query, query_embeddings=[q.tolist()], n_results=k,
+                       include=["documents", "metadatas", "distances"], where=where or None, repeat=repeat)
+        latencies.append(t)
+        results.append(res["ids"][0])
+    return latencies, results
+
+
+def _summary(name, latencies, results, exact, extra):
+    recall = [len(set(r) & set(e)) / max(len(e), 1) for r, e in zip(results, exact)]
+    lat = np.asarray(latencies) * 1000
+    out = {
+        "backend": name,
+        **extra,
+        "query_ms_p50": round(float(np.percentile(lat, 50)), 3),
+        "query_ms_p95": round(float(np.percentile(lat, 95)), 3),
+        "recall_at_k": round(float(np.mean(recall)), 4),
+    }
+    print(f"[BENCH] {name}: p50 {out['query_ms_p50']}ms, recall@k {out['recall_at_k']}")
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--k", type=int, default=DFEAULT_TOP_K)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_vectors_")
+    store = EmbedStore(persist_dir=os.path.join(tmp, "embedder"), embed_cache_dir=EMBED_CACHE_DIR, backend="numpy")
+    ids, texts, metas, embs = _corpus(store)
+    work = _workload()
+    q_embs = store._embed_queries([sq for sq, _ in work])
+    exact = [_exact(embs, metas, ids, q, where, args.k) for q, (_, where) in zip(q_embs, work)]
+
+    backends = []
+    chroma_dir = os.path.join(tmp, "chroma")
+    client = chromadb.PersistentClient(path=chroma_dir, settings=Settings(allow_reset=True))
+    col = client.get_or_create_collection("bench")
+    t0 = time.perf_counter()
+    for s in range(0, len(ids), 1000):
+        col.upsert(ids=ids[s:s + 1000], embeddings=embs[s:s + 1000].tolist(),
+                   documents=texts[s:s + 1000], metadatas=metas[s:s + 1000])
+    t_build = time.perf_counter() - t0
+    del col, client
+    t0 = time.perf_counter()
+    col = chromadb.PersistentClient(path=chroma_dir, settings=Settings(allow_reset=True)).get_collection("bench")
+    t_open = time.perf_counter() - t0
+    lat, res = _bench(col, q_embs, work, args.k, args.repeat)
+    backends.append(_summary("chroma", lat, res, exact,
+                             {"build_seconds": round(t_build, 3), "open_seconds": round(t_open, 3)}))
+
+    for dtype in VECTOR_DTYPES:
+        path = os.path.join(tmp, f"numpy_{dtype}")
+        t0 = time.perf_counter()
+        col = NumpyCollection(path, dtype=dtype)
+        col.upsert(ids, embs, texts, metas)
+        col.flush()
+        t_build = time.perf_counter() - t0
+        col, t_open = timed(NumpyCollection, path, dtype=dtype)
+        size = sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(path) for f in fs if f.startswith("vectors."))
+        lat, res = _bench(col, q_embs, work, args.k, args.repeat)
+        backends.append(_summary(f"numpy-{dtype}", lat, res, exact,
+                                 {"build_seconds": round(t_build, 3), "open_seconds": round(t_open, 3),
+                                  "vector_bytes": size}))
+
+    write_results(args.out, {
+        "benchmark": "vector_backend",
+        "chunks": len(ids),
+        "dim": int(embs.shape[1]),
+        "queries": len(work),
+        "k": args.k,
+        "backends": backends,
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -1,78 +1,132 @@
-import argparse, os, glob, json
-from dotenv import load_dotenv
-from src.utils.constants import PDF_DIR, OUT_PATH, PERSIST_DIR, ARTIFACTS_DIR, DFEAULT_TOP_K
-from huggingface_hub import login
-from src.pdf_ingest import persist_markdown
-from src.splitter import chunk_markdown_pages
-from src.embed_store import EmbedStore
-from src.query_engine import run_query
-from src.utils.parser import parse_company_year_from_filename
+import argparse, os, json, time
+from src.utils.constants import OUT_PATH, PERSIST_DIR, DFEAULT_TOP_K, INGEST_WORKERS, PDF_ENGINE, RERANK_PRECISION, RERANK_THREADS, VECTOR_BACKEND, VECTOR_DTYPE, EMBED_DIM, TRACE_ENABLED, SERVE_HOST, SERVE_PORT, SERVE_WORKERS, BATCH_MAX_WAIT_MS, QUERY_WORKERS, EVIDENCE_TOKEN_BUDGET, DEFAULT_EMBEDDING_MODEL, DEFAULT_RERANKER_MODEL
 
+# Heavy dependencies (torch, transformers, chromadb, pdfplumber, Gemini) are imported by the
+# stage that needs them (src/utils/lazy.py), so --help and the chat prompt come up immediately.
 
-load_dotenv()
-login(token=os.getenv("HUGGINGFACE_API_KEY"))
 
-
-def build_index():
-    store = EmbedStore(persist_dir=PERSIST_DIR)
-    pdfs = sorted(glob.glob(os.path.join(PDF_DIR, "*.pdf")))
-    if not pdfs:
-        print(f"No PDFs found under {PDF_DIR}. Please add 10-K PDFs first.")
+def hf_login_if_needed(models):
+    """Logs in to the Hugging Face Hub only if one of `models` is not in the local cache yet."""
+    from huggingface_hub import try_to_load_from_cache, login
+    missing = [m for m in models if not isinstance(try_to_load_from_cache(m, "config.json"), str)]
+    if not missing:
+        print("[HF] Models found in the local cache; skipping Hub login.")
         return
-    for pdf in pdfs:
-        print(f"[INGEST] {pdf}")
-        info = persist_markdown(pdf, ARTIFACTS_DIR)
-        pages = info["pages"]
-        company, year = info["company"], info["year"]
-        base = os.path.splitext(os.path.basename(pdf))[0]
-        doc_id = base
-        
-        chunks = chunk_markdown_pages(pages)
-        meta = {
-            "doc_id": doc_id,
-            "company": company,
-            "year": year,
-            "source_pdf": os.path.basename(pdf),
-        }
-        store.add_chunks(doc_id, chunks, meta)
-        print(f"[INDEXED] {base} -> {len(chunks)} chunks")
+    t0 = time.perf_counter()
+    login(token=os.getenv("HUGGINGFACE_API_KEY"))
+    print(f"[HF] Logged in for {', '.join(missing)} in {time.perf_counter() - t0:.2f}s")
+
 
+def stage_timeout(spec: str):
+    stage, _, seconds = spec.partition("=")
+    if not seconds:
+        raise argparse.ArgumentTypeError(f"expected STAGE=SECONDS, got {spec!r}")
+    return stage.strip(), None if seconds.strip().lower() == "none" else float(seconds)
 
-def ask(query: str, k: int = DFEAULT_TOP_K):
-    store = EmbedStore(persist_dir=PERSIST_DIR)
-    resp = run_query(query, store, k=k)
+
+def ask(pipeline: "RAGPipeline", query: str, k: int = DFEAULT_TOP_K):
+    resp = pipeline.ask(query, k=k)
     print(json.dumps(resp, indent=2, ensure_ascii=False))
     return resp
 
 
+def ask_streaming(pipeline: "RAGPipeline", query: str, k: int = DFEAULT_TOP_K):
+    resp = None
+    for event in pipeline.ask_stream(query, k=k):
+        if event["event"] == "sources":
+            print(json.dumps({"sub_queries": event["sub_queries"], "sources": event["sources"]},
+                             indent=2, ensure_ascii=False))
+            print("\nAnswer: ", end="", flush=True)
+        elif event["event"] == "token":
+            print(event["text"], end="", flush=True)
+        else:
+            resp = event["response"]
+            print(f"\n\nReasoning: {resp['reasoning']}")
+    return resp
+
+
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--build-index", action="store_true", help="Ingest PDFs, extract text+tables→markdown, chunk, embed, and index into Chroma.")
+    ap.add_argument("--force", action="store_true", help="With --build-index: re-index every filing even if its PDF hash is unchanged.")
+    ap.add_argument("--workers", type=int, default=INGEST_WORKERS, help="With --build-index: processes used for PDF extraction (several PDFs at once, or page ranges of a single PDF).")
+    ap.add_argument("--pdf-engine", choices=["pdfium", "pdfplumber"], default=PDF_ENGINE, help="With --build-index: pdfium extracts text fast and runs pdfplumber's table extraction only on pages with ruling lines; pdfplumber does everything, tables on every page. Switching re-indexes every filing.")
+    ap.add_argument("--rerank-precision", choices=["fp32", "bf16", "int8"], default=RERANK_PRECISION, help="Reranker precision: fp32, bf16 weights, or dynamic int8 quantization.")
+    ap.add_argument("--rerank-threads", type=int, default=RERANK_THREADS, help="Torch intra-op threads for the reranker.")
+    ap.add_argument("--vector-backend", choices=["chroma", "numpy"], default=VECTOR_BACKEND, help="Vector store: Chroma, or in-process memory-mapped NumPy matrices partitioned by company/year. Build and chat must use the same backend.")
+    ap.add_argument("--vector-dtype", choices=["float32", "float16", "int8"], default=VECTOR_DTYPE, help="With --vector-backend numpy: storage precision of the embedding matrices (int8 keeps a scale per vector).")
+    ap.add_argument("--embed-dim", type=int, choices=[768, 512, 256, 128], default=EMBED_DIM, help="Matryoshka-truncated embedding width for passages and queries. Build and chat must use the same value.")
+    ap.add_argument("--trace", action="store_true", default=TRACE_ENABLED, help="Record per-stage spans: adds `timings` to each response, appends traces to artifacts/traces.jsonl and writes Prometheus metrics to artifacts/metrics.prom.")
+    ap.add_argument("--serve", action="store_true", help="Serve questions over HTTP (POST /ask) instead of the interactive chat.")
+    ap.add_argument("--host", default=SERVE_HOST, help="With --serve: bind address.")
+    ap.add_argument("--port", type=int, default=SERVE_PORT, help="With --serve: port.")
+    ap.add_argument("--serve-workers", type=int, default=SERVE_WORKERS, help="With --serve: questions answered concurrently.")
+    ap.add_argument("--batch-wait-ms", type=float, default=BATCH_MAX_WAIT_MS, help="With --serve/--batch: how long embedding/rerank batches wait for concurrent requests.")
+    ap.add_argument("--batch", metavar="QUESTIONS_JSONL", help="Answer every question in a JSONL file ({\"question\": ..., \"id\": ...} or a string per line) instead of the interactive chat.")
+    ap.add_argument("--batch-out", metavar="ANSWERS_JSONL", help="With --batch: append-only output; questions already answered there are skipped (default: <questions>.answers.jsonl).")
+    ap.add_argument("--batch-workers", type=int, default=SERVE_WORKERS, help="With --batch: questions answered concurrently.")
+    ap.add_argument("--query-workers", type=int, default=QUERY_WORKERS, help="Threads that retrieve/rerank sub-queries concurrently and overlap them with LLM calls (0 = sequential).")
+    ap.add_argument("--stage-timeout", type=stage_timeout, action="append", default=[], metavar="STAGE=SECONDS", help="Per-stage timeout for decompose, retrieve, rerank or synthesize ('none' waits indefinitely). Repeatable.")
+    ap.add_argument("--evidence-budget", type=int, default=EVIDENCE_TOKEN_BUDGET, help="Approximate tokens of evidence text sent to synthesis; matching sentences/table rows are kept, overlap dropped (0 = whole chunks).")
+    ap.add_argument("--stream", action="store_true", help="Chat: print sources as soon as reranking finishes and stream the answer as it is generated.")
+    ap.add_argument("--no-warmup", action="store_true", help="Skip the dummy embed/rerank pass run after loading models.")
     args = ap.parse_args()
+    from dotenv import load_dotenv
+    load_dotenv()
 
     if args.build_index:
-        build_index()
+        from src.indexer import build_index
+        hf_login_if_needed([DEFAULT_EMBEDDING_MODEL])
+        build_index(force=args.force, workers=args.workers, backend=args.vector_backend, vector_dtype=args.vector_dtype,
+                    embed_dim=args.embed_dim, trace=args.trace, pdf_engine=args.pdf_engine)
     else:
-        print("\n--- Uniqus RAG CLI Chat ---")
-        print("Type your question and press Enter. Type 'exit' to quit.\n")
+        from src.pipeline import RAGPipeline
+        hf_login_if_needed([DEFAULT_EMBEDDING_MODEL, DEFAULT_RERANKER_MODEL])
+        pipeline = RAGPipeline(persist_dir=PERSIST_DIR, rerank_precision=args.rerank_precision,
+                               rerank_threads=args.rerank_threads, backend=args.vector_backend,
+                               vector_dtype=args.vector_dtype, embed_dim=args.embed_dim,
+                               trace=args.trace, query_workers=args.query_workers,
+                               stage_timeouts=dict(args.stage_timeout),
+                               evidence_budget=args.evidence_budget)
+
+        if args.batch:
+            from src.batch import run_batch
+            out_path = args.batch_out or os.path.splitext(args.batch)[0] + ".answers.jsonl"
+            pipeline.load(warmup=not args.no_warmup).enable_batching(max_wait_ms=args.batch_wait_ms)
+            try:
+                run_batch(pipeline, args.batch, out_path, workers=args.batch_workers)
+            finally:
+                pipeline.close()
+        elif args.serve:
+            from src.server import serve
+            pipeline.load(warmup=not args.no_warmup).enable_batching(max_wait_ms=args.batch_wait_ms)
+            serve(pipeline, host=args.host, port=args.port, workers=args.serve_workers)
+            pipeline.close()
+        else:
+            # Models load while the user types the first question; `ask` waits for them.
+            pipeline.load_in_background(warmup=not args.no_warmup)
+            print("\n--- Uniqus RAG CLI Chat ---")
+            print("Type your question and press Enter. Type 'exit' to quit.\n")
         
-        history = []
+            history = []
         
-        q_num = 1
-        while True:
-            user_q = input(f"Question {q_num}: ")
-            if user_q.strip().lower() in ["exit", "quit"]:
-                print("Exiting chat.")
-                break
-            print(f"\n{'='*60}\nQ{q_num}: {user_q}\n{'-'*60}")
-            try:
-                resp = ask(user_q)
-                history.append({"question": user_q, "response": resp})
-                print(f"{'='*60}\n")
-                q_num += 1
-            except Exception as e:
-                print(f"Error: {e}\n{'='*60}\n")
+            q_num = 1
+            while True:
+                user_q = input(f"Question {q_num}: ")
+                if user_q.strip().lower() in ["exit", "quit"]:
+                    print("Exiting chat.")
+                    break
+                print(f"\n{'='*60}\nQ{q_num}: {user_q}\n{'-'*60}")
+                try:
+                    resp = (ask_streaming if args.stream else ask)(pipeline, user_q)
+                    history.append({"question": user_q, "response": resp})
+                    print(f"{'='*60}\n")
+                    q_num += 1
+                except Exception as e:
+                    print(f"Error: {e}\n{'='*60}\n")
+
+            pipeline.close()
 
-        # Save history at the end of session
-        with open(OUT_PATH, "w", encoding="utf-8") as f:
-            json.dump(history, f, indent=2, ensure_ascii=False)
+            # Save history at the end of session
+            with open(OUT_PATH, "w", encoding="utf-8") as f:
+                json.dump(history, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,123 @@
+import os, json, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Any, Set
+from .pipeline import RAGPipeline
+from .utils.constants import SERVE_WORKERS, DFEAULT_TOP_K
+
+
+def read_questions(path: str) -> List[Dict[str, Any]]:
+    """Questions from a JSONL file: one {"question": ..., "id": ...} object (id optional) or one
+    JSON string per line. A question without an id is identified by its text."""
+    out = []
+    with open(path, "r", encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"question": item}
+            question = (item.get("question") or "").strip() if isinstance(item, dict) else ""
+            if not question:
+                raise ValueError(f"{path}:{n}: expected a question string or an object with 'question'")
+            out.append({"id": str(item.get("id") or question), "question": question,
+                        "k": int(item.get("k") or DFEAULT_TOP_K)})
+    return out
+
+
+def answered_ids(path: str) -> Set[str]:
+    """IDs already answered in an output file. Failed questions and a torn last line (from a crash
+    mid-write) don't count, so they are asked again."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "response" in rec:
+                done.add(rec["id"])
+    return done
+
+
+def run_batch(pipeline: RAGPipeline, questions_path: str, out_path: str,
+              workers: int = SERVE_WORKERS) -> Dict[str, Any]:
+    """Answers every question in `questions_path` not already answered in `out_path`.
+
+    `workers` questions run at once against the one loaded pipeline. Their query embeddings and
+    rerank pairs share forward passes (`RAGPipeline.enable_batching`). Each result is appended to
+    `out_path` as one JSON line, {"id", "question", "response" | "error", "seconds"}, and flushed
+    as soon as it finishes. On Ctrl-C, queued questions are dropped, and the ones in flight are
+    finished and written before returning; a crash loses at most the questions in flight.
+    Rerunning with the same output resumes where it stopped.
+    """
+    questions = read_questions(questions_path)
+    done = answered_ids(out_path)
+    todo, seen = [], set(done)
+    for q in questions:
+        if q["id"] not in seen:
+            seen.add(q["id"])
+            todo.append(q)
+    n_done = sum(q["id"] in done for q in questions)
+    print(f"[BATCH] {len(questions)} questions, {n_done} already answered, "
+          f"{len(questions) - n_done - len(todo)} duplicates, {len(todo)} to run with {workers} workers -> {out_path}")
+    if not todo:
+        return {"questions": len(questions), "answered": 0, "failed": 0, "interrupted": False, "seconds": 0.0}
+
+    pipeline.enable_batching()
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    if os.path.exists(out_path) and os.path.getsize(out_path):
+        with open(out_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            torn = f.read(1) != b"\n"
+        if torn:
+            # Start on a fresh line so the torn record doesn't swallow the next one.
+            with open(out_path, "a", encoding="utf-8") as f:
+                f.write("\n")
+    stats = {"answered": 0, "failed": 0, "interrupted": False}
+
+    def one(q: Dict[str, Any]) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        try:
+            rec = {"response": pipeline.ask(q["question"], k=q["k"])}
+        except Exception as e:
+            rec = {"error": f"{type(e).__name__}: {e}"}
+        return {"id": q["id"], "question": q["question"], **rec,
+                "seconds": round(time.perf_counter() - t0, 3)}
+
+    t_all = time.perf_counter()
+    with open(out_path, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-batch") as pool:
+        futures = [pool.submit(one, q) for q in todo]
+        written = set()
+
+        def write(fut):
+            rec = fut.result()
+            out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            out.flush()
+            written.add(fut)
+            stats["failed" if "error" in rec else "answered"] += 1
+
+        try:
+            for fut in as_completed(futures):
+                write(fut)
+                n = stats["answered"] + stats["failed"]
+                if n % 10 == 0 or n == len(todo):
+                    elapsed = time.perf_counter() - t_all
+                    print(f"[BATCH] {n}/{len(todo)} done ({stats['failed']} failed), {n / elapsed:.2f} q/s")
+        except KeyboardInterrupt:
+            for fut in futures:
+                fut.cancel()
+            stats["interrupted"] = True
+            print("\n[BATCH] Interrupted; waiting for questions in flight. Rerun with the same output to resume.")
+            # Questions that finished (or were running) when interrupted are still recorded.
+            for fut in futures:
+                if fut not in written and not fut.cancelled():
+                    write(fut)
+            print(f"[BATCH] {stats['answered'] + stats['failed']}/{len(todo)} written before stopping.")
+
+    seconds = time.perf_counter() - t_all
+    return {"questions": len(questions), **stats, "seconds": round(seconds, 3),
+            "questions_per_second": round(len(todo) / seconds, 3) if seconds else None}
@@ -0,0 +1,93 @@
+import time, queue, threading
+from concurrent.futures import Future
+from typing import Callable, List, Any, Dict
+
+
+class MicroBatcher:
+    """Coalesces concurrent calls to a batched function into single forward passes.
+
+    Callers on any thread `submit` a list of items and block for their results. A worker thread
+    takes the first waiting request, then keeps collecting requests for up to `max_wait_ms`
+    or until `max_batch` items are queued. It runs `fn` once on the concatenation and hands each
+    caller back its own slice. A request is never split across batches, so a batch can exceed
+    `max_batch` by at most one request. The model is only ever called from the worker thread.
+    """
+
+    def __init__(self, fn: Callable[[List[Any]], List[Any]], max_batch: int = 64,
+                 max_wait_ms: float = 10.0, name: str = "batcher"):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self.queue: "queue.Queue" = queue.Queue()
+        self.batches = self.items = self.requests = self.max_seen = 0
+        self._thread = threading.Thread(target=self._run, name=f"{name}-worker", daemon=True)
+        self._closed = False
+        self._thread.start()
+
+    def submit(self, items: List[Any]) -> List[Any]:
+        if not items:
+            return []
+        if self._closed:
+            raise RuntimeError(f"{self.name} is closed")
+        fut: Future = Future()
+        self.queue.put((list(items), fut))
+        return fut.result()
+
+    def _collect(self):
+        first = self.queue.get()
+        if first is None:
+            return None
+        batch, n = [first], len(first[0])
+        deadline = time.monotonic() + self.max_wait
+        while n < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                nxt = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if nxt is None:
+                # Close requested: finish this batch, then stop.
+                self.queue.put(None)
+                break
+            batch.append(nxt)
+            n += len(nxt[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            flat = [x for items, _ in batch for x in items]
+            try:
+                out = self.fn(flat)
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            self.batches += 1
+            self.requests += len(batch)
+            self.items += len(flat)
+            self.max_seen = max(self.max_seen, len(flat))
+            start = 0
+            for items, fut in batch:
+                fut.set_result(out[start:start + len(items)])
+                start += len(items)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self.queue.put(None)
+            self._thread.join(timeout=5)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "items": self.items,
+            "mean_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_batch": self.max_seen,
+        }
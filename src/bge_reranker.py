@@ -1,19 +1,121 @@
-from typing import List, Dict, Any
-import torch
-from transformers import AutoModelForSequenceClassification, AutoTokenizer
+from typing import List, Dict, Any, Tuple
+import time
+from .utils.constants import DEFAULT_RERANKER_MODEL, RERANK_PRECISION, RERANK_BATCH_SIZE, RERANK_THREADS
+from .utils.hashing import text_sha1
+from .utils.lazy import timed_import
+from .rerank_cache import RerankScoreCache, normalize_query
+
+PRECISIONS = ("fp32", "bf16", "int8")
+
 
 class BGEReranker:
-    def __init__(self, model_name: str = "BAAI/bge-reranker-large"):
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    """Cross-encoder reranker.
+    Pairs are tokenized unpadded, sorted by length and scored in micro-batches padded only to
+    the longest pair in the batch. `precision` selects fp32, bf16 weights, or dynamic int8
+    quantization of the Linear layers (CPU).
+    """
+
+    def __init__(self, model_name: str = DEFAULT_RERANKER_MODEL,
+                 precision: str = RERANK_PRECISION,
+                 batch_size: int = RERANK_BATCH_SIZE,
+                 num_threads: int | None = RERANK_THREADS,
+                 max_length: int = 512,
+                 score_cache: RerankScoreCache | None = None):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown reranker precision {precision!r}; expected one of {PRECISIONS}.")
+        torch = timed_import("torch")
+        transformers = timed_import("transformers")
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.model_name = model_name
+        self.precision = precision
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.score_cache = score_cache
+        # Optional MicroBatcher over `_score_pairs`, shared by concurrent requests.
+        self.batcher = None
+        t0 = time.perf_counter()
+        self.tokenizer = transformers.AutoTokenizer.from_pretrained(model_name)
+        self.model = transformers.AutoModelForSequenceClassification.from_pretrained(model_name)
         self.model.eval()
+        if precision == "bf16":
+            self.model = self.model.to(torch.bfloat16)
+        elif precision == "int8":
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        print(f"[RERANK] Loaded {model_name} ({precision}) in {time.perf_counter() - t0:.2f}s")
+
+    @property
+    def model_key(self) -> str:
+        return f"{self.model_name}:{self.precision}:{self.max_length}"
+
+    def score_pairs(self, pairs: List[Tuple[str, str]], stats: Dict[str, int] | None = None) -> List[float]:
+        """Cross-encoder scores. `stats`, if given, gets the pairs' token count under "tokens",
+        except when the pairs go through the shared batcher."""
+        if self.batcher is not None:
+            return self.batcher.submit(pairs)
+        return self._score_pairs(pairs, stats)
+
+    def _score_pairs(self, pairs: List[Tuple[str, str]], stats: Dict[str, int] | None = None) -> List[float]:
+        if not pairs:
+            return []
+        enc = self.tokenizer([q for q, _ in pairs], [t for _, t in pairs],
+                             truncation=True, max_length=self.max_length)
+        if stats is not None:
+            stats["tokens"] = sum(len(ids) for ids in enc["input_ids"])
+        order = sorted(range(len(pairs)), key=lambda i: len(enc["input_ids"][i]))
+        scores = [0.0] * len(pairs)
+        with timed_import("torch").inference_mode():
+            for b in range(0, len(order), self.batch_size):
+                idx = order[b:b + self.batch_size]
+                batch = self.tokenizer.pad({key: [enc[key][i] for i in idx] for key in enc.keys()},
+                                           return_tensors="pt")
+                logits = self.model(**batch, return_dict=True).logits.view(-1, ).float()
+                for i, s in zip(idx, logits.tolist()):
+                    scores[i] = s
+        return scores
+
+    def rerank_many(self, queries: List[str], chunk_lists: List[List[Dict[str, Any]]],
+                    top_k: int = 3, stats: Dict[str, int] | None = None) -> List[List[Dict[str, Any]]]:
+        """Reranks the candidates of several sub-queries together.
+        Pairs are deduplicated by (normalized query, chunk ID) across sub-queries, looked up in
+        the score cache, and only the remaining pairs go through the cross-encoder in one call.
+        `stats`, if given, receives this call's counts.
+        """
+        keyed = []
+        todo: Dict[Tuple[str, str], Tuple[str, str]] = {}
+        scores: Dict[Tuple[str, str], float] = {}
+        for query, chunks in zip(queries, chunk_lists):
+            nq = normalize_query(query)
+            keys = []
+            for chunk in chunks:
+                key = (nq, chunk.get("id") or text_sha1(chunk["text"]))
+                keys.append(key)
+                if key in scores or key in todo:
+                    continue
+                cached = self.score_cache.get(key) if self.score_cache is not None else None
+                if cached is None:
+                    todo[key] = (query, chunk["text"])
+                else:
+                    scores[key] = cached
+            keyed.append(keys)
+
+        n_cached = len(scores)
+        call_stats: Dict[str, int] = {}
+        for key, score in zip(todo, self.score_pairs(list(todo.values()), call_stats)):
+            scores[key] = score
+            if self.score_cache is not None:
+                self.score_cache.put(key, score)
+        if stats is not None:
+            stats.update(pairs=sum(len(keys) for keys in keyed), unique_pairs=len(scores),
+                         cache_hits=n_cached, scored=len(todo), **call_stats)
+
+        out = []
+        for chunks, keys in zip(chunk_lists, keyed):
+            for chunk, key in zip(chunks, keys):
+                chunk["rerank_score"] = float(scores[key])
+            reranked = sorted(chunks, key=lambda x: x["rerank_score"], reverse=True)
+            out.append(reranked[:top_k])
+        return out
 
     def rerank(self, query: str, chunks: List[Dict[str, Any]], top_k: int = 3) -> List[Dict[str, Any]]:
-        pairs = [[query, chunk["text"]] for chunk in chunks]
-        with torch.no_grad():
-            inputs = self.tokenizer(pairs, padding=True, truncation=True, return_tensors='pt', max_length=512)
-            scores = self.model(**inputs, return_dict=True).logits.view(-1, ).float()
-        for chunk, score in zip(chunks, scores):
-            chunk["rerank_score"] = float(score)
-        reranked = sorted(chunks, key=lambda x: x["rerank_score"], reverse=True)
-        return reranked[:top_k]
+        return self.rerank_many([query], [chunks], top_k=top_k)[0]
@@ -0,0 +1,122 @@
+import os, re, json, math, threading
+from collections import Counter, defaultdict
+from typing import List, Dict, Any, Tuple
+from .utils.filters import matches_where
+from .utils.constants import BM25_INDEX_PATH
+
+# Bump when tokenization changes, so build_index rebuilds the lexical index.
+BM25_VERSION = 1
+
+_TOKEN = re.compile(r"\d[\d,]*(?:\.\d+)?|[a-z][a-z0-9&'\-]*")
+_STOPWORDS = {"the", "a", "an", "of", "and", "or", "in", "on", "for", "to", "by", "with", "as", "at", "is",
+              "was", "were", "are", "be", "from", "that", "this", "its", "our", "we", "which", "what", "how"}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words plus numbers with thousands separators removed ('$26,974' -> '26974')."""
+    out = []
+    for tok in _TOKEN.findall(text.lower()):
+        if tok[0].isdigit():
+            tok = tok.replace(",", "").rstrip(".")
+        elif tok in _STOPWORDS:
+            continue
+        out.append(tok)
+    return out
+
+
+def reciprocal_rank_fusion(ranked_lists: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """RRF: score(id) = sum over lists of 1 / (k + rank). Returns ids best-first."""
+    scores: Dict[str, float] = defaultdict(float)
+    for ranked in ranked_lists:
+        for rank, _id in enumerate(ranked, start=1):
+            scores[_id] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda x: x[1], reverse=True)
+
+
+class BM25Index:
+    """Okapi BM25 over chunk texts, stored next to Chroma.
+    Term frequencies are persisted per document so filings can be replaced incrementally;
+    postings and corpus statistics are rebuilt in memory on the first search after a change.
+    """
+
+    def __init__(self, path: str = BM25_INDEX_PATH, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1, self.b = k1, b
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == BM25_VERSION:
+                self.docs = data.get("docs", {})
+        self._dirty = True
+        self._lock = threading.Lock()
+
+    def _build(self):
+        # Postings are rebuilt lazily on the next search, so bulk builds stay linear.
+        with self._lock:
+            if self._dirty:
+                self._rebuild()
+                self._dirty = False
+
+    def _rebuild(self):
+        self.ids: List[str] = []
+        self.metas: List[Dict[str, Any]] = []
+        self.lens: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for doc in self.docs.values():
+            for _id, meta, tf, n in zip(doc["ids"], doc["metas"], doc["tfs"], doc["lens"]):
+                row = len(self.ids)
+                self.ids.append(_id)
+                self.metas.append(meta)
+                self.lens.append(n)
+                for term, c in tf.items():
+                    self.postings[term].append((row, c))
+        self.avg_len = (sum(self.lens) / len(self.lens)) if self.lens else 0.0
+
+    def add_doc(self, doc_id: str, ids: List[str], texts: List[str], metas: List[Dict[str, Any]]):
+        self.docs.pop(doc_id, None)
+        self.append_doc(doc_id, ids, texts, metas)
+
+    def append_doc(self, doc_id: str, ids: List[str], texts: List[str], metas: List[Dict[str, Any]]):
+        """Adds chunks to a document (created if missing), so a filing can be indexed batch by batch."""
+        doc = self.docs.setdefault(doc_id, {"ids": [], "metas": [], "tfs": [], "lens": []})
+        toks = [tokenize(t) for t in texts]
+        doc["ids"].extend(ids)
+        doc["metas"].extend(metas)
+        doc["tfs"].extend(dict(Counter(t)) for t in toks)
+        doc["lens"].extend(len(t) for t in toks)
+        self._dirty = True
+
+    def delete_doc(self, doc_id: str):
+        if self.docs.pop(doc_id, None) is not None:
+            self._dirty = True
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": BM25_VERSION, "docs": self.docs}, f)
+        os.replace(tmp, self.path)
+
+    def search(self, query: str, k: int = 10, where: dict | None = None) -> List[Tuple[str, float]]:
+        self._build()
+        n = len(self.ids)
+        if not n:
+            return []
+        scores: Dict[int, float] = defaultdict(float)
+        allowed: Dict[int, bool] = {}
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for row, tf in posting:
+                ok = allowed.get(row)
+                if ok is None:
+                    ok = allowed[row] = matches_where(self.metas[row], where)
+                if not ok:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.lens[row] / (self.avg_len or 1.0))
+                scores[row] += idf * tf * (self.k1 + 1) / (tf + norm)
+        top = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:k]
+        return [(self.ids[row], score) for row, score in top]
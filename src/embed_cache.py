@@ -0,0 +1,136 @@
+import os, json, hashlib, heapq
+from typing import List, Dict, Tuple
+import numpy as np
+from .utils.constants import EMBED_CACHE_DIR, EMBED_CACHE_MAX_ENTRIES
+
+# A full cache evicts at least 1/EVICT_BATCH_FRACTION of its entries at a time.
+EVICT_BATCH_FRACTION = 16
+
+
+class EmbeddingCache:
+    """Persistent embedding cache keyed by sha1(model_name, prefix, text).
+    Vectors live in a memory-mapped float32 matrix (`vectors.f32`) that grows on demand
+    up to `max_entries` rows; `index.json` maps keys to rows and tracks recency for LRU eviction.
+    """
+
+    def __init__(self, dim: int, cache_dir: str = EMBED_CACHE_DIR, max_entries: int = EMBED_CACHE_MAX_ENTRIES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.dim = dim
+        self.max_entries = max_entries
+        self.vectors_path = os.path.join(cache_dir, "vectors.f32")
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.hits = self.misses = self.evictions = 0
+
+        self.slots: Dict[str, int] = {}
+        self.last_used: Dict[str, int] = {}
+        self.tick = 0
+        self.capacity = 0
+        if os.path.exists(self.index_path) and os.path.exists(self.vectors_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                idx = json.load(f)
+            if idx.get("dim") == dim:
+                self.capacity = idx["capacity"]
+                self.tick = idx["tick"]
+                for key, (slot, used) in idx["entries"].items():
+                    self.slots[key] = slot
+                    self.last_used[key] = used
+        if not self.capacity:
+            # Missing or incompatible cache: start over.
+            self.slots, self.last_used, self.tick = {}, {}, 0
+            open(self.vectors_path, "wb").close()
+        self.free = sorted(set(range(self.capacity)) - set(self.slots.values()), reverse=True)
+        self.vectors = self._open(self.capacity)
+
+    @staticmethod
+    def key(model_name: str, prefix: str, text: str) -> str:
+        h = hashlib.sha1()
+        for part in (model_name, prefix, text):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _open(self, rows: int):
+        if rows == 0:
+            return None
+        return np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(rows, self.dim))
+
+    def _grow(self, needed: int):
+        new_cap = min(self.max_entries, max(needed, self.capacity * 2, 1024))
+        if new_cap <= self.capacity:
+            return
+        if self.vectors is not None:
+            self.vectors.flush()
+        with open(self.vectors_path, "r+b") as f:
+            f.truncate(new_cap * self.dim * 4)
+        self.free = list(range(new_cap - 1, self.capacity - 1, -1)) + self.free
+        self.capacity = new_cap
+        self.vectors = self._open(new_cap)
+
+    def _evict(self, n: int):
+        # Freed slots are overwritten right away, so the on-disk index must stop pointing at them
+        # first, or a crash before the next flush would map keys to other texts' vectors.
+        # Evicting in bulk keeps that index rewrite rare.
+        n = max(n, self.max_entries // EVICT_BATCH_FRACTION)
+        for key in heapq.nsmallest(n, self.last_used, key=self.last_used.get):
+            self.free.append(self.slots.pop(key))
+            del self.last_used[key]
+            self.evictions += 1
+        self.flush()
+
+    def get_many(self, keys: List[str]) -> Tuple[Dict[int, np.ndarray], List[int]]:
+        """Returns ({position: row view into the memmap}, [positions of misses]).
+        Views are only valid until the next `put_many`, which may evict and overwrite rows."""
+        self.tick += 1
+        hits, misses = {}, []
+        for pos, key in enumerate(keys):
+            slot = self.slots.get(key)
+            if slot is None:
+                misses.append(pos)
+            else:
+                hits[pos] = self.vectors[slot]
+                self.last_used[key] = self.tick
+        self.hits += len(hits)
+        self.misses += len(misses)
+        return hits, misses
+
+    def put_many(self, keys: List[str], vectors: np.ndarray):
+        self.tick += 1
+        new = {}
+        for key, vec in zip(keys, vectors):
+            if key not in self.slots:
+                new[key] = vec
+        # Only the last max_entries vectors can fit.
+        items = list(new.items())[-self.max_entries:]
+        if len(self.free) < len(items):
+            self._grow(len(self.slots) + len(items))
+        if len(self.free) < len(items):
+            self._evict(len(items) - len(self.free))
+        for key, vec in items:
+            slot = self.free.pop()
+            self.vectors[slot] = vec
+            self.slots[key] = slot
+            self.last_used[key] = self.tick
+
+    def flush(self):
+        if self.vectors is not None:
+            self.vectors.flush()
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "dim": self.dim,
+                "capacity": self.capacity,
+                "tick": self.tick,
+                "entries": {k: [s, self.last_used[k]] for k, s in self.slots.items()},
+            }, f)
+        os.replace(tmp, self.index_path)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self.slots),
+            "capacity": self.capacity,
+        }
@@ -1,54 +1,192 @@
-from typing import List, Dict, Any, Tuple
-import chromadb, os, uuid
-from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
+from typing import List, Dict, Any, Tuple, Iterable, Iterator
+import os, json, time
+from itertools import islice
 import numpy as np
-from .utils.constants import DEFAULT_EMBEDDING_MODEL
+from .utils.constants import (DEFAULT_EMBEDDING_MODEL, COLLECTION_NAME, VECTOR_BACKEND, VECTOR_DTYPE, EMBED_DIM,
+                              INGEST_EMBED_BATCH)
+from .utils.hashing import text_sha1
+from .utils.lazy import timed_import
+from .embed_cache import EmbeddingCache
+from .bm25_index import BM25Index, reciprocal_rank_fusion
+from .numpy_store import NumpyCollection
+from .tracing import span
+
+VECTOR_BACKENDS = ("chroma", "numpy")
+
+
+def chunk_id(doc_id: str, idx: int, text: str) -> str:
+    """Deterministic chunk ID: same doc, position and text always map to the same vector."""
+    return f"{doc_id}:{idx}:{text_sha1(text)[:12]}"
 
 
 class EmbedStore:
     def __init__(self, persist_dir: str = "chroma_db",
-                 collection: str = "uniqus_rag",
-                 model_name: str = DEFAULT_EMBEDDING_MODEL):
+                 collection: str = COLLECTION_NAME,
+                 model_name: str = DEFAULT_EMBEDDING_MODEL,
+                 embed_cache_dir: str | None = None,
+                 lexical_path: str | None = None,
+                 backend: str = VECTOR_BACKEND,
+                 vector_dtype: str = VECTOR_DTYPE,
+                 embed_dim: int | None = EMBED_DIM):
+        if backend not in VECTOR_BACKENDS:
+            raise ValueError(f"backend must be one of {VECTOR_BACKENDS}, got {backend!r}")
         os.makedirs(persist_dir, exist_ok=True)
-        self.client = chromadb.PersistentClient(path=persist_dir, settings=Settings(allow_reset=True))
-        self.collection = self.client.get_or_create_collection(collection)
+        self.backend = backend
+        self.collection_name = collection
+        if backend == "numpy":
+            # Same collection API, backed by memory-mapped matrices under <persist_dir>/numpy/<collection>.
+            self.client = None
+            self.collection = NumpyCollection(os.path.join(persist_dir, "numpy", collection), dtype=vector_dtype)
+        else:
+            chromadb = timed_import("chromadb")
+            settings = timed_import("chromadb.config").Settings(allow_reset=True)
+            self.client = chromadb.PersistentClient(path=persist_dir, settings=settings)
+            self.collection = self.client.get_or_create_collection(collection)
+        SentenceTransformer = timed_import("sentence_transformers").SentenceTransformer
+        t0 = time.perf_counter()
         self.model = SentenceTransformer(model_name, trust_remote_code=True)
+        print(f"[EMBED] Loaded {model_name} in {time.perf_counter() - t0:.2f}s")
         self.model_name = model_name
+        full_dim = self.model.get_sentence_embedding_dimension()
+        if embed_dim is not None and not 0 < embed_dim <= full_dim:
+            raise ValueError(f"embed_dim must be in 1..{full_dim}, got {embed_dim}")
+        # Matryoshka truncation: the leading `dim` components, renormalized, for passages and queries alike.
+        self.dim = embed_dim or full_dim
+        self.embed_cache = None
+        if embed_cache_dir:
+            # Cached at full width, so changing `embed_dim` needs no re-encoding.
+            self.embed_cache = EmbeddingCache(full_dim, cache_dir=embed_cache_dir)
+        # Optional BM25 index kept in step with the collection (see hybrid_query_many).
+        self.lexical = BM25Index(lexical_path) if lexical_path else None
+        # Optional MicroBatcher shared by concurrent requests (see RAGPipeline.enable_batching).
+        self.query_batcher = None
+
+    def reset_collection(self):
+        if self.client is None:
+            self.collection.reset()
+            return
+        self.client.delete_collection(self.collection_name)
+        self.collection = self.client.get_or_create_collection(self.collection_name)
+
+    def doc_chunk_ids(self, doc_id: str) -> List[str]:
+        res = self.collection.get(where={"doc_id": doc_id}, include=[])
+        return list(res.get("ids") or [])
+
+    def delete_doc(self, doc_id: str) -> int:
+        ids = self.doc_chunk_ids(doc_id)
+        if ids:
+            self.collection.delete(ids=ids)
+        if self.lexical is not None:
+            self.lexical.delete_doc(doc_id)
+        self.flush()
+        return len(ids)
+
+    def flush(self):
+        """Persists pending vector store writes; the NumPy backend batches them per document."""
+        if self.client is None:
+            self.collection.flush()
+
+    def _truncate(self, embs: np.ndarray) -> np.ndarray:
+        if embs.shape[1] == self.dim:
+            return embs
+        embs = embs[:, :self.dim]
+        return embs / np.maximum(np.linalg.norm(embs, axis=1, keepdims=True), 1e-12)
 
     def _embed_passages(self, texts: List[str]) -> List[List[float]]:
         # BGE trick: prefix with 'passage: '
-        prefixed = [f"passage: {t}" for t in texts]
-        embs = self.model.encode(prefixed, normalize_embeddings=True, convert_to_numpy=True, batch_size=32)
-        return embs.astype(np.float32).tolist()
+        prefix = "passage: "
+        prefixed = [f"{prefix}{t}" for t in texts]
+        if self.embed_cache is None:
+            with span("embed_passages", chunks=len(texts)):
+                embs = self.model.encode(prefixed, normalize_embeddings=True, convert_to_numpy=True, batch_size=32)
+            return self._truncate(embs.astype(np.float32)).tolist()
+
+        # Only cache misses go through the model; hits are read straight from the memmap.
+        keys = [EmbeddingCache.key(self.model_name, prefix, t) for t in texts]
+        hits, misses = self.embed_cache.get_many(keys)
+        out = np.empty((len(texts), self.embed_cache.dim), dtype=np.float32)
+        for pos, row in hits.items():
+            out[pos] = row
+        with span("embed_passages", chunks=len(misses), cache_hits=len(hits)):
+            if misses:
+                embs = self.model.encode([prefixed[i] for i in misses], normalize_embeddings=True,
+                                         convert_to_numpy=True, batch_size=32).astype(np.float32)
+        if misses:
+            out[misses] = embs
+            self.embed_cache.put_many([keys[i] for i in misses], embs)
+        return self._truncate(out).tolist()
+
+    def _embed_queries(self, qs: List[str]) -> np.ndarray:
+        prefixed = [f"query: {q}" for q in qs]
+        with span("embed_query", queries=len(qs), batched=self.query_batcher is not None):
+            if self.query_batcher is not None:
+                embs = np.stack(self.query_batcher.submit(prefixed))
+            else:
+                embs = self._encode_queries(prefixed)
+        return self._truncate(embs.astype(np.float32))
+
+    def _encode_queries(self, prefixed: List[str]) -> np.ndarray:
+        return self.model.encode(prefixed, normalize_embeddings=True, convert_to_numpy=True, batch_size=32)
 
     def _embed_query(self, q: str) -> List[float]:
-        q = f"query: {q}"
-        emb = self.model.encode([q], normalize_embeddings=True, convert_to_numpy=True)[0]
-        return emb.astype(np.float32).tolist()
+        return self._embed_queries([q])[0].tolist()
+
+    def add_chunk_stream(self, doc_id: str, chunks: Iterable[Dict[str, Any]], metadata_base: Dict[str, Any],
+                         batch_size: int = INGEST_EMBED_BATCH) -> Iterator[Tuple[Dict[str, Any], str]]:
+        """Upserts the chunks of one document under stable IDs, `batch_size` chunks at a time, and
+        yields (chunk, id) for each once its batch is stored. `chunks` may be a generator, so only
+        one batch of texts and embeddings is in memory. Previously indexed chunks of the document
+        that are no longer produced are dropped when the stream is exhausted.
+        IDs embed the text hash, so chunks already present are not re-embedded."""
+        existing = set(self.doc_chunk_ids(doc_id))
+        produced = set()
+        if self.lexical is not None:
+            self.lexical.delete_doc(doc_id)
+        chunks = iter(chunks)
+        n = 0
+        while True:
+            batch = list(islice(chunks, batch_size))
+            if not batch:
+                break
+            texts = [c["text"] for c in batch]
+            ids = [chunk_id(doc_id, n + i, t) for i, t in enumerate(texts)]
+            n += len(batch)
+            produced.update(ids)
+            metas = []
+            for c in batch:
+                meta = metadata_base.copy()
+                meta.update({
+                    "page_start": c.get("page_start"),
+                    "page_end": c.get("page_end"),
+                })
+                metas.append(meta)
+            kept = [i for i, _id in enumerate(ids) if _id in existing]
+            new = [i for i, _id in enumerate(ids) if _id not in existing]
+            if kept:
+                self.collection.update(ids=[ids[i] for i in kept], metadatas=[metas[i] for i in kept])
+            if new:
+                embs = self._embed_passages([texts[i] for i in new])
+                self.collection.upsert(ids=[ids[i] for i in new], embeddings=embs,
+                                       documents=[texts[i] for i in new], metadatas=[metas[i] for i in new])
+            if self.lexical is not None:
+                self.lexical.append_doc(doc_id, ids, texts, metas)
+            yield from zip(batch, ids)
+        stale = existing - produced
+        if stale:
+            self.collection.delete(ids=list(stale))
+        self.flush()
 
     def add_chunks(self, doc_id: str, chunks: List[Dict[str, Any]], metadata_base: Dict[str, Any]):
-        texts = [c["text"] for c in chunks]
-        embs = self._embed_passages(texts)
-        ids = [f"{doc_id}:{i}:{uuid.uuid4().hex[:8]}" for i in range(len(texts))]
-        metas = []
-        for c in chunks:
-            meta = metadata_base.copy()
-            meta.update({
-                "page_start": c.get("page_start"),
-                "page_end": c.get("page_end"),
-            })
-            metas.append(meta)
-        self.collection.add(ids=ids, embeddings=embs, documents=texts, metadatas=metas)
+        """Upserts the chunks of one document and drops its stale ones; see `add_chunk_stream`."""
+        return [_id for _, _id in self.add_chunk_stream(doc_id, chunks, metadata_base)]
 
-    def query(self, q: str, k: int = 10, where: dict | None = None) -> List[Dict[str, Any]]:
-        emb = self._embed_query(q)
-        res = self.collection.query(query_embeddings=[emb], n_results=k, include=["documents", "metadatas", "distances"], where=where or {})
+    @staticmethod
+    def _result_rows(res: Dict[str, Any], j: int) -> List[Dict[str, Any]]:
         out = []
-        docs = res.get("documents", [[]])[0]
-        metas = res.get("metadatas", [[]])[0]
-        dists = res.get("distances", [[]])[0]
-        ids = res.get("ids", [[]])[0] if "ids" in res else [None] * len(docs)
+        docs = res.get("documents", [[]])[j]
+        metas = res.get("metadatas", [[]])[j]
+        dists = res.get("distances", [[]])[j]
+        ids = res.get("ids", [[]])[j] if "ids" in res else [None] * len(docs)
 
         for doc, meta, dist, _id in zip(docs, metas, dists, ids):
             r = {"text": doc, "score": float(dist)}
@@ -59,3 +197,76 @@ class EmbedStore:
 
             out.append(r)
         return out
+
+    def query_many(self, queries: List[str], k: int = 10,
+                   wheres: List[dict | None] | None = None) -> List[List[Dict[str, Any]]]:
+        """Batched retrieval: every query is embedded in one forward pass, and queries sharing
+        a `where` filter go to Chroma as one multi-embedding `collection.query`.
+        Returns one hit list per query, in input order."""
+        if not queries:
+            return []
+        wheres = wheres or [None] * len(queries)
+        embs = self._embed_queries(queries)
+
+        groups: Dict[str, List[int]] = {}
+        for i, where in enumerate(wheres):
+            groups.setdefault(json.dumps(where, sort_keys=True), []).append(i)
+
+        out: List[List[Dict[str, Any]]] = [[] for _ in queries]
+        for idxs in groups.values():
+            with span("vector_query", queries=len(idxs), backend=self.backend) as sp:
+                res = self.collection.query(query_embeddings=[embs[i].tolist() for i in idxs], n_results=k,
+                                            include=["documents", "metadatas", "distances"], where=wheres[idxs[0]] or {})
+                sp.set(candidates=sum(len(ids) for ids in res.get("ids") or []))
+            for j, i in enumerate(idxs):
+                out[i] = self._result_rows(res, j)
+        return out
+
+    def hybrid_query_many(self, queries: List[str], k: int = 10,
+                          wheres: List[dict | None] | None = None,
+                          fetch_k: int = 10) -> List[List[Dict[str, Any]]]:
+        """Dense (`query_many`) and BM25 candidates, `fetch_k` of each, fused by reciprocal rank.
+        Returns the top `k` fused hits per query; each hit carries `rrf_score`."""
+        wheres = wheres or [None] * len(queries)
+        dense = self.query_many(queries, fetch_k, wheres=wheres)
+        if self.lexical is None:
+            return [hits[:k] for hits in dense]
+
+        fused_per_q, missing = [], set()
+        for q, where, hits in zip(queries, wheres, dense):
+            by_id = {h["id"]: h for h in hits}
+            with span("lexical_search", queries=1) as sp:
+                lex = [_id for _id, _ in self.lexical.search(q, fetch_k, where=where)]
+                sp.set(candidates=len(lex))
+            fused = reciprocal_rank_fusion([[h["id"] for h in hits], lex])[:k]
+            missing.update(_id for _id, _ in fused if _id not in by_id)
+            fused_per_q.append((by_id, fused))
+
+        # Lexical-only hits have no row from Chroma yet.
+        with span("fetch_chunks", chunks=len(missing)):
+            extra = self.get_chunks(sorted(missing))
+        out = []
+        for by_id, fused in fused_per_q:
+            rows = []
+            for _id, rrf in fused:
+                row = by_id.get(_id) or extra.get(_id)
+                if row is None:
+                    continue
+                rows.append({**row, "rrf_score": rrf})
+            out.append(rows)
+        return out
+
+    def get_chunks(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Chunks by ID, in the same row shape as `query` results (without a score)."""
+        if not ids:
+            return {}
+        res = self.collection.get(ids=list(ids), include=["documents", "metadatas"])
+        out = {}
+        for _id, doc, meta in zip(res.get("ids") or [], res.get("documents") or [], res.get("metadatas") or []):
+            r = {"text": doc, "id": _id}
+            r.update(meta or {})
+            out[_id] = r
+        return out
+
+    def query(self, q: str, k: int = 10, where: dict | None = None) -> List[Dict[str, Any]]:
+        return self.query_many([q], k, [where])[0]
@@ -0,0 +1,147 @@
+import re, math
+from typing import Dict, List, Any, Tuple
+from .bm25_index import tokenize
+from .planner import METRIC_SYNONYMS
+from .utils.parser import COMPANY_ALIASES, METRIC_PATTERNS
+from .utils.constants import EVIDENCE_TOKEN_BUDGET, EVIDENCE_WINDOW
+
+CHARS_PER_TOKEN = 4  # rough Gemini tokenizer ratio for English filings text
+GAP = " … "
+
+_SENTENCE_END = re.compile(r"(?<=[.!?;])\s+(?=[A-Z$(•\d])")
+_EMPTY_CELLS = re.compile(r"(?:\|\s*)+\|")
+_COMPANY_WORDS = {w for alias in COMPANY_ALIASES for w in tokenize(alias)}
+
+
+def approx_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _segments(text: str) -> List[Tuple[str, bool]]:
+    """(segment, is_table_row) in reading order. Prose is re-joined across the PDF's hard line
+    wraps and split into sentences; markdown table rows are one segment each, without their
+    empty cells. Separator and all-empty rows are dropped."""
+    out: List[Tuple[str, bool]] = []
+    para: List[str] = []
+
+    def flush():
+        if para:
+            out.extend((s, False) for s in _SENTENCE_END.split(" ".join(para)) if s.strip())
+            para.clear()
+
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("|"):
+            flush()
+            row = _EMPTY_CELLS.sub("|", line)
+            if row.strip("|-: "):
+                out.append((row, True))
+        elif not line or line.startswith("#"):
+            flush()
+            if line:
+                out.append((line, False))
+        else:
+            para.append(line)
+    flush()
+    return out
+
+
+def _query_terms(sub_query: str, metric_key: str | None) -> Tuple[set, set, List[str]]:
+    """(content terms, year terms, metric phrases) of a sub-query; company names are left out
+    because every chunk of a filing is already filtered to its company."""
+    terms, years = set(), set()
+    for tok in tokenize(sub_query or ""):
+        if tok in _COMPANY_WORDS:
+            continue
+        (years if re.fullmatch(r"(?:19|20)\d{2}", tok) else terms).add(tok)
+    phrases = METRIC_SYNONYMS.get(metric_key, [metric_key]) if metric_key else []
+    return terms, years, phrases
+
+
+def _score(segment: str, terms: set, years: set, phrases: List[str], pattern: str | None) -> float:
+    toks = set(tokenize(segment))
+    low = segment.lower()
+    score = len(terms & toks) + 0.5 * len(years & toks)
+    if any(p in low for p in phrases):
+        score += 1
+    if pattern and re.search(pattern, segment, flags=re.I):
+        score += 2
+    return score
+
+
+def pack_evidence(rows: List[Dict[str, Any]], budget: int = EVIDENCE_TOKEN_BUDGET,
+                  window: int = EVIDENCE_WINDOW) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """Shrinks the evidence excerpts sent to `synthesize` to at most `budget` tokens (approximate).
+
+    Each excerpt is cut into sentences and table rows. Segments matching the row's sub-query
+    (metric phrase or value pattern, query terms, years) are kept together with `window`
+    neighbors on each side, plus the header row of any table they belong to. A segment already
+    kept for another row (the overlap between consecutive chunks, or a chunk retrieved for two
+    sub-queries) is not repeated. When the selection exceeds the budget, segments are admitted
+    by match score, then by rerank position within their sub-query, so every sub-query's best
+    evidence gets in before anyone's second-best. Rows left without text are dropped unless
+    they carry an extracted value. Returns the packed rows (shallow copies) and token counts.
+    """
+    tokens_before = sum(approx_tokens(r.get("excerpt") or "") for r in rows)
+    rank: Dict[str, int] = {}
+    candidates = []  # (priority, rank, row index, segment index)
+    segs_per_row: List[List[Tuple[str, bool]]] = []
+    for i, r in enumerate(rows):
+        segs = _segments(r.get("excerpt") or "")
+        segs_per_row.append(segs)
+        sq = r.get("sub_query") or ""
+        pos = rank[sq] = rank.get(sq, -1) + 1
+        terms, years, phrases = _query_terms(sq, r.get("metric_key"))
+        pattern = next((p for key, p, _ in METRIC_PATTERNS if key == r.get("metric_key")), None)
+        scores = [_score(s, terms, years, phrases, pattern) for s, _ in segs]
+        # At least one content term (or the metric), not just a year.
+        need = 1 if terms or phrases else 0.5
+        priority = [0.0] * len(segs)
+        for j, sc in enumerate(scores):
+            if sc < need:
+                continue
+            priority[j] = max(priority[j], sc)
+            for n in range(max(0, j - window), min(len(segs), j + window + 1)):
+                priority[n] = max(priority[n], 0.5)
+            if segs[j][1]:
+                # The first row of the table block is its header.
+                h = j
+                while h > 0 and segs[h - 1][1]:
+                    h -= 1
+                priority[h] = max(priority[h], 0.5)
+        if not any(priority):
+            # Nothing matched: the reranker still ranked it, so keep its opening.
+            for n in range(min(len(segs), 2 * window + 1)):
+                priority[n] = 0.25
+        candidates.extend((p, pos, i, j) for j, p in enumerate(priority) if p > 0)
+
+    candidates.sort(key=lambda c: (-c[0], c[1], c[2], c[3]))
+    seen, kept, used = set(), [set() for _ in rows], 0
+    for _, _, i, j in candidates:
+        seg = segs_per_row[i][j][0]
+        key = " ".join(seg.lower().split())
+        if key in seen:
+            continue
+        cost = approx_tokens(seg) + 1
+        if budget and used + cost > budget:
+            continue
+        seen.add(key)
+        kept[i].add(j)
+        used += cost
+
+    packed = []
+    for i, r in enumerate(rows):
+        parts, prev, prev_table = [], None, False
+        for j in sorted(kept[i]):
+            seg, is_table = segs_per_row[i][j]
+            if prev is not None:
+                parts.append(GAP if j != prev + 1 else ("\n" if is_table or prev_table else " "))
+            parts.append(seg)
+            prev, prev_table = j, is_table
+        excerpt = "".join(parts)
+        if excerpt or r.get("value") is not None:
+            packed.append({**r, "excerpt": excerpt})
+
+    tokens_after = sum(approx_tokens(r["excerpt"]) for r in packed)
+    return packed, {"tokens_before": tokens_before, "tokens_after": tokens_after,
+                    "tokens_saved": tokens_before - tokens_after, "rows_dropped": len(rows) - len(packed)}
@@ -0,0 +1,145 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeout, as_completed
+from typing import Dict, List, Any, Callable, Optional, Tuple
+from .embed_store import EmbedStore
+from .bge_reranker import BGEReranker
+from .query_engine import _candidates, _subquery_where, _evidence_rows
+from .tracing import span
+from .utils.constants import (QUERY_WORKERS, RERANK_TOP_K, DECOMPOSE_TIMEOUT, RETRIEVE_TIMEOUT,
+                              RERANK_TIMEOUT, SYNTHESIZE_TIMEOUT)
+
+STAGES = ("decompose", "retrieve", "rerank", "synthesize")
+
+
+class QueryExecutor:
+    """Thread pool that runs the stages of query plans concurrently.
+
+    The sub-queries of a plan are retrieved by one task, so they share one batched query encode
+    (see `EmbedStore.query_many`), and their candidates are reranked together in one
+    `rerank_many` call. LLM calls run on the pool too, which lets retrieval of a tentative local
+    plan start while Gemini decomposes the question. Each stage has a timeout (`timeouts`,
+    seconds, None = wait forever): sub-queries whose retrieval times out contribute no evidence,
+    a rerank timeout keeps the fused candidate order, a decompose timeout falls back to the
+    local plan and a synthesize timeout leaves the answer empty. Timed-out tasks are abandoned, not interrupted; they finish
+    in the background and their results are dropped.
+
+    One executor is shared by all questions of a pipeline; `run` starts the state of one question.
+    """
+
+    def __init__(self, max_workers: int = QUERY_WORKERS, timeouts: Dict[str, float | None] | None = None):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rag-query")
+        self.timeouts: Dict[str, float | None] = {
+            "decompose": DECOMPOSE_TIMEOUT, "retrieve": RETRIEVE_TIMEOUT,
+            "rerank": RERANK_TIMEOUT, "synthesize": SYNTHESIZE_TIMEOUT,
+        }
+        for stage, seconds in (timeouts or {}).items():
+            if stage not in self.timeouts:
+                raise ValueError(f"Unknown stage {stage!r}; expected one of {STAGES}")
+            self.timeouts[stage] = seconds
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        # Tasks run in a copy of the caller's context, so their spans land on the caller's trace.
+        return self.pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+    def run(self, query: str, store: EmbedStore, k: int, reranker: BGEReranker) -> "QueryRun":
+        return QueryRun(self, query, store, k, reranker)
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+class QueryRun:
+    """Concurrent stages of one question; `timed_out` lists the "<stage>:<sub-query>" entries
+    that were cut short."""
+
+    def __init__(self, executor: QueryExecutor, query: str, store: EmbedStore, k: int, reranker: BGEReranker):
+        self.executor = executor
+        self.query, self.store, self.k, self.reranker = query, store, k, reranker
+        self.timed_out: List[str] = []
+        # Candidate retrievals by sub-query text, including ones prefetched for a tentative plan:
+        # the batch future that retrieves the sub-query and its position in that batch.
+        self.fetches: Dict[str, Tuple[Future, int]] = {}
+
+    def _fetch(self, subqs: List[str]):
+        """Starts one batched retrieval for the sub-queries in `subqs` not already fetched."""
+        new = list(dict.fromkeys(sq for sq in subqs if sq not in self.fetches))
+        if not new:
+            return
+        wheres = [_subquery_where(self.query, sq) for sq in new]
+        fut = self.executor.submit(_candidates, new, wheres, self.store, self.k)
+        for j, sq in enumerate(new):
+            self.fetches[sq] = (fut, j)
+
+    def prefetch(self, subqs: List[str]):
+        """Starts retrieval for sub-queries that are likely, but not certain, to be asked."""
+        self._fetch(subqs)
+
+    def decompose(self, llm, fallback: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return self.executor.submit(llm.decompose_query, self.query).result(self.executor.timeouts["decompose"])
+        except FutureTimeout:
+            self.timed_out.append("decompose")
+            return fallback
+
+    def _rerank(self, subqs: List[str], hits: List[List[Dict[str, Any]]]) -> Tuple[List[List[Dict[str, Any]]], Dict[str, int]]:
+        stats: Dict[str, int] = {}
+        with span("rerank") as sp:
+            top = self.reranker.rerank_many(subqs, hits, top_k=RERANK_TOP_K, stats=stats)
+            sp.set(**stats)
+        return top, stats
+
+    def retrieve(self, subqs: List[str], stats: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Evidence rows for `subqs`, in sub-query order, like `query_engine._retrieve`; the
+        rerank counts go to `stats["rerank"]`."""
+        timeouts = self.executor.timeouts
+        self._fetch(subqs)
+        fetches: Dict[Future, List[int]] = {}
+        for i, sq in enumerate(subqs):
+            fetches.setdefault(self.fetches[sq][0], []).append(i)
+        hits: Dict[int, List[Dict[str, Any]]] = {}
+
+        def collect(fut: Future):
+            batch = fut.result()
+            for i in fetches[fut]:
+                hits[i] = [dict(h) for h in batch[self.fetches[subqs[i]][1]]]
+
+        try:
+            for fut in as_completed(fetches, timeout=timeouts["retrieve"]):
+                collect(fut)
+        except FutureTimeout:
+            for fut, idxs in fetches.items():
+                if idxs[0] in hits:
+                    continue
+                if fut.done():
+                    collect(fut)
+                else:
+                    fut.cancel()
+                    self.timed_out.extend(f"retrieve:{subqs[i]}" for i in idxs)
+
+        # One cross-encoder call for the whole plan: pairs shared across sub-queries are scored
+        # once, and the model never runs on several threads for one question.
+        idxs = sorted(hits)
+        try:
+            tops, rerank_stats = self.executor.submit(
+                self._rerank, [subqs[i] for i in idxs], [hits[i] for i in idxs]).result(timeouts["rerank"])
+            stats["rerank"] = rerank_stats
+        except FutureTimeout:
+            self.timed_out.extend(f"rerank:{subqs[i]}" for i in idxs)
+            tops = [hits[i][:RERANK_TOP_K] for i in idxs]
+        rows: List[Dict[str, Any]] = []
+        for i, top in zip(idxs, tops):
+            rows.extend(_evidence_rows(subqs[i], top))
+        return rows
+
+    def synthesize(self, llm, subqs: List[str], rows: List[Dict[str, Any]]) -> Optional[Dict[str, str]]:
+        try:
+            return self.executor.submit(llm.synthesize, self.query, subqs, rows).result(
+                self.executor.timeouts["synthesize"])
+        except FutureTimeout:
+            self.timed_out.append("synthesize")
+            return None
+
+    def close(self):
+        # Drops prefetches for sub-queries the final plan did not keep.
+        for fut, _ in self.fetches.values():
+            fut.cancel()
@@ -0,0 +1,208 @@
+import os, re, sqlite3
+from collections import Counter
+from typing import List, Dict, Any, Optional, Iterable, Iterator
+from .utils.parser import METRIC_PATTERNS, find_metric_value
+from .utils.constants import FACTS_DB_PATH
+
+# Bump whenever extraction changes, so build_index re-extracts facts for every filing.
+FACT_EXTRACTOR_VERSION = 1
+
+# Row labels (lowercased, footnote markers stripped) that name a METRIC_PATTERNS metric.
+ROW_LABELS = {
+    "total revenue": {"total revenue", "total revenues", "revenue", "revenues", "consolidated revenues",
+                      "total net sales", "net revenue", "net revenues"},
+    "operating margin": {"operating margin"},
+    "gross margin": {"gross margin", "gross margin percentage"},
+    "data center revenue": {"data center"},
+    "cloud revenue": {"google cloud", "microsoft cloud", "microsoft cloud revenue"},
+}
+METRIC_KINDS = {key: kind for key, _, kind in METRIC_PATTERNS}
+
+UNIT_HINTS = [("in billions", 1e9), ("in millions", 1e6), ("in thousands", 1e3)]
+# 10-K financial tables are reported in millions unless the page says otherwise.
+DEFAULT_TABLE_MULT = 1e6
+HEADER_LOOKBACK_LINES = 12
+
+_ROW = re.compile(r"^([A-Za-z][A-Za-z &,'\-/]*?)(?:\(\d\))?:?\s+(?=[\$\(\d—])(.*)$")
+_CELL = re.compile(r"\(?\$?\s*(\d[\d,]*(?:\.\d+)?)\)?\s*(%)?")
+
+
+def _row_lines(page_text: str) -> List[str]:
+    """Text lines and markdown table rows ('| a | b |' -> 'a b'), separator rows dropped."""
+    out = []
+    for line in page_text.split("\n"):
+        line = line.strip()
+        if line.startswith("|"):
+            if set(line) <= set("|-: "):
+                continue
+            line = " ".join(c.strip() for c in line.strip("|").split("|") if c.strip())
+        out.append(line)
+    return out
+
+
+def _header_years(lines: List[str], i: int) -> List[str]:
+    for j in range(i - 1, max(-1, i - 1 - HEADER_LOOKBACK_LINES), -1):
+        years = re.findall(r"\b(20\d{2})\b", lines[j])
+        if len(set(years)) >= 2:
+            return years
+    return []
+
+
+def _unit_mult(page_text: str) -> float:
+    low = page_text.lower()
+    for hint, mult in UNIT_HINTS:
+        if hint in low:
+            return mult
+    return DEFAULT_TABLE_MULT
+
+
+def extract_row_facts(page_text: str, year: str) -> List[Dict[str, Any]]:
+    """Metric values from table-like rows: '<label> <v1> <v2> ...' under a header listing years.
+    The value is taken from the column of the filing year, so both newest-first (MSFT, NVDA)
+    and oldest-first (GOOGL) layouts work; rows without a year header are skipped."""
+    lines = _row_lines(page_text)
+    mult = None
+    facts = []
+    for i, line in enumerate(lines):
+        m = _ROW.match(line)
+        if not m:
+            continue
+        label = m.group(1).strip().lower()
+        metric = next((k for k, labels in ROW_LABELS.items() if label in labels), None)
+        if metric is None:
+            continue
+        years = _header_years(lines, i)
+        if year not in years:
+            continue
+        cells = _CELL.findall(m.group(2))
+        col = years.index(year)
+        if col >= len(cells):
+            continue
+        raw, pct = cells[col]
+        kind = METRIC_KINDS[metric]
+        if (kind == "percent") != bool(pct):
+            continue
+        value = float(raw.replace(",", ""))
+        if kind == "money":
+            mult = mult or _unit_mult(page_text)
+            value *= mult
+        facts.append({"metric": metric, "kind": kind, "value": value, "raw": line, "source": "table"})
+    return facts
+
+
+class FactExtractor:
+    """Streaming `extract_facts`: pages and (chunk, id) pairs are fed in document order as they
+    are produced, and each table fact is linked to its chunk as soon as the chunks covering its
+    page have gone by. Only facts of pages not yet passed by the chunker are held back.
+    """
+
+    def __init__(self, company: str, year: str):
+        self.company, self.year = company, year
+        self.pending: List[Dict[str, Any]] = []  # table facts whose page may still get a chunk
+        self.row_facts: List[Dict[str, Any]] = []
+        self.pattern_facts: List[Dict[str, Any]] = []
+
+    def add_page(self, rec: Dict[str, Any]):
+        page = rec["page"]
+        for f in extract_row_facts(rec["text"], self.year):
+            # "first" is the fallback: the first chunk covering the page.
+            self.pending.append({"fact": {**f, "page": page, "chunk_id": None}, "first": None, "found": False})
+            self.row_facts.append(self.pending[-1]["fact"])
+
+    def pages(self, pages: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Passes page records through, extracting their table facts on the way."""
+        for rec in pages:
+            self.add_page(rec)
+            yield rec
+
+    def add_chunk(self, chunk: Dict[str, Any], _id: str):
+        still = []
+        for p in self.pending:
+            page = p["fact"]["page"]
+            if chunk["page_start"] <= page <= chunk["page_end"]:
+                p["first"] = p["first"] or _id
+                raw = p["fact"]["raw"].split()
+                if raw[0] in chunk["text"] and raw[-1] in chunk["text"]:
+                    p["fact"]["chunk_id"], p["found"] = _id, True
+            if p["found"]:
+                continue
+            if page < chunk["page_start"]:
+                # Chunks start on non-decreasing pages, so none after this one covers the page.
+                p["fact"]["chunk_id"] = p["first"]
+            else:
+                still.append(p)
+        self.pending = still
+        for key, _, _ in METRIC_PATTERNS:
+            v = find_metric_value(chunk["text"], key)
+            if v is None or v["value"] != v["value"]:  # NaN
+                continue
+            self.pattern_facts.append({"metric": key, "kind": v["kind"], "value": v["value"], "raw": None,
+                                       "source": "pattern", "page": chunk.get("page_start"), "chunk_id": _id})
+
+    def finish(self) -> List[Dict[str, Any]]:
+        for p in self.pending:
+            p["fact"]["chunk_id"] = p["first"]
+        self.pending = []
+        facts = self.row_facts + self.pattern_facts
+        for f in facts:
+            f.update({"company": self.company, "year": str(self.year)})
+        return facts
+
+
+def extract_facts(pages: List[Dict[str, Any]], chunks: List[Dict[str, Any]], chunk_ids: List[str],
+                  company: str, year: str) -> List[Dict[str, Any]]:
+    """Facts for one filing: table rows per page, plus METRIC_PATTERNS matches per chunk.
+    Each fact points at the chunk that contains it."""
+    ex = FactExtractor(company, year)
+    for rec in pages:
+        ex.add_page(rec)
+    for c, _id in zip(chunks, chunk_ids):
+        ex.add_chunk(c, _id)
+    return ex.finish()
+
+
+class FactStore:
+    """SQLite store of (company, year, metric) -> value facts extracted at ingest time."""
+
+    def __init__(self, path: str = FACTS_DB_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS facts (
+                doc_id TEXT, company TEXT, year TEXT, metric TEXT, kind TEXT, value REAL,
+                unit TEXT, page INTEGER, chunk_id TEXT, source TEXT, raw TEXT);
+            CREATE INDEX IF NOT EXISTS idx_facts_lookup ON facts(company, year, metric);
+            CREATE INDEX IF NOT EXISTS idx_facts_doc ON facts(doc_id);
+        """)
+
+    def replace_doc(self, doc_id: str, facts: List[Dict[str, Any]]):
+        with self.conn:
+            self.conn.execute("DELETE FROM facts WHERE doc_id = ?", (doc_id,))
+            self.conn.executemany(
+                "INSERT INTO facts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(doc_id, f["company"], f["year"], f["metric"], f["kind"], f["value"],
+                  "%" if f["kind"] == "percent" else "USD", f.get("page"), f.get("chunk_id"),
+                  f["source"], f.get("raw")) for f in facts])
+
+    def delete_doc(self, doc_id: str):
+        with self.conn:
+            self.conn.execute("DELETE FROM facts WHERE doc_id = ?", (doc_id,))
+
+    def lookup(self, company: str, year: str, metric: str) -> Optional[Dict[str, Any]]:
+        """Best fact for (company, year, metric): table facts over regex matches, then the value
+        reported most often, then the earliest page."""
+        rows = self.conn.execute(
+            "SELECT kind, value, unit, page, chunk_id, source, raw FROM facts "
+            "WHERE company = ? AND year = ? AND metric = ? ORDER BY page",
+            (company, str(year), metric)).fetchall()
+        if not rows:
+            return None
+        tables = [r for r in rows if r[5] == "table" and (r[0] == "percent" or r[1] > 0)]
+        pool = tables or rows
+        votes = Counter(r[1] for r in pool)
+        best_value = max(votes, key=lambda v: (votes[v], -min(r[3] or 0 for r in pool if r[1] == v)))
+        kind, value, unit, page, chunk_id, source, raw = next(r for r in pool if r[1] == best_value)
+        return {"company": company, "year": str(year), "metric": metric, "kind": kind, "value": value,
+                "unit": unit, "page": page, "chunk_id": chunk_id, "source": source, "raw": raw,
+                "support": votes[best_value]}
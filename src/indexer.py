@@ -0,0 +1,218 @@
+import os, glob, json, time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Tuple, Iterator
+from .pdf_ingest import stream_markdown
+from .splitter import iter_chunks
+from .embed_store import EmbedStore
+from .fact_store import FactStore, FactExtractor, FACT_EXTRACTOR_VERSION
+from .bm25_index import BM25_VERSION
+from .tracing import Trace, activate, span, append_jsonl, METRICS
+from .utils.hashing import file_sha256
+from .utils.constants import (PDF_DIR, PERSIST_DIR, ARTIFACTS_DIR, MANIFEST_PATH,
+                              CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, INGEST_WORKERS, EMBED_CACHE_DIR,
+                              FACTS_DB_PATH, BM25_INDEX_PATH, PDF_ENGINE, VECTOR_BACKEND, VECTOR_DTYPE,
+                              EMBED_DIM, TRACE_ENABLED, TRACE_PATH, METRICS_PATH)
+
+
+MANIFEST_VERSION = 1
+# Settings that change stored vectors; a change resets the collection.
+VECTOR_SETTINGS = ("embedding_model", "embed_dim", "vector_backend", "vector_dtype")
+
+
+def _index_settings(store: EmbedStore, pdf_engine: str) -> Dict[str, Any]:
+    return {
+        "pdf_engine": pdf_engine,
+        "embedding_model": store.model_name,
+        "embed_dim": store.dim,
+        "vector_backend": store.backend,
+        "vector_dtype": getattr(store.collection, "dtype", None),
+        "chunk_tokens": CHUNK_TOKENS,
+        "overlap_tokens": CHUNK_OVERLAP_TOKENS,
+        "fact_extractor_version": FACT_EXTRACTOR_VERSION,
+        "bm25_version": BM25_VERSION,
+    }
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> Dict[str, Any]:
+    """Build manifest: index settings plus, per document, the PDF content hash it was indexed from."""
+    if not os.path.exists(path):
+        return {"version": MANIFEST_VERSION, "settings": {}, "documents": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {"version": MANIFEST_VERSION, "settings": {}, "documents": {}}
+    return manifest
+
+
+def save_manifest(manifest: Dict[str, Any], path: str = MANIFEST_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _extract_to_artifact(pdf_path: str, pdf_sha: str, pdf_engine: str) -> bool:
+    """Writes a filing's page artifact (pool worker side); returns whether it was already cached."""
+    info = stream_markdown(pdf_path, ARTIFACTS_DIR, pdf_sha=pdf_sha, engine=pdf_engine)
+    for _ in info["pages"]:
+        pass
+    return info["from_artifact"]
+
+
+def _extract_all(todo: List[Tuple[str, str, str]], workers: int, pdf_engine: str) -> Iterator[Tuple[Tuple[str, str, str], Dict[str, Any]]]:
+    """Yields (todo_item, stream_markdown info) in input order; info["pages"] is a page iterator.
+    Several filings: one filing per pool worker writes its page artifact, which is then streamed
+    back here, so chunking/embedding in this process overlaps with extraction of the next
+    filings without whole filings crossing the process boundary. A single filing: shard its
+    pages instead.
+    """
+    if workers > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(todo))) as ex:
+            futures = [ex.submit(_extract_to_artifact, pdf, sha, pdf_engine) for pdf, _, sha in todo]
+            for item, fut in zip(todo, futures):
+                pdf, _, sha = item
+                cached = fut.result()
+                info = stream_markdown(pdf, ARTIFACTS_DIR, pdf_sha=sha, engine=pdf_engine)
+                yield item, {**info, "from_artifact": cached}
+    else:
+        for item in todo:
+            pdf, _, sha = item
+            yield item, stream_markdown(pdf, ARTIFACTS_DIR, workers=workers, pdf_sha=sha, engine=pdf_engine)
+
+
+def _ingest_filing(store: EmbedStore, facts: FactStore, doc_id: str, pdf: str,
+                   info: Dict[str, Any]) -> Dict[str, int]:
+    """Streams one filing through the pipeline: pages -> chunks -> embedding batches -> upserts,
+    with table facts and markdown artifacts taken off the page stream on the way. Memory stays
+    bounded by one page group and one embedding batch, whatever the filing's length."""
+    company, year = info["company"], info["year"]
+    counts = {"pages": 0, "chunks": 0}
+
+    def counted(pages):
+        for rec in pages:
+            counts["pages"] += 1
+            yield rec
+
+    meta = {
+        "doc_id": doc_id,
+        "company": company,
+        "year": year,
+        "source_pdf": os.path.basename(pdf),
+    }
+    extractor = FactExtractor(company, year)
+    chunks = iter_chunks(extractor.pages(counted(info["pages"])))
+    for chunk, _id in store.add_chunk_stream(doc_id, chunks, meta):
+        extractor.add_chunk(chunk, _id)
+        counts["chunks"] += 1
+    with span("store_facts", doc_id=doc_id) as sp:
+        doc_facts = extractor.finish()
+        facts.replace_doc(doc_id, doc_facts)
+        sp.set(rows=len(doc_facts))
+    return {**counts, "facts": len(doc_facts)}
+
+
+def index_version(manifest_path: str = MANIFEST_PATH) -> str | None:
+    """Fingerprint of the current index contents; changes whenever a build changes the manifest."""
+    if not os.path.exists(manifest_path):
+        return None
+    return file_sha256(manifest_path)[:16]
+
+
+def build_index(pdf_dir: str = PDF_DIR, persist_dir: str = PERSIST_DIR,
+                manifest_path: str = MANIFEST_PATH, force: bool = False,
+                workers: int = INGEST_WORKERS, embed_cache_dir: str | None = EMBED_CACHE_DIR,
+                facts_path: str = FACTS_DB_PATH, lexical_path: str = BM25_INDEX_PATH,
+                backend: str = VECTOR_BACKEND, vector_dtype: str = VECTOR_DTYPE,
+                embed_dim: int | None = EMBED_DIM, trace: bool = TRACE_ENABLED, pdf_engine: str = PDF_ENGINE):
+    """Incremental index build.
+    Filings whose PDF hash and index settings match the manifest are skipped; changed
+    filings have their chunks replaced; filings whose PDF disappeared are removed.
+    Each filing is streamed page by page through chunking, embedding and upserts, so peak
+    memory does not grow with filing length. `workers` > 1 extracts PDFs in a process pool;
+    `pdf_engine` picks the extraction backend (see `extract_pdf_to_markdown`), and switching
+    it re-indexes every filing. Passage embeddings go through the on-disk embedding cache
+    unless `embed_cache_dir` is None. Metric facts are extracted into the SQLite fact store
+    at `facts_path`, chunk texts into the BM25 index at `lexical_path`.
+    `backend` selects Chroma or the in-process NumPy store; switching it, `vector_dtype` or
+    `embed_dim` (Matryoshka truncation) re-embeds every filing. With `trace`, per-filing spans
+    are appended to TRACE_PATH and stage metrics written to METRICS_PATH.
+    """
+    pdfs = sorted(glob.glob(os.path.join(pdf_dir, "*.pdf")))
+    if not pdfs:
+        print(f"No PDFs found under {pdf_dir}. Please add 10-K PDFs first.")
+        return
+    store = EmbedStore(persist_dir=persist_dir, embed_cache_dir=embed_cache_dir, lexical_path=lexical_path,
+                       backend=backend, vector_dtype=vector_dtype, embed_dim=embed_dim)
+    facts = FactStore(facts_path)
+    manifest = load_manifest(manifest_path)
+    settings = _index_settings(store, pdf_engine)
+    # Taken before a settings change resets the manifest, so filings deleted in the same run
+    # are still removed from the store, BM25 index and fact store.
+    indexed = set(manifest["documents"])
+
+    if manifest["settings"] != settings:
+        old = manifest["settings"]
+        if old and any(old.get(key) != settings[key] for key in VECTOR_SETTINGS):
+            # Existing chunk IDs are only metadata-updated, so vectors from another model, width,
+            # precision or backend would otherwise be kept as-is.
+            print(f"[INGEST] Vector settings changed -> resetting collection {store.collection_name}")
+            store.reset_collection()
+        if manifest["documents"]:
+            print("[INGEST] Index settings changed -> re-indexing all filings")
+        manifest = {"version": MANIFEST_VERSION, "settings": settings, "documents": {}}
+
+    seen = set()
+    todo = []
+    for pdf in pdfs:
+        doc_id = os.path.splitext(os.path.basename(pdf))[0]
+        seen.add(doc_id)
+        sha = file_sha256(pdf)
+        entry = manifest["documents"].get(doc_id)
+        if not force and entry and entry.get("sha256") == sha:
+            print(f"[SKIP] {doc_id} unchanged ({entry.get('n_chunks')} chunks)")
+            continue
+        todo.append((pdf, doc_id, sha))
+
+    build_trace = Trace("build_index", filings=len(todo)) if trace else None
+    try:
+        t0 = time.perf_counter()
+        for (pdf, doc_id, sha), info in _extract_all(todo, workers, pdf_engine):
+            print(f"[INGEST] {pdf}" + (" (cached page artifact)" if info["from_artifact"] else ""))
+            with activate(build_trace), span("ingest", doc_id=doc_id, cached=info["from_artifact"]) as sp:
+                counts = _ingest_filing(store, facts, doc_id, pdf, info)
+                sp.set(**counts)
+            manifest["documents"][doc_id] = {
+                "source_pdf": os.path.basename(pdf),
+                "sha256": sha,
+                "n_chunks": counts["chunks"],
+                "n_facts": counts["facts"],
+                "indexed_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            save_manifest(manifest, manifest_path)
+            print(f"[INDEXED] {doc_id} -> {counts['pages']} pages, {counts['chunks']} chunks "
+                  f"({time.perf_counter() - t0:.1f}s elapsed)")
+
+        for doc_id in sorted(indexed - seen):
+            removed = store.delete_doc(doc_id)
+            facts.delete_doc(doc_id)
+            manifest["documents"].pop(doc_id, None)
+            print(f"[REMOVED] {doc_id} -> {removed} chunks")
+    finally:
+        # The lexical index and embedding cache are saved once per build, even if it fails midway.
+        if store.lexical is not None:
+            store.lexical.save()
+        if store.embed_cache is not None:
+            store.embed_cache.flush()
+        if build_trace is not None:
+            append_jsonl(build_trace, TRACE_PATH)
+            METRICS.write(METRICS_PATH)
+            print(f"[TRACE] {build_trace.stages()}")
+
+    manifest["settings"] = settings
+    save_manifest(manifest, manifest_path)
+
+    if store.embed_cache is not None:
+        st = store.embed_cache.stats()
+        print(f"[EMBED CACHE] hits={st['hits']} misses={st['misses']} hit_rate={st['hit_rate']:.1%} "
+              f"evictions={st['evictions']} entries={st['entries']}/{store.embed_cache.max_entries}")
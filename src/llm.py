@@ -1,7 +1,7 @@
-import os, json
-from typing import List, Dict, Any, Optional
-import google.generativeai as genai
+import os, json, time
+from typing import List, Dict, Any, Optional, Iterator
 from .utils.constants import DEFAULT_LLM_MODEL
+from .utils.lazy import timed_import
 
 def _compact_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     out = []
@@ -16,12 +16,31 @@ def _compact_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         })
     return out
 
+def parse_synthesis(text: str) -> Optional[Dict[str, str]]:
+    """{"answer", "reasoning"} from a synthesis response, or None if it has no such JSON object."""
+    text = (text or "").strip()
+    # Extract last JSON object if extra text
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end != -1 and end > start:
+        text = text[start:end + 1]
+    try:
+        obj = json.loads(text)
+    except Exception as e:
+        print("[LLM] Error:", e)
+        return None
+    if isinstance(obj, dict) and "answer" in obj and "reasoning" in obj:
+        return {"answer": obj["answer"], "reasoning": obj["reasoning"]}
+    return None
+
+
 class GeminiLLM:
     def __init__(self):
         api_key = os.getenv("GEMINI_API_KEY")
         if not api_key:
             raise ValueError("Set GEMINI_API_KEY for LLM synthesis.")
+        genai = timed_import("google.generativeai")
         genai.configure(api_key=api_key)
+        self.model_name = DEFAULT_LLM_MODEL
         self.model = genai.GenerativeModel(DEFAULT_LLM_MODEL)
         print(f"[LLM] Initialized Gemini LLM with model: {DEFAULT_LLM_MODEL}")
 
@@ -75,7 +94,8 @@ class GeminiLLM:
         return plan
     
 
-    def synthesize(self, query: str, sub_queries: List[str], rows: List[Dict[str, Any]]) -> Optional[Dict[str, str]]:
+    @staticmethod
+    def _synthesis_prompt(query: str, sub_queries: List[str], rows: List[Dict[str, Any]]) -> str:
         context = {
             "query": query,
             "sub_queries": sub_queries,
@@ -100,24 +120,59 @@ class GeminiLLM:
             f"DATA:\n{json.dumps(context, ensure_ascii=False)}\n\n"
             'Respond with JSON only: {"answer": "...", "reasoning": "..."}'
         )
+        return prompt
 
-
+    def synthesize(self, query: str, sub_queries: List[str], rows: List[Dict[str, Any]]) -> Optional[Dict[str, str]]:
         try:
-            resp = self.model.generate_content(prompt)
-            text = resp.text.strip()
-
-            # Extract last JSON object if extra text
-            start, end = text.find("{"), text.rfind("}")
-            if start != -1 and end != -1 and end > start:
-                text = text[start:end + 1]
-
-            obj = json.loads(text)
-            if "answer" in obj and "reasoning" in obj:
-                return {"answer": obj["answer"], "reasoning": obj["reasoning"]}
+            resp = self.model.generate_content(self._synthesis_prompt(query, sub_queries, rows))
+            return parse_synthesis(resp.text)
         except Exception as e:
             print("[LLM] Error:", e)
             return None
-        return None
+
+    def synthesize_stream(self, query: str, sub_queries: List[str], rows: List[Dict[str, Any]]) -> Iterator[str]:
+        """Raw response text as Gemini generates it; `parse_synthesis` of the joined text gives
+        what `synthesize` returns."""
+        try:
+            for chunk in self.model.generate_content(self._synthesis_prompt(query, sub_queries, rows), stream=True):
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            print("[LLM] Error:", e)
+
+
+class StubLLM:
+    """Offline stand-in for GeminiLLM with the same interface, for caches, benchmarks and tests.
+    Decomposition returns the query itself (or a canned plan); synthesis quotes the top evidence.
+    `synthesize_stream` emits the same JSON in `stream_chars`-sized pieces, `stream_delay` seconds
+    apart, like a model generating tokens.
+    """
+
+    def __init__(self, plans: Dict[str, dict] | None = None, stream_chars: int = 8, stream_delay: float = 0.0):
+        self.model_name = "stub"
+        self.plans = plans or {}
+        self.stream_chars = stream_chars
+        self.stream_delay = stream_delay
+        self.calls = {"decompose_query": 0, "synthesize": 0}
+
+    def decompose_query(self, query: str) -> dict:
+        self.calls["decompose_query"] += 1
+        return self.plans.get(query) or {"intent": "default", "sub_queries": [query]}
+
+    def synthesize(self, query: str, sub_queries: List[str], rows: List[Dict[str, Any]]) -> Optional[Dict[str, str]]:
+        self.calls["synthesize"] += 1
+        if not rows:
+            return {"answer": "Insufficient evidence in provided sources.", "reasoning": "No evidence."}
+        top = rows[0]
+        return {"answer": (top.get("excerpt") or "")[:200],
+                "reasoning": f"Stub answer from {top.get('company')} {top.get('year')} p.{top.get('page')}."}
+
+    def synthesize_stream(self, query: str, sub_queries: List[str], rows: List[Dict[str, Any]]) -> Iterator[str]:
+        text = json.dumps(self.synthesize(query, sub_queries, rows), ensure_ascii=False)
+        for i in range(0, len(text), self.stream_chars):
+            if self.stream_delay:
+                time.sleep(self.stream_delay)
+            yield text[i:i + self.stream_chars]
 
 
 def get_llm() -> Optional[GeminiLLM]:
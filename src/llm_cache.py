@@ -0,0 +1,249 @@
+import os, re, json, time, hashlib, copy, threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Callable, Iterator
+import numpy as np
+from .utils.parser import COMPANY_ALIASES
+from .planner import METRIC_SYNONYMS, FILLER_WORDS, _find_metric
+from .tracing import span
+from .llm import parse_synthesis
+from .streaming import synthesize_stream
+from .utils.constants import LLM_CACHE_TTL_SECONDS, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_SIMILARITY
+
+
+def normalize_prompt(text: str) -> str:
+    return re.sub(r"\s+", " ", text.lower()).strip(" ?.!")
+
+
+# Words that flip the meaning of otherwise near-identical questions, by the token they map to.
+_INTENT_WORDS = {
+    "max": ("highest", "largest", "biggest", "most", "maximum", "top"),
+    "min": ("lowest", "smallest", "least", "minimum", "bottom"),
+    "up": ("growth", "grow", "grew", "increase", "increased", "rise", "rose", "gain"),
+    "down": ("decline", "declined", "decrease", "decreased", "drop", "dropped", "fell", "fall"),
+    "more": ("more", "higher", "larger", "greater", "exceed", "exceeded"),
+    "less": ("less", "lower", "smaller", "fewer"),
+    "compare": ("compare", "compared", "comparison", "vs", "versus", "difference"),
+}
+
+
+# Words accounted for by the other parts of the guard (or carrying no topic), left out of its terms.
+_NON_TERMS = (FILLER_WORDS | {w for vocab in _INTENT_WORDS.values() for w in vocab}
+              | {w for alias in COMPANY_ALIASES for w in re.findall(r"[a-z]+", alias.lower())})
+
+
+def _guard(text: str) -> str:
+    """Years/numbers, companies, comparison/direction words, the metric and the remaining
+    content terms of a question; a semantic hit must agree on all of these exactly, so
+    "... in 2023" never reuses the answer for "... in 2022", "highest" never reuses the answer
+    for "lowest", gross margin not operating margin, and "AI risks" not "AI opportunities".
+    What is left to the embedding is phrasing: word order, stopwords, synonyms of the metric."""
+    low = text.lower().replace("’", "'")
+    nums = sorted(set(re.findall(r"\d+(?:\.\d+)?", low)))
+    companies = sorted({canon for alias, canon in COMPANY_ALIASES.items() if alias.lower() in low})
+    words = set(re.findall(r"[a-z]+", low))
+    intents = sorted(tok for tok, vocab in _INTENT_WORDS.items() if words.intersection(vocab))
+    metric, _ = _find_metric(low)
+    if metric:
+        # Any synonym names the same metric, so its words are not terms.
+        for phrase in sorted(METRIC_SYNONYMS.get(metric, [metric]), key=len, reverse=True):
+            low = re.sub(r"\b" + re.escape(phrase) + r"\b", " ", low)
+    terms = sorted({w[:-1] if len(w) > 3 and w.endswith("s") else w
+                    for w in re.findall(r"[a-z]+", low) if len(w) > 1 and w not in _NON_TERMS})
+    return json.dumps([nums, companies, intents, metric, terms])
+
+
+# Query embeddings kept between a lookup and the store that follows its miss.
+_EMBED_MEMO = 64
+
+
+class LLMResponseCache:
+    """TTL + LRU cache of LLM responses.
+    Exact hits match the normalized prompt key; semantic hits compare embeddings of
+    `semantic_text` against entries of the same kind and scope with cosine >= `threshold`.
+    Entries are namespaced by LLM model and index version; changing either clears the cache.
+    """
+
+    def __init__(self, namespace: str,
+                 embed_fn: Callable[[List[str]], np.ndarray] | None = None,
+                 threshold: float = LLM_CACHE_SIMILARITY,
+                 ttl_seconds: float = LLM_CACHE_TTL_SECONDS,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 path: str | None = None):
+        self.namespace = namespace
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.path = path
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # Embeddings of recently looked-up texts, so the store after a miss does not re-embed.
+        self._vecs: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.exact_hits = self.semantic_hits = self.misses = 0
+        # Guards `entries`; embedding calls happen outside it.
+        self._lock = threading.RLock()
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("namespace") == namespace:
+                    self.entries.update((e["key"], e) for e in data.get("entries", []))
+            except (OSError, ValueError):
+                pass
+
+    def set_namespace(self, namespace: str):
+        with self._lock:
+            if namespace != self.namespace:
+                self.entries.clear()
+                self.namespace = namespace
+
+    def _key(self, kind: str, prompt_key: str) -> str:
+        return hashlib.sha1(f"{self.namespace}\0{kind}\0{normalize_prompt(prompt_key)}".encode("utf-8")).hexdigest()
+
+    def _expired(self, entry: Dict[str, Any], now: float) -> bool:
+        return self.ttl_seconds is not None and now - entry["created"] > self.ttl_seconds
+
+    def _embed(self, text: str) -> Optional[List[float]]:
+        if self.embed_fn is None:
+            return None
+        with self._lock:
+            vec = self._vecs.get(text)
+            if vec is not None:
+                self._vecs.move_to_end(text)
+                return vec
+        vec = np.asarray(self.embed_fn([text])[0], dtype=np.float32).tolist()
+        with self._lock:
+            self._vecs[text] = vec
+            while len(self._vecs) > _EMBED_MEMO:
+                self._vecs.popitem(last=False)
+        return vec
+
+    def lookup(self, kind: str, prompt_key: str, semantic_text: str | None = None, scope: str = "") -> Any:
+        now = time.time()
+        key = self._key(kind, prompt_key)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and not self._expired(entry, now):
+                self.entries.move_to_end(key)
+                self.exact_hits += 1
+                return copy.deepcopy(entry["value"])
+
+        if semantic_text is not None and self.embed_fn is not None:
+            guard = _guard(semantic_text)
+            with self._lock:
+                cands = [e for e in self.entries.values()
+                         if e["kind"] == kind and e["scope"] == scope and e.get("vec") is not None
+                         and e["guard"] == guard and not self._expired(e, now)]
+            if cands:
+                q = np.asarray(self._embed(semantic_text), dtype=np.float32)
+                sims = np.asarray([e["vec"] for e in cands], dtype=np.float32) @ q
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    with self._lock:
+                        if cands[best]["key"] in self.entries:
+                            self.entries.move_to_end(cands[best]["key"])
+                        self.semantic_hits += 1
+                    return copy.deepcopy(cands[best]["value"])
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, kind: str, prompt_key: str, value: Any, semantic_text: str | None = None, scope: str = ""):
+        key = self._key(kind, prompt_key)
+        entry = {
+            "key": key,
+            "kind": kind,
+            "scope": scope,
+            "created": time.time(),
+            "value": copy.deepcopy(value),
+            "vec": self._embed(semantic_text) if semantic_text is not None else None,
+            "guard": _guard(semantic_text) if semantic_text is not None else None,
+        }
+        with self._lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        now = time.time()
+        with self._lock:
+            entries = [e for e in self.entries.values() if not self._expired(e, now)]
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"namespace": self.namespace, "entries": entries}, f)
+        os.replace(tmp, self.path)
+
+    def stats(self) -> Dict[str, float]:
+        """Counts since the cache was created (all questions, not just the last one)."""
+        with self._lock:
+            exact, semantic, misses, entries = self.exact_hits, self.semantic_hits, self.misses, len(self.entries)
+        lookups = exact + semantic + misses
+        return {
+            "exact_hits": exact,
+            "semantic_hits": semantic,
+            "misses": misses,
+            "hit_rate": round((exact + semantic) / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+        }
+
+
+def _evidence_fingerprint(sub_queries: List[str], rows: List[Dict[str, Any]]) -> str:
+    ev = [[(r.get("raw") or {}).get("id") or r.get("excerpt"), r.get("value")] for r in rows]
+    return hashlib.sha1(json.dumps([sub_queries, ev], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class CachedLLM:
+    """Wraps any LLM exposing decompose_query/synthesize (GeminiLLM, StubLLM) with an LLMResponseCache.
+    Synthesis is only reused for the same evidence: the evidence fingerprint is part of the
+    exact key and the scope of semantic matches."""
+
+    def __init__(self, llm, cache: LLMResponseCache):
+        self.llm = llm
+        self.cache = cache
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.llm, "model_name", type(self.llm).__name__)
+
+    def decompose_query(self, query: str) -> dict:
+        with span("llm_cache", kind="decompose") as sp:
+            plan = self.cache.lookup("decompose", query, semantic_text=query)
+            sp.set(cache_hits=int(plan is not None))
+        if plan is not None:
+            return plan
+        plan = self.llm.decompose_query(query)
+        self.cache.store("decompose", query, plan, semantic_text=query)
+        return plan
+
+    def synthesize(self, query: str, sub_queries: List[str], rows: List[Dict[str, Any]]) -> Optional[Dict[str, str]]:
+        fp = _evidence_fingerprint(sub_queries, rows)
+        with span("llm_cache", kind="synthesize") as sp:
+            out = self.cache.lookup("synthesize", f"{fp}\0{query}", semantic_text=query, scope=fp)
+            sp.set(cache_hits=int(out is not None))
+        if out is not None:
+            return out
+        out = self.llm.synthesize(query, sub_queries, rows)
+        if out:
+            # Failed generations (None) are not cached so they are retried next time.
+            self.cache.store("synthesize", f"{fp}\0{query}", out, semantic_text=query, scope=fp)
+        return out
+
+    def synthesize_stream(self, query: str, sub_queries: List[str], rows: List[Dict[str, Any]]) -> Iterator[str]:
+        """A cached synthesis is replayed as one delta; a fresh one is streamed and then cached."""
+        fp = _evidence_fingerprint(sub_queries, rows)
+        with span("llm_cache", kind="synthesize") as sp:
+            out = self.cache.lookup("synthesize", f"{fp}\0{query}", semantic_text=query, scope=fp)
+            sp.set(cache_hits=int(out is not None))
+        if out is not None:
+            yield json.dumps(out, ensure_ascii=False)
+            return
+        parts = []
+        for delta in synthesize_stream(self.llm, query, sub_queries, rows):
+            parts.append(delta)
+            yield delta
+        out = parse_synthesis("".join(parts))
+        if out:
+            self.cache.store("synthesize", f"{fp}\0{query}", out, semantic_text=query, scope=fp)
@@ -0,0 +1,376 @@
+import os, re, json, shutil
+from typing import List, Dict, Any, Tuple
+import numpy as np
+from .utils.filters import matches_where
+
+# Metadata fields that define a partition; filters on only these fields select whole partitions.
+PARTITION_FIELDS = ("company", "year")
+NUMPY_STORE_VERSION = 1
+VECTOR_DTYPES = ("float32", "float16", "int8")
+
+
+def partition_key(meta: Dict[str, Any] | None) -> str:
+    meta = meta or {}
+    parts = [str(meta.get(f) or "_") for f in PARTITION_FIELDS]
+    return re.sub(r"[^A-Za-z0-9_.\-]", "-", "_".join(parts))
+
+
+def _where_fields(where: dict | None) -> set:
+    fields = set()
+    for key, cond in (where or {}).items():
+        if key in ("$and", "$or"):
+            for c in cond:
+                fields |= _where_fields(c)
+        else:
+            fields.add(key)
+    return fields
+
+
+class _Partition:
+    """All chunks of one (company, year): a (rows, dim) matrix plus row-aligned ids/documents/metadatas.
+    The matrix is a read-only memmap until the partition is modified, then an in-memory buffer
+    with spare rows, so appending a document batch by batch does not copy the whole matrix each
+    time. int8 matrices carry a float32 scale per row (row ~= int8 row * scale). Changes are
+    written to disk by `save`; `dirty` tells whether there are any."""
+
+    def __init__(self, path: str, dtype: str):
+        self.path = path
+        self.dtype = dtype
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        # Row buffers; only the first len(ids) rows are in use.
+        self._buf: np.ndarray | None = None
+        self._sbuf: np.ndarray | None = None
+        # float32 (dequantized) matrix for scoring, kept until the partition changes.
+        self._dense: np.ndarray | None = None
+        self.row: Dict[str, int] = {}
+        self.dirty = False
+
+    @property
+    def matrix(self) -> np.ndarray | None:
+        return None if self._buf is None else self._buf[:len(self.ids)]
+
+    @matrix.setter
+    def matrix(self, value: np.ndarray | None):
+        self._buf = value
+
+    @property
+    def scales(self) -> np.ndarray | None:
+        return None if self._sbuf is None else self._sbuf[:len(self.ids)]
+
+    @scales.setter
+    def scales(self, value: np.ndarray | None):
+        self._sbuf = value
+
+    @property
+    def vectors_path(self) -> str:
+        return os.path.join(self.path, f"vectors.{self.dtype}")
+
+    @property
+    def scales_path(self) -> str:
+        return os.path.join(self.path, "scales.f32")
+
+    @property
+    def rows_path(self) -> str:
+        return os.path.join(self.path, "rows.json")
+
+    @classmethod
+    def open(cls, path: str, dtype: str) -> "_Partition | None":
+        part = cls(path, dtype)
+        if not os.path.exists(part.rows_path) or not os.path.exists(part.vectors_path):
+            return None
+        with open(part.rows_path, "r", encoding="utf-8") as f:
+            rows = json.load(f)
+        if rows.get("version") != NUMPY_STORE_VERSION or rows.get("dtype") != dtype or not rows["ids"]:
+            return None
+        part.ids, part.documents, part.metadatas = rows["ids"], rows["documents"], rows["metadatas"]
+        part.matrix = np.memmap(part.vectors_path, dtype=dtype, mode="r", shape=(len(part.ids), rows["dim"]))
+        if dtype == "int8":
+            if not os.path.exists(part.scales_path):
+                return None
+            part.scales = np.memmap(part.scales_path, dtype=np.float32, mode="r", shape=(len(part.ids),))
+        part.row = {_id: i for i, _id in enumerate(part.ids)}
+        return part
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _writable(self):
+        if isinstance(self._buf, np.memmap):
+            self._buf = np.array(self._buf)
+        if isinstance(self._sbuf, np.memmap):
+            self._sbuf = np.array(self._sbuf)
+        self._dense = None
+        self.dirty = True
+
+    def _reserve(self, rows: int, dim: int):
+        """Makes room for `rows` rows, growing the buffers geometrically."""
+        if self._buf is not None and len(self._buf) >= rows:
+            return
+        n = len(self.ids)
+        cap = max(rows, 2 * n, 64)
+        buf = np.empty((cap, dim), dtype=self.dtype)
+        if n:
+            buf[:n] = self.matrix
+        self._buf = buf
+        if self.dtype == "int8":
+            sbuf = np.empty(cap, dtype=np.float32)
+            if n:
+                sbuf[:n] = self.scales
+            self._sbuf = sbuf
+
+    def _encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray | None]:
+        if self.dtype != "int8":
+            return vectors.astype(self.dtype), None
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def dense(self) -> np.ndarray:
+        """The matrix as float32 (dequantized for int8), for scoring. float16/int8 partitions are
+        converted once and cached until the partition changes: low-precision matmul is slow on CPU."""
+        if self.dtype == "float32":
+            return self.matrix
+        if self._dense is None:
+            dense = np.asarray(self.matrix, dtype=np.float32)
+            if self.scales is not None:
+                dense *= np.asarray(self.scales)[:, None]
+            self._dense = dense
+        return self._dense
+
+    def vectors(self, rows) -> np.ndarray:
+        """float32 rows (dequantized for int8)."""
+        out = np.asarray(self.matrix[rows], dtype=np.float32)
+        if self.scales is not None:
+            out *= np.asarray(self.scales[rows])[..., None]
+        return out
+
+    def upsert(self, ids: List[str], vectors: np.ndarray, documents: List[str], metadatas: List[Dict[str, Any]]):
+        self._writable()
+        codes, scales = self._encode(vectors)
+        new = []
+        for i, _id in enumerate(ids):
+            r = self.row.get(_id)
+            if r is None:
+                new.append(i)
+                continue
+            self.matrix[r] = codes[i]
+            if scales is not None:
+                self.scales[r] = scales[i]
+            self.documents[r], self.metadatas[r] = documents[i], metadatas[i]
+        if new:
+            n = len(self.ids)
+            self._reserve(n + len(new), codes.shape[1])
+            self._buf[n:n + len(new)] = codes[new]
+            if scales is not None:
+                self._sbuf[n:n + len(new)] = scales[new]
+            for i in new:
+                self.row[ids[i]] = len(self.ids)
+                self.ids.append(ids[i])
+                self.documents.append(documents[i])
+                self.metadatas.append(metadatas[i])
+
+    def delete(self, ids: List[str]):
+        drop = {self.row[_id] for _id in ids if _id in self.row}
+        if not drop:
+            return
+        keep = [r for r in range(len(self.ids)) if r not in drop]
+        self._dense = None
+        self.dirty = True
+        self.matrix = np.asarray(self.matrix)[keep]
+        if self.scales is not None:
+            self.scales = np.asarray(self.scales)[keep]
+        self.ids = [self.ids[r] for r in keep]
+        self.documents = [self.documents[r] for r in keep]
+        self.metadatas = [self.metadatas[r] for r in keep]
+        self.row = {_id: i for i, _id in enumerate(self.ids)}
+
+    def save(self):
+        self.dirty = False
+        if not self.ids:
+            self.matrix = self.scales = None
+            shutil.rmtree(self.path, ignore_errors=True)
+            return
+        os.makedirs(self.path, exist_ok=True)
+        data = np.ascontiguousarray(self.matrix, dtype=self.dtype)
+        tmp = self.vectors_path + ".tmp"
+        data.tofile(tmp)
+        os.replace(tmp, self.vectors_path)
+        if self.scales is not None:
+            tmp = self.scales_path + ".tmp"
+            np.ascontiguousarray(self.scales, dtype=np.float32).tofile(tmp)
+            os.replace(tmp, self.scales_path)
+        tmp = self.rows_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": NUMPY_STORE_VERSION, "dtype": self.dtype, "dim": int(data.shape[1]),
+                       "ids": self.ids, "documents": self.documents, "metadatas": self.metadatas}, f)
+        os.replace(tmp, self.rows_path)
+        self.matrix = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=data.shape)
+        if self.scales is not None:
+            self.scales = np.memmap(self.scales_path, dtype=np.float32, mode="r", shape=(len(self.ids),))
+
+
+class NumpyCollection:
+    """In-process vector store with the subset of the Chroma collection API used by `EmbedStore`
+    (get / upsert / update / delete / query), so it can stand in for `self.collection`.
+
+    Normalized embeddings are stored per (company, year) partition as a memory-mapped float32,
+    float16 or int8 (with a per-row scale) matrix under `<path>/<company>_<year>/`. Filters that
+    only mention company/year select whole partitions; anything else falls back to a per-row
+    `matches_where` mask. Search is an exact matmul with `argpartition` top-k. Distances are
+    squared L2 between unit vectors (2 - 2 * cosine), matching Chroma's default space.
+    Mutations stay in memory until `flush`, which rewrites only the partitions they touched
+    (`EmbedStore` flushes once per document).
+    """
+
+    def __init__(self, path: str, dtype: str = "float32"):
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"dtype must be one of {VECTOR_DTYPES}, got {dtype!r}")
+        self.path = path
+        self.dtype = dtype
+        self.parts: Dict[str, _Partition] = {}
+        os.makedirs(path, exist_ok=True)
+        for name in sorted(os.listdir(path)):
+            part = _Partition.open(os.path.join(path, name), dtype)
+            if part is not None:
+                self.parts[name] = part
+        self.where_is: Dict[str, str] = {_id: key for key, p in self.parts.items() for _id in p.ids}
+
+    def count(self) -> int:
+        return len(self.where_is)
+
+    def reset(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path, exist_ok=True)
+        self.parts, self.where_is = {}, {}
+
+    def _part(self, key: str) -> _Partition:
+        if key not in self.parts:
+            self.parts[key] = _Partition(os.path.join(self.path, key), self.dtype)
+        return self.parts[key]
+
+    def flush(self):
+        """Writes the partitions changed since the last flush to disk."""
+        for key, part in list(self.parts.items()):
+            if part.dirty:
+                part.save()
+            if not part.ids:
+                del self.parts[key]
+
+    def upsert(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict[str, Any]]):
+        vecs = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        vecs = vecs / np.where(norms == 0, 1.0, norms)
+        groups: Dict[str, List[int]] = {}
+        moved: Dict[str, List[str]] = {}
+        for i, (_id, meta) in enumerate(zip(ids, metadatas)):
+            key = partition_key(meta)
+            old = self.where_is.get(_id)
+            if old is not None and old != key:
+                moved.setdefault(old, []).append(_id)
+            groups.setdefault(key, []).append(i)
+        for old, old_ids in moved.items():
+            self.parts[old].delete(old_ids)
+        for key, idxs in groups.items():
+            self._part(key).upsert([ids[i] for i in idxs], vecs[idxs],
+                                   [documents[i] for i in idxs], [metadatas[i] for i in idxs])
+            for i in idxs:
+                self.where_is[ids[i]] = key
+
+    add = upsert
+
+    def update(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        moves = ([], [], [], [])
+        for _id, meta in zip(ids, metadatas):
+            key = self.where_is.get(_id)
+            if key is None:
+                continue
+            part = self.parts[key]
+            r = part.row[_id]
+            if partition_key(meta) == key:
+                part.metadatas[r] = meta
+                part.dirty = True
+            else:
+                for lst, val in zip(moves, (_id, part.vectors(r),
+                                            part.documents[r], meta)):
+                    lst.append(val)
+        if moves[0]:
+            self.upsert(moves[0], np.stack(moves[1]), moves[2], moves[3])
+
+    def delete(self, ids: List[str]):
+        by_part: Dict[str, List[str]] = {}
+        for _id in ids:
+            key = self.where_is.pop(_id, None)
+            if key is not None:
+                by_part.setdefault(key, []).append(_id)
+        for key, part_ids in by_part.items():
+            self.parts[key].delete(part_ids)
+
+    def _select(self, where: dict | None) -> List[Tuple[_Partition, np.ndarray | None]]:
+        """(partition, row mask or None for all rows) for every partition the filter can match."""
+        partition_only = _where_fields(where) <= set(PARTITION_FIELDS)
+        out = []
+        for part in self.parts.values():
+            if not part.ids:
+                continue
+            if partition_only:
+                if matches_where({f: part.metadatas[0].get(f) for f in PARTITION_FIELDS}, where):
+                    out.append((part, None))
+                continue
+            mask = np.fromiter((matches_where(m, where) for m in part.metadatas), dtype=bool, count=len(part))
+            if mask.any():
+                out.append((part, mask))
+        return out
+
+    def get(self, ids: List[str] | None = None, where: dict | None = None,
+            include: List[str] = ("documents", "metadatas")) -> Dict[str, Any]:
+        rows = []
+        if ids is not None:
+            for _id in ids:
+                key = self.where_is.get(_id)
+                if key is not None:
+                    part = self.parts[key]
+                    r = part.row[_id]
+                    if matches_where(part.metadatas[r], where):
+                        rows.append((part, r))
+        else:
+            for part, mask in self._select(where):
+                rows.extend((part, r) for r in (range(len(part)) if mask is None else np.flatnonzero(mask)))
+        res: Dict[str, Any] = {"ids": [p.ids[r] for p, r in rows]}
+        if "documents" in include:
+            res["documents"] = [p.documents[r] for p, r in rows]
+        if "metadatas" in include:
+            res["metadatas"] = [p.metadatas[r] for p, r in rows]
+        return res
+
+    def query(self, query_embeddings, n_results: int = 10,
+              include: List[str] = ("documents", "metadatas", "distances"),
+              where: dict | None = None) -> Dict[str, Any]:
+        q = np.asarray(query_embeddings, dtype=np.float32)
+        q = q / np.maximum(np.linalg.norm(q, axis=1, keepdims=True), 1e-12)
+        selected = self._select(where)
+        res: Dict[str, Any] = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if not selected:
+            for key in res:
+                res[key] = [[] for _ in q]
+            return res
+
+        sims, refs = [], []
+        for part, mask in selected:
+            rows = np.arange(len(part)) if mask is None else np.flatnonzero(mask)
+            dense = part.dense()
+            sims.append(q @ (dense if mask is None else dense[rows]).T)
+            refs.extend((part, int(r)) for r in rows)
+        sims = np.concatenate(sims, axis=1)
+
+        k = min(n_results, sims.shape[1])
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        for qi in range(len(q)):
+            order = top[qi][np.argsort(-sims[qi, top[qi]])]
+            hits = [refs[j] for j in order]
+            res["ids"].append([p.ids[r] for p, r in hits])
+            res["documents"].append([p.documents[r] for p, r in hits])
+            res["metadatas"].append([p.metadatas[r] for p, r in hits])
+            res["distances"].append([float(2.0 - 2.0 * sims[qi, j]) for j in order])
+        return {key: val for key, val in res.items() if key == "ids" or key in include}
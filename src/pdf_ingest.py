@@ -1,6 +1,19 @@
-from typing import List, Dict, Any, Tuple
-import pdfplumber, os
+from typing import List, Dict, Any, Tuple, Iterator
+import os, json
+from concurrent.futures import ProcessPoolExecutor
 from .utils.parser import clean_whitespace, dehyphenate, parse_company_year_from_filename
+from .utils.hashing import file_sha256
+from .utils.lazy import timed_import
+from .utils.constants import PDF_ENGINE
+
+
+PAGE_SHARDS_PER_WORKER = 4
+PDF_ENGINES = ("pdfium", "pdfplumber")
+# Bump an engine's version whenever its page output changes, so cached page artifacts are re-parsed.
+EXTRACTOR_VERSIONS = {"pdfium": "pdfium-1", "pdfplumber": "pdfplumber-1"}
+RULE_MIN_LENGTH = 3.0  # pdfplumber's default edge_min_length, in points
+TABLE_MIN_EDGES = 2
+PAGE_COVER = 0.9  # share of the page area above which a box is a background, not a table
 
 
 def _table_to_markdown(table: List[List[str]]) -> str:
@@ -33,50 +46,315 @@ def _table_to_markdown(table: List[List[str]]) -> str:
     return "\n".join(md)
 
 
-def extract_pdf_to_markdown(pdf_path: str) -> Tuple[str, List[Dict[str, Any]]]:
+def _plumber_tables(page) -> List[str]:
+    """Markdown for the non-empty tables pdfplumber finds on a page."""
+    try:
+        tables = page.extract_tables() or []
+    except Exception:
+        tables = []
+    tables_md: List[str] = []
+    for tbl in tables:
+        md = _table_to_markdown(tbl)
+        if md.strip():
+            tables_md.append(md)
+    return tables_md
+
+
+def _page_record(i: int, text: str, tables_md: List[str]) -> Dict[str, Any]:
+    text = dehyphenate(clean_whitespace(text))
+
+    # combine: text + markdown tables
+    combined = text
+    for idx, md in enumerate(tables_md, start=1):
+        combined += f"\n\n**Table p{i}_{idx}**\n\n{md}\n"
+
+    return {"page": i, "text": combined, "tables": tables_md}
+
+
+def table_likely(page) -> bool:
+    """Cheap test run on a pdfium page before table extraction. pdfplumber's default ("lines")
+    table finder builds cells from intersecting ruling lines, so a page needs at least two
+    horizontal and two vertical rules to yield a table. Rules are counted from the bounding
+    boxes of the page's path objects, the way pdfplumber derives table edges: a thin path is one
+    rule, anything larger contributes the four sides of its box. Paths are clipped to the page,
+    and boxes covering most of it (backgrounds, page frames) are ignored."""
+    path_type = timed_import("pypdfium2").raw.FPDF_PAGEOBJ_PATH
+    page_w, page_h = page.get_size()
+    h = v = 0
+    for obj in page.get_objects(filter=(path_type,)):
+        # get_bounds() in pypdfium2 5.x, get_pos() in 4.x.
+        left, bottom, right, top = obj.get_bounds() if hasattr(obj, "get_bounds") else obj.get_pos()
+        w = min(right, page_w) - max(left, 0.0)
+        ht = min(top, page_h) - max(bottom, 0.0)
+        if w < 0 or ht < 0 or w * ht >= PAGE_COVER * page_w * page_h:
+            continue
+        wide, tall = w >= RULE_MIN_LENGTH, ht >= RULE_MIN_LENGTH
+        if wide and tall:
+            h, v = h + 2, v + 2
+        elif wide:
+            h += 1
+        elif tall:
+            v += 1
+        if h >= TABLE_MIN_EDGES and v >= TABLE_MIN_EDGES:
+            return True
+    return False
+
+
+class _Engine:
+    """Page extraction backend: `len(engine)` pages, `engine.page(index)` -> page record."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _PlumberEngine(_Engine):
+    """pdfplumber text, with tables looked for on every page."""
+
+    def __init__(self, pdf_path: str):
+        self.pdf = timed_import("pdfplumber").open(pdf_path)
+
+    def __len__(self) -> int:
+        return len(self.pdf.pages)
+
+    def page(self, index: int) -> Dict[str, Any]:
+        page = self.pdf.pages[index]
+        rec = _page_record(index + 1, page.extract_text() or "", _plumber_tables(page))
+        # Releases the page's parsed layout.
+        page.close()
+        return rec
+
+    def close(self):
+        self.pdf.close()
+
+
+class _PdfiumEngine(_Engine):
+    """pypdfium2 text, which skips pdfplumber's layout analysis (most of its run time). Pages that
+    pass `table_likely` are parsed by pdfplumber instead, for their tables and their text: pdfium
+    emits text in content-stream order, which splits the column headers of financial tables."""
+
+    def __init__(self, pdf_path: str):
+        self.pdf_path = pdf_path
+        self.doc = timed_import("pypdfium2").PdfDocument(pdf_path)
+        self.plumber = None
+        self.table_pages = 0  # pages handed to pdfplumber
+
+    def __len__(self) -> int:
+        return len(self.doc)
+
+    def page(self, index: int) -> Dict[str, Any]:
+        page = self.doc[index]
+        try:
+            if not table_likely(page):
+                textpage = page.get_textpage()
+                # pdfium returns U+FFFE for hyphens it treats as soft ("long\ufffeterm").
+                text = textpage.get_text_range().replace("\ufffe", "-")
+                textpage.close()
+                return _page_record(index + 1, text, [])
+        finally:
+            page.close()
+        if self.plumber is None:
+            self.plumber = _PlumberEngine(self.pdf_path)
+        self.table_pages += 1
+        return self.plumber.page(index)
+
+    def close(self):
+        if self.plumber is not None:
+            self.plumber.close()
+        self.doc.close()
+
+
+_ENGINES = {"pdfium": _PdfiumEngine, "pdfplumber": _PlumberEngine}
+
+
+def open_engine(pdf_path: str, engine: str = PDF_ENGINE) -> _Engine:
+    if engine not in _ENGINES:
+        raise ValueError(f"engine must be one of {PDF_ENGINES}, got {engine!r}")
+    return _ENGINES[engine](pdf_path)
+
+
+def _iter_page_range(pdf_path: str, start: int = 0, end: int | None = None,
+                     engine: str = PDF_ENGINE) -> Iterator[Dict[str, Any]]:
+    """Yields pages [start, end) (0-based); page numbers in the records stay 1-based and absolute.
+    Each page's parsed layout is released once its record is built."""
+    with open_engine(pdf_path, engine) as eng:
+        for index in range(start, len(eng) if end is None else min(end, len(eng))):
+            yield eng.page(index)
+
+
+def _extract_page_range(pdf_path: str, start: int = 0, end: int | None = None,
+                        engine: str = PDF_ENGINE) -> List[Dict[str, Any]]:
+    return list(_iter_page_range(pdf_path, start, end, engine))
+
+
+def _page_count(pdf_path: str, engine: str = PDF_ENGINE) -> int:
+    with open_engine(pdf_path, engine) as eng:
+        return len(eng)
+
+
+def _page_ranges(n_pages: int, n_shards: int) -> List[Tuple[int, int]]:
+    n_shards = max(1, min(n_shards, n_pages))
+    size, rem = divmod(n_pages, n_shards)
+    ranges, start = [], 0
+    for s in range(n_shards):
+        end = start + size + (1 if s < rem else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _records_to_markdown(page_records: List[Dict[str, Any]]) -> str:
+    parts = [f"\n\n# [Page {rec['page']}]\n\n" + rec["text"] for rec in page_records]
+    return ("\n".join(parts)).strip()
+
+
+class _MarkdownWriter:
+    """Writes `_records_to_markdown` output one page at a time, byte-identical to the batch version:
+    trailing whitespace of the last written page is held back until another page follows."""
+
+    def __init__(self, f):
+        self.f = f
+        self.first = True
+        self.tail = ""
+
+    def write(self, rec: Dict[str, Any]):
+        part = f"\n\n# [Page {rec['page']}]\n\n" + rec["text"]
+        if self.first:
+            part, self.first = part.lstrip(), False
+        else:
+            part = self.tail + "\n" + part
+        body = part.rstrip()
+        self.tail = part[len(body):]
+        self.f.write(body)
+
+
+def iter_pdf_pages(pdf_path: str, workers: int = 1, engine: str = PDF_ENGINE) -> Iterator[Dict[str, Any]]:
+    """Page records in page order, as they are extracted. Serially, only the current page is held
+    in memory. With workers > 1 the pages are split into contiguous ranges extracted in a
+    process pool and yielded range by range."""
+    if workers <= 1:
+        yield from _iter_page_range(pdf_path, engine=engine)
+        return
+    # A few shards per worker evens out ranges that are heavy on tables.
+    ranges = _page_ranges(_page_count(pdf_path, engine), workers * PAGE_SHARDS_PER_WORKER)
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        shards = ex.map(_extract_page_range, [pdf_path] * len(ranges),
+                        [r[0] for r in ranges], [r[1] for r in ranges], [engine] * len(ranges))
+        for shard in shards:
+            yield from shard
+
+
+def extract_pdf_to_markdown(pdf_path: str, workers: int = 1, engine: str = PDF_ENGINE) -> Tuple[str, List[Dict[str, Any]]]:
     """Returns (full_markdown_text, page_records).
     Each page_record: {page: int, text: str, tables: [markdown_str, ...]}
     And we inline tables after the page's text with headings "**Table p{page}_{i}**".
+    With workers > 1 the pages are split into contiguous ranges extracted in a process pool;
+    the result is identical to the serial path. `engine` selects the backend: "pdfium" (fast
+    text, tables only on pages with ruling lines) or "pdfplumber" (tables tried on every page).
     """
-    page_records: List[Dict[str, Any]] = []
-    parts: List[str] = []
-
-    with pdfplumber.open(pdf_path) as pdf:
-        for i, page in enumerate(pdf.pages, start=1):
-            text = page.extract_text() or ""
-            text = dehyphenate(clean_whitespace(text))
-
-            # tables
-            tables_md: List[str] = []
-            try:
-                tables = page.extract_tables() or []
-            except Exception:
-                tables = []
-            tcount = 0
-            for tbl in tables:
-                md = _table_to_markdown(tbl)
-                if md.strip():
-                    tcount += 1
-                    tables_md.append(md)
-
-            # combine: text + markdown tables
-            combined = text
-            for idx, md in enumerate(tables_md, start=1):
-                combined += f"\n\n**Table p{i}_{idx}**\n\n{md}\n"
-
-            page_records.append({"page": i, "text": combined, "tables": tables_md})
-            parts.append(f"\n\n# [Page {i}]\n\n" + combined)
-
-    full_markdown = ("\n".join(parts)).strip()
-    return full_markdown, page_records
-
-
-def persist_markdown(pdf_path: str, out_dir: str) -> Dict[str, Any]:
+    page_records = list(iter_pdf_pages(pdf_path, workers=workers, engine=engine))
+    return _records_to_markdown(page_records), page_records
+
+
+def _page_artifact_path(pdf_path: str, out_dir: str) -> str:
+    base = os.path.splitext(os.path.basename(pdf_path))[0]
+    return os.path.join(out_dir, base + ".pages.jsonl")
+
+
+def _artifact_header(pdf_sha: str, engine: str) -> str:
+    return json.dumps({"pdf_sha256": pdf_sha, "extractor_version": EXTRACTOR_VERSIONS[engine]}) + "\n"
+
+
+def write_page_artifact(path: str, pdf_sha: str, page_records: List[Dict[str, Any]], engine: str = PDF_ENGINE):
+    """JSONL: a header line {pdf_sha256, extractor_version} followed by one page record per line.
+    Written to a temp file and renamed, so a present artifact is always complete."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(_artifact_header(pdf_sha, engine))
+        for rec in page_records:
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+
+
+def _page_artifact_valid(path: str, pdf_sha: str, engine: str = PDF_ENGINE) -> bool:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            header = json.loads(f.readline() or "{}")
+    except (OSError, ValueError):
+        return False
+    return header.get("pdf_sha256") == pdf_sha and header.get("extractor_version") == EXTRACTOR_VERSIONS[engine]
+
+
+def _iter_page_artifact(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        f.readline()  # header
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def load_page_artifact(path: str, pdf_sha: str, engine: str = PDF_ENGINE) -> List[Dict[str, Any]] | None:
+    """Returns the stored page records if the artifact matches the PDF hash and extractor version."""
+    if not _page_artifact_valid(path, pdf_sha, engine):
+        return None
+    try:
+        return list(_iter_page_artifact(path))
+    except (OSError, ValueError):
+        return None
+
+
+def _stream_artifacts(pdf_path: str, out_path: str, pages_path: str, pdf_sha: str,
+                      from_artifact: bool, workers: int, engine: str) -> Iterator[Dict[str, Any]]:
+    md_tmp = out_path + ".tmp"
+    pages_tmp = None if from_artifact else pages_path + ".tmp"
+    records = (_iter_page_artifact(pages_path) if from_artifact
+               else iter_pdf_pages(pdf_path, workers=workers, engine=engine))
+    try:
+        with open(md_tmp, "w", encoding="utf-8") as md_f, \
+                open(pages_tmp or os.devnull, "w", encoding="utf-8") as pages_f:
+            if pages_tmp:
+                pages_f.write(_artifact_header(pdf_sha, engine))
+            md = _MarkdownWriter(md_f)
+            for rec in records:
+                md.write(rec)
+                if pages_tmp:
+                    pages_f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                yield rec
+    except BaseException:
+        for tmp in (md_tmp, pages_tmp):
+            if tmp and os.path.exists(tmp):
+                os.remove(tmp)
+        raise
+    # Only a fully consumed stream replaces the artifacts.
+    if pages_tmp:
+        os.replace(pages_tmp, pages_path)
+    os.replace(md_tmp, out_path)
+
+
+def stream_markdown(pdf_path: str, out_dir: str, workers: int = 1, pdf_sha: str | None = None,
+                    engine: str = PDF_ENGINE) -> Dict[str, Any]:
+    """Like `persist_markdown`, but `info["pages"]` is an iterator: page records are yielded as
+    they are extracted (or read back from a valid page artifact), and <DOC>.md and
+    <DOC>.pages.jsonl are written page by page. The artifacts are replaced only once the
+    iterator has been consumed to the end."""
     os.makedirs(out_dir, exist_ok=True)
-    md, pages = extract_pdf_to_markdown(pdf_path)
+    pdf_sha = pdf_sha or file_sha256(pdf_path)
     base = os.path.splitext(os.path.basename(pdf_path))[0]
     out_path = os.path.join(out_dir, base + ".md")
-    with open(out_path, "w", encoding="utf-8") as f:
-        f.write(md)
+    pages_path = _page_artifact_path(pdf_path, out_dir)
+    from_artifact = _page_artifact_valid(pages_path, pdf_sha, engine)
     company, year = parse_company_year_from_filename(pdf_path)
-    return {"markdown_path": out_path, "company": company, "year": year, "pages": pages}
+    return {"markdown_path": out_path, "pages_path": pages_path, "from_artifact": from_artifact,
+            "company": company, "year": year,
+            "pages": _stream_artifacts(pdf_path, out_path, pages_path, pdf_sha, from_artifact, workers, engine)}
+
+
+def persist_markdown(pdf_path: str, out_dir: str, workers: int = 1, pdf_sha: str | None = None,
+                     engine: str = PDF_ENGINE) -> Dict[str, Any]:
+    """Extracts a PDF and writes artifacts/processed/<DOC>.md plus <DOC>.pages.jsonl.
+    If a valid page artifact exists for this PDF hash and engine, the PDF is not parsed at all."""
+    info = stream_markdown(pdf_path, out_dir, workers=workers, pdf_sha=pdf_sha, engine=engine)
+    info["pages"] = list(info["pages"])
+    return info
@@ -0,0 +1,233 @@
+import os, time, threading
+from typing import Dict, Any, Optional, Iterator
+from .embed_store import EmbedStore
+from .bge_reranker import BGEReranker
+from .rerank_cache import RerankScoreCache
+from .indexer import index_version
+from .llm import get_llm, GeminiLLM
+from .llm_cache import LLMResponseCache, CachedLLM
+from .query_engine import run_query, stream_query
+from .fact_store import FactStore
+from .tracing import Trace, append_jsonl, METRICS
+from .batching import MicroBatcher
+from .executor import QueryExecutor
+from .utils.constants import (PERSIST_DIR, DFEAULT_TOP_K, RERANK_PRECISION, RERANK_THREADS, RERANK_CACHE_PATH,
+                              LLM_CACHE_PATH, FACTS_DB_PATH, BM25_INDEX_PATH, VECTOR_BACKEND,
+                              VECTOR_DTYPE, EMBED_DIM, TRACE_ENABLED, TRACE_PATH, METRICS_PATH,
+                              BATCH_MAX_WAIT_MS, EMBED_MAX_BATCH, RERANK_MAX_BATCH, QUERY_WORKERS,
+                              EVIDENCE_TOKEN_BUDGET)
+
+
+class RAGPipeline:
+    """Long-lived query service.
+    Loads the embedder/Chroma client, the cross-encoder reranker and the LLM client once
+    and reuses them for every question asked through `ask`.
+    """
+
+    def __init__(self, persist_dir: str = PERSIST_DIR,
+                 rerank_precision: str = RERANK_PRECISION,
+                 rerank_threads: int | None = RERANK_THREADS,
+                 rerank_cache_path: str | None = RERANK_CACHE_PATH,
+                 llm=None,
+                 llm_cache_path: str | None = LLM_CACHE_PATH,
+                 facts_path: str = FACTS_DB_PATH,
+                 lexical_path: str = BM25_INDEX_PATH,
+                 backend: str = VECTOR_BACKEND,
+                 vector_dtype: str = VECTOR_DTYPE,
+                 embed_dim: int | None = EMBED_DIM,
+                 trace: bool = TRACE_ENABLED,
+                 query_workers: int = QUERY_WORKERS,
+                 stage_timeouts: Dict[str, float | None] | None = None,
+                 evidence_budget: int = EVIDENCE_TOKEN_BUDGET):
+        self.persist_dir = persist_dir
+        self.backend = backend
+        self.vector_dtype = vector_dtype
+        self.embed_dim = embed_dim
+        # Per-question spans go to TRACE_PATH and the response's `timings`; metrics to METRICS_PATH on close.
+        self.trace = trace
+        self.facts_path = facts_path
+        self.lexical_path = lexical_path
+        self.llm_cache_path = llm_cache_path
+        self.rerank_cache_path = rerank_cache_path
+        self.rerank_precision = rerank_precision
+        self.rerank_threads = rerank_threads
+        self.store: Optional[EmbedStore] = None
+        self.reranker: Optional[BGEReranker] = None
+        self.facts: Optional[FactStore] = None
+        # Any object with decompose_query/synthesize (e.g. StubLLM); defaults to Gemini.
+        self.llm: Optional[GeminiLLM] = llm
+        self.batchers: Dict[str, MicroBatcher] = {}
+        # Concurrent sub-query execution; 0 workers answers each question sequentially.
+        self.query_workers = query_workers
+        self.stage_timeouts = stage_timeouts
+        self.executor: Optional[QueryExecutor] = None
+        # Approximate token budget for evidence text in the synthesis prompt; 0 sends whole chunks.
+        self.evidence_budget = evidence_budget
+        self.load_timings: Dict[str, float] = {}
+        self._load_lock = threading.Lock()
+        self._ready = threading.Event()
+        self.last_query_seconds: Optional[float] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._ready.is_set()
+
+    def load(self, warmup: bool = True) -> "RAGPipeline":
+        # Under a lock, so `ask` during a background load waits for it instead of loading twice.
+        with self._load_lock:
+            if not self.loaded:
+                self._load(warmup)
+        return self
+
+    def load_in_background(self, warmup: bool = True) -> threading.Thread:
+        """Starts `load` on a daemon thread, so the CLI can show its prompt while models load.
+        The first `ask` waits for it; if it failed, `ask` retries the load and raises its error."""
+        def run():
+            try:
+                self.load(warmup)
+            except Exception as e:
+                print(f"[PIPELINE] Background load failed: {e}")
+
+        thread = threading.Thread(target=run, name="rag-load", daemon=True)
+        thread.start()
+        return thread
+
+    def _load(self, warmup: bool):
+        t_all = time.perf_counter()
+
+        t0 = time.perf_counter()
+        # BM25 and fact indexes are optional: without them retrieval is dense-only / always vector.
+        self.store = EmbedStore(persist_dir=self.persist_dir,
+                                lexical_path=self.lexical_path if os.path.exists(self.lexical_path) else None,
+                                backend=self.backend, vector_dtype=self.vector_dtype,
+                                embed_dim=self.embed_dim)
+        self.facts = FactStore(self.facts_path) if os.path.exists(self.facts_path) else None
+        self.load_timings["embed_store"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        self.reranker = BGEReranker(precision=self.rerank_precision, num_threads=self.rerank_threads)
+        self.reranker.score_cache = RerankScoreCache(self.reranker.model_key, index_version(),
+                                                     path=self.rerank_cache_path)
+        self.load_timings["reranker"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        llm = self.llm or get_llm()
+        if llm is not None:
+            cache = LLMResponseCache(self._llm_namespace(llm), embed_fn=self.store._embed_queries,
+                                     path=self.llm_cache_path)
+            llm = CachedLLM(llm, cache)
+        self.llm = llm
+        self.load_timings["llm"] = time.perf_counter() - t0
+
+        if self.query_workers > 0:
+            self.executor = QueryExecutor(max_workers=self.query_workers, timeouts=self.stage_timeouts)
+
+        if warmup:
+            t0 = time.perf_counter()
+            self.warmup()
+            self.load_timings["warmup"] = time.perf_counter() - t0
+
+        self.load_timings["total"] = time.perf_counter() - t_all
+        parts = ", ".join(f"{k}={v:.2f}s" for k, v in self.load_timings.items())
+        print(f"[PIPELINE] Loaded in {self.load_timings['total']:.2f}s ({parts})")
+        self._ready.set()
+
+    @staticmethod
+    def _llm_namespace(llm) -> str:
+        return f"{getattr(llm, 'model_name', type(llm).__name__)}@{index_version()}"
+
+    def warmup(self):
+        # One dummy forward pass each so the first real question doesn't pay for lazy init.
+        self.store._embed_query("warmup")
+        self.reranker.score_pairs([("warmup", "warmup")])
+
+    def enable_batching(self, max_wait_ms: float = BATCH_MAX_WAIT_MS, embed_batch: int = EMBED_MAX_BATCH,
+                        rerank_batch: int = RERANK_MAX_BATCH) -> "RAGPipeline":
+        """Routes query embeddings and rerank pairs through shared micro-batchers, so concurrent
+        `ask` calls (e.g. from the server's worker threads) share forward passes."""
+        if not self.loaded:
+            self.load()
+        if not self.batchers:
+            self.batchers["embed"] = MicroBatcher(lambda texts: list(self.store._encode_queries(texts)),
+                                                  max_batch=embed_batch, max_wait_ms=max_wait_ms, name="embed")
+            self.batchers["rerank"] = MicroBatcher(self.reranker._score_pairs, max_batch=rerank_batch,
+                                                   max_wait_ms=max_wait_ms, name="rerank")
+            self.store.query_batcher = self.batchers["embed"]
+            self.reranker.batcher = self.batchers["rerank"]
+        return self
+
+    def _begin_query(self, query: str):
+        if not self.loaded:
+            self.load()
+        # Scores are only reusable against the index they were computed on.
+        self.reranker.score_cache.set_index_version(index_version())
+        if isinstance(self.llm, CachedLLM):
+            self.llm.cache.set_namespace(self._llm_namespace(self.llm))
+        return Trace("query", query=query) if self.trace else None
+
+    def ask(self, query: str, k: int = DFEAULT_TOP_K) -> Dict[str, Any]:
+        trace = self._begin_query(query)
+        t0 = time.perf_counter()
+        resp = run_query(query, self.store, k=k, reranker=self.reranker, llm=self.llm, facts=self.facts,
+                         trace=trace or False, executor=self.executor,
+                         evidence_budget=self.evidence_budget)
+        self._end_query(resp, trace, time.perf_counter() - t0)
+        return resp
+
+    def ask_stream(self, query: str, k: int = DFEAULT_TOP_K) -> Iterator[Dict[str, Any]]:
+        """`ask` as the event stream of `query_engine.stream_query` (sources, answer tokens, done).
+        Wrap it in `streaming.aiterate` for an async iterator."""
+        trace = self._begin_query(query)
+        t0 = time.perf_counter()
+        resp = None
+        for event in stream_query(query, self.store, k=k, reranker=self.reranker, llm=self.llm, facts=self.facts,
+                                  trace=trace or False, executor=self.executor,
+                                  evidence_budget=self.evidence_budget):
+            if event["event"] == "done":
+                resp = event["response"]
+            yield event
+        self._end_query(resp, trace, time.perf_counter() - t0)
+
+    def _end_query(self, resp: Dict[str, Any], trace: Optional[Trace], seconds: float):
+        self.last_query_seconds = seconds
+        print(f"[PIPELINE] Answered in {self.last_query_seconds:.2f}s")
+        if resp.get("ttft_seconds") is not None:
+            print(f"[PIPELINE] First answer token after {resp['ttft_seconds']:.2f}s")
+        if resp.get("partial"):
+            print(f"[PIPELINE] Partial answer, timed out: {', '.join(resp['timed_out'])}")
+        if trace is not None:
+            append_jsonl(trace, TRACE_PATH)
+            print("[TRACE] " + ", ".join(f"{name}={sec:.3f}s" for name, sec in trace.stages().items()))
+        ev = resp.get("evidence_tokens")
+        if ev:
+            print(f"[EVIDENCE] tokens {ev['tokens_before']} -> {ev['tokens_after']} "
+                  f"(saved {ev['tokens_saved']}, rows dropped {ev['rows_dropped']})")
+        # Per-question counts come from the response; cache hit rates are session-wide.
+        rs, cs = resp.get("stats", {}).get("rerank"), self.reranker.score_cache.stats()
+        if rs:
+            print(f"[RERANK] pairs={rs['pairs']} unique={rs['unique_pairs']} cache_hits={rs['cache_hits']} "
+                  f"scored={rs['scored']} (session hit rate {cs['hit_rate']:.1%})")
+        if isinstance(self.llm, CachedLLM):
+            ls = self.llm.cache.stats()
+            print(f"[LLM CACHE] session exact={ls['exact_hits']} semantic={ls['semantic_hits']} "
+                  f"misses={ls['misses']} (hit rate {ls['hit_rate']:.1%})")
+
+    def close(self):
+        """Persists caches; call once at the end of the session."""
+        # Let a background load finish first, so nothing it creates outlives the session.
+        with self._load_lock:
+            pass
+        for b in self.batchers.values():
+            b.close()
+        if self.batchers:
+            self.store.query_batcher = self.reranker.batcher = None
+            self.batchers = {}
+        if self.executor is not None:
+            self.executor.close()
+            self.executor = None
+        if self.reranker is not None and self.reranker.score_cache is not None:
+            self.reranker.score_cache.save()
+        if isinstance(self.llm, CachedLLM):
+            self.llm.cache.save()
+        if self.trace:
+            METRICS.write(METRICS_PATH)
@@ -0,0 +1,111 @@
+import re
+from typing import Dict, List, Any, Tuple, Optional
+from .utils.parser import COMPANY_ALIASES, COMPANY_LIST, METRIC_PATTERNS
+
+
+# Display names used in sub-queries, matching what GeminiLLM.decompose_query emits.
+COMPANY_DISPLAY = {"GOOGL": "Google", "MSFT": "Microsoft", "NVDA": "NVIDIA"}
+
+# Phrases that name a METRIC_PATTERNS metric; longest phrase wins.
+METRIC_SYNONYMS = {
+    "operating margin": ["operating margin", "operating margins"],
+    "gross margin": ["gross margin", "gross margins"],
+    "cloud revenue": ["cloud revenue", "cloud revenues", "cloud sales", "azure revenue", "google cloud revenue"],
+    "data center revenue": ["data center revenue", "data center revenues", "data center sales", "datacenter revenue"],
+    "total revenue": ["total revenue", "total revenues", "revenue", "revenues", "net sales", "sales"],
+}
+
+COMPARE_WORDS = {"highest", "lowest", "most", "least", "largest", "smallest", "biggest", "best", "worst",
+                 "compare", "comparison", "higher", "lower", "versus", "vs", "which"}
+GROWTH_WORDS = {"growth", "grow", "grew", "change", "changed", "increase", "increased", "decrease",
+                "decreased", "yoy", "year-over-year", "year-on-year", "rate", "rates"}
+FILLER_WORDS = {"what", "was", "were", "is", "are", "the", "a", "an", "of", "in", "for", "to", "and", "did",
+                "does", "do", "how", "much", "its", "their", "s", "company", "companies", "fiscal", "year",
+                "fy", "by", "between", "among", "across", "each", "over", "had", "has", "have", "all", "three",
+                "report", "reported", "on", "at", "with", "from"}
+
+# Each unexplained content word lowers confidence; one is enough to fall below
+# PLANNER_MIN_CONFIDENCE (0.8), so the LLM handles anything off-template.
+UNKNOWN_WORD_PENALTY = 0.25
+# Words either side of the metric phrase checked for qualifiers ("cost of revenues").
+METRIC_CONTEXT_WORDS = 2
+
+
+def _find_companies(low: str) -> List[str]:
+    found = []
+    for alias, canon in COMPANY_ALIASES.items():
+        if re.search(r"\b" + alias.lower(), low) and canon not in found:
+            found.append(canon)
+    return [c for c in COMPANY_LIST if c in found]
+
+
+def _find_metric(low: str) -> Tuple[Optional[str], Optional[str]]:
+    best = (None, None)
+    for key, _, _ in METRIC_PATTERNS:
+        for phrase in METRIC_SYNONYMS.get(key, [key]):
+            if re.search(r"\b" + re.escape(phrase) + r"\b", low):
+                if best[1] is None or len(phrase) > len(best[1]):
+                    best = (key, phrase)
+    return best
+
+
+def local_plan(query: str) -> Tuple[Optional[Dict[str, Any]], float]:
+    """Deterministic planner for templated questions.
+    Recognizes direct_metric, compare_metric_one_year and yoy_growth and returns
+    ({intent, sub_queries}, confidence), or (None, 0.0) when the question is off-template.
+    """
+    low = query.lower().replace("’", "'")
+    companies = _find_companies(low)
+    metric, phrase = _find_metric(low)
+    years = sorted(set(re.findall(r"\b(20\d{2})\b", low)))
+    if not metric or not years:
+        return None, 0.0
+
+    known = COMPARE_WORDS | GROWTH_WORDS | FILLER_WORDS | {a.lower() for a in COMPANY_ALIASES}
+
+    def is_unknown(w: str) -> bool:
+        return w.strip("'-") not in known and w.split("'")[0] not in known
+
+    # A generic phrase such as "revenue" only names the metric when nothing qualifies it:
+    # "advertising revenue", "cost of revenues" or "non-GAAP gross margin" are other metrics.
+    m = re.search(r"\b" + re.escape(phrase) + r"\b", low)
+    before = re.findall(r"[a-z][a-z\-']*", low[:m.start()])[-METRIC_CONTEXT_WORDS:]
+    after = re.findall(r"[a-z][a-z\-']*", low[m.end():])[:METRIC_CONTEXT_WORDS]
+    if any(is_unknown(w) for w in before + after):
+        return None, 0.0
+
+    words = re.findall(r"[a-z][a-z\-']*", low.replace(phrase, " "))
+    is_compare = any(w in COMPARE_WORDS for w in words)
+    is_growth = any(w in GROWTH_WORDS for w in words)
+
+    if is_growth and len(years) <= 2:
+        intent = "yoy_growth"
+        if len(years) == 1:
+            years = [str(int(years[0]) - 1), years[0]]
+        if not companies:
+            if not (is_compare or {"each", "all"} & set(words)):
+                return None, 0.0
+            companies = list(COMPANY_LIST)
+    elif is_compare and len(years) == 1:
+        # Comparisons always cover every company, even if the question names one.
+        intent = "compare_metric_one_year"
+        companies = list(COMPANY_LIST)
+    elif companies and len(years) == 1 and not is_compare:
+        intent = "direct_metric"
+    else:
+        return None, 0.0
+
+    unknown = [w for w in words if is_unknown(w)]
+    confidence = max(0.0, 1.0 - UNKNOWN_WORD_PENALTY * len(unknown))
+
+    sub_queries = [f"{COMPANY_DISPLAY[c]} {metric} {y}" for c in companies for y in years]
+    return {"intent": intent, "sub_queries": sub_queries}, confidence
+
+
+def parse_sub_query(sq: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """(company, metric_key, year) of a '<company> <metric> <year>' sub-query; None where absent."""
+    low = sq.lower()
+    companies = _find_companies(low)
+    metric, _ = _find_metric(low)
+    years = re.findall(r"\b(20\d{2})\b", low)
+    return (companies[0] if len(companies) == 1 else None), metric, (years[0] if len(years) == 1 else None)
@@ -1,51 +1,20 @@
-import re, math
-from typing import Dict, List, Any
+import re, sys, math, time
+from typing import Dict, List, Any, Iterator
 from .embed_store import EmbedStore
-from .utils.parser import COMPANY_ALIASES, COMPANY_LIST
-from .utils.constants import RERANK_TOP_K
-from .llm import get_llm
+from .utils.parser import COMPANY_ALIASES, COMPANY_LIST, METRIC_PATTERNS, find_metric_value
+from .utils.constants import (RERANK_TOP_K, PLANNER_MIN_CONFIDENCE, HYBRID_RERANK_K, TRACE_ENABLED,
+                              EVIDENCE_TOKEN_BUDGET)
+from .planner import local_plan, parse_sub_query
+from .fact_store import FactStore
+from .llm import get_llm, GeminiLLM, parse_synthesis
 from .bge_reranker import BGEReranker
+from .evidence import pack_evidence
+from .streaming import AnswerStream, synthesize_stream
+from .tracing import Trace, activate, span, trace_context, METRICS
 
 
-METRIC_PATTERNS = [
-    # (metric_key, regex pattern, value_kind)
-    ("operating margin", r"operating margin[^\d%]*([0-9]{1,3}(?:\.[0-9]+)?)\s*%", "percent"),
-    ("gross margin",     r"gross margin[^\d%]*([0-9]{1,3}(?:\.[0-9]+)?)\s*%", "percent"),
-    ("cloud revenue",    r"(?:cloud|google cloud|microsoft cloud|azure|gcp)[^\$\d%]{0,40}(\$?[\d,\.]+)\s*(billion|million|thousand|bn|m|k)?", "money"),
-    ("data center revenue", r"data\s*center[^\$\d%]{0,40}(\$?[\d,\.]+)\s*(billion|million|thousand|bn|m|k)?", "money"),
-    ("total revenue",    r"total\s+revenue[^\$\d%]{0,40}(\$?[\d,\.]+)\s*(billion|million|thousand|bn|m|k)?", "money"),
-]
-
-UNIT_MULT = {
-    None: 1.0,
-    "billion": 1e9, "bn": 1e9,
-    "million": 1e6, "m": 1e6,
-    "thousand": 1e3, "k": 1e3,
-}
-
-def _money_to_float(val: str, unit: str) -> float:
-    v = val.replace("$","").replace(",","")
-    try:
-        x = float(v)
-    except:
-        return float("nan")
-    mult = UNIT_MULT.get(unit.lower() if unit else None, 1.0)
-    return x * mult
-
-
-def _find_metric_value(text: str, metric_key: str):
-    for key, pattern, kind in METRIC_PATTERNS:
-        if key == metric_key:
-            m = re.search(pattern, text, flags=re.I)
-            if not m:
-                continue
-            if kind == "percent":
-                value = float(m.group(1))
-                return {"kind": "percent", "value": value}
-            if kind == "money":
-                value = _money_to_float(m.group(1), m.group(2) if len(m.groups())>1 else None)
-                return {"kind": "money", "value": value}
-    return None
+# Intents whose sub-queries are all "<company> <metric> <year>" lookups.
+FACT_INTENTS = {"direct_metric", "compare_metric_one_year", "yoy_growth"}
 
 
 def _build_where(company_filter: List[str] | None, years: List[str] | None):
@@ -65,66 +34,195 @@ def _build_where(company_filter: List[str] | None, years: List[str] | None):
     return {"$and": clauses}
 
 
-def run_query(query: str, store: EmbedStore, k: int = 10) -> Dict[str, Any]:
-    llm = get_llm()
+def _subquery_where(query: str, sq: str) -> dict | None:
+    orig_q = sq.lower()
+    company_filter = []
+    if "google" in orig_q or "googl" in orig_q or "alphabet" in orig_q:
+        company_filter.append("GOOGL")
+    elif "microsoft" in orig_q or "msft" in orig_q:
+        company_filter.append("MSFT")
+    elif "nvidia" in orig_q or "nvda" in orig_q:
+        company_filter.append("NVDA")
+
+    years_in_q = re.findall(r"(20\d{2})", query)
+    return _build_where(company_filter, years_in_q)
+
+
+def _candidates(subqs: List[str], wheres: List[dict | None], store: EmbedStore, k: int) -> List[List[Dict[str, Any]]]:
+    # One embedding pass for all sub-queries; sub-queries with the same filter share a Chroma call.
+    if store.lexical is not None:
+        # Dense and BM25 top-k fused by RRF; the reranker only sees the fused head.
+        return store.hybrid_query_many(subqs, HYBRID_RERANK_K, wheres=wheres, fetch_k=k)
+    return store.query_many(subqs, k, wheres=wheres)
+
+
+def _evidence_rows(sq: str, top_hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    metric_key = None
+    sql = sq.lower()
+    for key, _, _ in METRIC_PATTERNS:
+        if key in sql:
+            metric_key = key
+            break
+
+    rows = []
+    for hit in top_hits:
+        company = (hit.get("company") if hit else None)
+        year = (hit.get("year") if hit else None)
+        page = hit.get("page_start") if hit else None
+
+        value = None
+        if hit and metric_key:
+            value = find_metric_value(hit["text"], metric_key)
+
+        rows.append({
+            "sub_query": sq,
+            "company": company,
+            "year": year,
+            "page": page,
+            "metric_key": metric_key,
+            "value": value,
+            "excerpt": hit["text"] if hit else None,
+            "raw": hit,
+        })
+    return rows
+
+
+def _retrieve(query: str, subqs: List[str], store: EmbedStore, k: int,
+              reranker: BGEReranker, stats: Dict[str, Any]) -> List[Dict[str, Any]]:
+    wheres = [_subquery_where(query, sq) for sq in subqs]
+    hits_per_sub = _candidates(subqs, wheres, store, k)
+
+    # Rerank and keep only top 3; pairs shared across sub-queries are scored once.
+    with span("rerank") as sp:
+        rerank_stats = stats.setdefault("rerank", {})
+        top_hits_per_sub = reranker.rerank_many(subqs, hits_per_sub, top_k=RERANK_TOP_K, stats=rerank_stats)
+        sp.set(**rerank_stats)
+
+    results_per_sub: List[Dict[str, Any]] = []
+    for sq, top_hits in zip(subqs, top_hits_per_sub):
+        results_per_sub.extend(_evidence_rows(sq, top_hits))
+    return results_per_sub
+
+
+def _rows_from_facts(facts: FactStore, store: EmbedStore, subqs: List[str]) -> List[Dict[str, Any]] | None:
+    """Evidence rows straight from the fact index, or None if any sub-query has no table fact
+    (the caller then falls back to vector retrieval for the whole plan)."""
+    found = []
+    for sq in subqs:
+        company, metric_key, year = parse_sub_query(sq)
+        if not (company and metric_key and year):
+            return None
+        fact = facts.lookup(company, year, metric_key)
+        if fact is None or fact["source"] != "table":
+            return None
+        found.append((sq, metric_key, fact))
+
+    chunks = store.get_chunks([f["chunk_id"] for _, _, f in found if f["chunk_id"]])
+    rows = []
+    for sq, metric_key, fact in found:
+        hit = chunks.get(fact["chunk_id"]) or {"text": fact["raw"], "company": fact["company"],
+                                               "year": fact["year"], "page_start": fact["page"]}
+        rows.append({
+            "sub_query": sq,
+            "company": fact["company"],
+            "year": fact["year"],
+            "page": fact["page"],
+            "metric_key": metric_key,
+            "value": {"kind": fact["kind"], "value": fact["value"]},
+            "excerpt": hit["text"],
+            "raw": hit,
+        })
+    return rows
+
+
+def run_query(query: str, store: EmbedStore, k: int = 10,
+              reranker: BGEReranker | None = None,
+              llm: GeminiLLM | None = None,
+              facts: FactStore | None = None,
+              trace: bool | Trace = TRACE_ENABLED,
+              executor=None,
+              evidence_budget: int = EVIDENCE_TOKEN_BUDGET) -> Dict[str, Any]:
+    """Answers one question. With `trace` (True, or a Trace to record into) the response gets a
+    `timings` field with per-stage seconds and the recorded spans. With an `executor`
+    (`executor.QueryExecutor`) sub-queries are retrieved and reranked concurrently under per-stage
+    timeouts (none by default). `partial` is True when any stage was cut short, in which case
+    the answer may rest on incomplete evidence and the stages are listed in `timed_out`.
+    `stats` holds this question's own counters (e.g. `stats["rerank"]` pairs and cache hits).
+    With an `evidence_budget` (tokens) the evidence is packed before synthesis (see
+    `evidence.pack_evidence`) and the response gets an `evidence_tokens` field; `sources` are
+    always the full excerpts."""
+    trace = Trace("query", query=query) if trace is True else (trace or None)
+    with activate(trace):
+        resp = _run_query(query, store, k, reranker, llm, facts, executor, evidence_budget)
+    if trace is not None:
+        resp["timings"] = trace.to_dict()
+    return resp
+
+
+def _run_query(query: str, store: EmbedStore, k: int, reranker: BGEReranker | None,
+               llm: GeminiLLM | None, facts: FactStore | None, executor=None,
+               evidence_budget: int = EVIDENCE_TOKEN_BUDGET) -> Dict[str, Any]:
+    # Callers that keep models loaded (see RAGPipeline) pass them in; otherwise load per call.
+    llm = llm or get_llm()
     if not llm:
         raise RuntimeError("LLM not available for query decomposition.")
-    plan = llm.decompose_query(query)
+    reranker = reranker or BGEReranker()
+    run = executor.run(query, store, k, reranker) if executor is not None else None
+    stats: Dict[str, Any] = {}
+    try:
+        resp = _answer(query, store, k, reranker, llm, facts, run, evidence_budget, stats)
+    finally:
+        if run is not None:
+            run.close()
+    resp["stats"] = stats
+    resp["partial"] = bool(run is not None and run.timed_out)
+    if resp["partial"]:
+        resp["timed_out"] = run.timed_out
+    return resp
+
+
+def _gather(query: str, store: EmbedStore, k: int, reranker: BGEReranker, llm: GeminiLLM,
+            facts: FactStore | None, run, evidence_budget: int, stats: Dict[str, Any]) -> Dict[str, Any]:
+    """Everything before synthesis: plan, evidence rows, and the packed evidence for the prompt."""
+    # Templated questions are planned locally; only off-template ones cost an LLM round trip.
+    with span("plan") as sp:
+        plan, confidence = local_plan(query)
+        sp.set(local=plan is not None and confidence >= PLANNER_MIN_CONFIDENCE, confidence=confidence)
+    if plan is None or confidence < PLANNER_MIN_CONFIDENCE:
+        with span("decompose"):
+            if run is None:
+                plan = llm.decompose_query(query)
+            else:
+                # The tentative local plan is usually close: retrieve it while the LLM decomposes.
+                if plan is not None:
+                    run.prefetch(plan["sub_queries"])
+                plan = run.decompose(llm, fallback=plan or {"intent": "default", "sub_queries": [query]})
     subqs = plan["sub_queries"]
     intent = plan["intent"]
 
-    reranker = BGEReranker()
-    results_per_sub: List[Dict[str, Any]] = []
-    for sq in subqs:
-        orig_q = sq.lower()
-        company_filter = []
-        if "google" in orig_q or "googl" in orig_q or "alphabet" in orig_q:
-            company_filter.append("GOOGL")
-        elif "microsoft" in orig_q or "msft" in orig_q:
-            company_filter.append("MSFT")
-        elif "nvidia" in orig_q or "nvda" in orig_q:
-            company_filter.append("NVDA")
-
-        years_in_q = re.findall(r"(20\d{2})", query)
-        where = _build_where(company_filter, years_in_q)
-
-        hits = store.query(sq, k, where=where)
-        metric_key = None
-        sql = sq.lower()
-        for key, _, _ in METRIC_PATTERNS:
-            if key in sql:
-                metric_key = key
-                break
-        
-        # Rerank and keep only top 3
-        top_hits = reranker.rerank(sq, hits, top_k=RERANK_TOP_K)  
-        for hit in top_hits:
-            company = (hit.get("company") if hit else None)
-            year = (hit.get("year") if hit else None)
-            page = hit.get("page_start") if hit else None
-            
-            value = None
-            if hit and metric_key:
-                value = _find_metric_value(hit["text"], metric_key)
-            
-            results_per_sub.append({
-                "sub_query": sq,
-                "company": company,
-                "year": year,
-                "page": page,
-                "metric_key": metric_key,
-                "value": value,
-                "excerpt": hit["text"] if hit else None,
-                "raw": hit,
-            })
-    
-    final_answer, final_reasoning = None, None
-    if llm:
-        llm_out = llm.synthesize(query, subqs, results_per_sub)
-        if llm_out and isinstance(llm_out, dict):
-            final_answer = llm_out.get("answer")
-            final_reasoning = llm_out.get("reasoning")
+    # Metric lookups are answered from the ingest-time fact index when every value is there.
+    results_per_sub = None
+    if facts is not None and intent in FACT_INTENTS:
+        with span("fact_lookup", queries=len(subqs)) as sp:
+            results_per_sub = _rows_from_facts(facts, store, subqs)
+            sp.set(hit=results_per_sub is not None)
+    if results_per_sub is None:
+        with span("retrieve", queries=len(subqs)):
+            if run is None:
+                results_per_sub = _retrieve(query, subqs, store, k, reranker, stats)
+            else:
+                results_per_sub = run.retrieve(subqs, stats)
 
+    # Only the sentences/table rows that bear on each sub-query go into the prompt.
+    evidence, packing = results_per_sub, None
+    if evidence_budget:
+        with span("pack_evidence", rows=len(results_per_sub)) as sp:
+            evidence, packing = pack_evidence(results_per_sub, budget=evidence_budget)
+            sp.set(**packing)
+    return {"sub_queries": subqs, "rows": results_per_sub, "evidence": evidence, "packing": packing}
+
+
+def _sources(results_per_sub: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     sources = []
     added = set()
     for r in results_per_sub:
@@ -136,11 +234,106 @@ def run_query(query: str, store: EmbedStore, k: int = 10) -> Dict[str, Any]:
             "page": r["page"],
         })
         added.add(key)
+    return sources
+
 
-    return {
+def _response(query: str, gathered: Dict[str, Any], llm_out) -> Dict[str, Any]:
+    final_answer, final_reasoning = None, None
+    if llm_out and isinstance(llm_out, dict):
+        final_answer = llm_out.get("answer")
+        final_reasoning = llm_out.get("reasoning")
+
+    resp = {
         "query": query,
         "answer": final_answer,
         "reasoning": final_reasoning,
-        "sub_queries": subqs,
-        "sources": sources
-    }
\ No newline at end of file
+        "sub_queries": gathered["sub_queries"],
+        "sources": _sources(gathered["rows"])
+    }
+    if gathered["packing"] is not None:
+        resp["evidence_tokens"] = gathered["packing"]
+    return resp
+
+
+def _synthesize_span(gathered: Dict[str, Any]):
+    evidence = gathered["evidence"]
+    return span("synthesize", rows=len(evidence), evidence_chars=sum(len(r.get("excerpt") or "") for r in evidence))
+
+
+def _answer(query: str, store: EmbedStore, k: int, reranker: BGEReranker, llm: GeminiLLM,
+            facts: FactStore | None, run, evidence_budget: int, stats: Dict[str, Any]) -> Dict[str, Any]:
+    gathered = _gather(query, store, k, reranker, llm, facts, run, evidence_budget, stats)
+    subqs, evidence = gathered["sub_queries"], gathered["evidence"]
+    llm_out = None
+    if llm:
+        with _synthesize_span(gathered):
+            if run is None:
+                llm_out = llm.synthesize(query, subqs, evidence)
+            else:
+                llm_out = run.synthesize(llm, subqs, evidence)
+    return _response(query, gathered, llm_out)
+
+
+def stream_query(query: str, store: EmbedStore, k: int = 10,
+                 reranker: BGEReranker | None = None,
+                 llm: GeminiLLM | None = None,
+                 facts: FactStore | None = None,
+                 trace: bool | Trace = TRACE_ENABLED,
+                 executor=None,
+                 evidence_budget: int = EVIDENCE_TOKEN_BUDGET) -> Iterator[Dict[str, Any]]:
+    """`run_query` as a stream of events:
+
+        {"event": "sources", "query", "sub_queries", "sources"}   as soon as reranking is done
+        {"event": "token", "text"}                                 answer text as the LLM generates it
+        {"event": "done", "response"}                              the full `run_query` response
+
+    The answer is parsed from the complete LLM output at the end, so `done` carries the same
+    `answer`/`reasoning` as `run_query`, plus `ttft_seconds` (question to first answer text),
+    which is also recorded in `METRICS` as the "ttft" stage. Each step runs in the query's own
+    context, so the generator may be advanced from any thread (see `streaming.aiterate`).
+    Synthesis is not bound by the executor's synthesize timeout while streaming.
+    """
+    trace = Trace("query", query=query) if trace is True else (trace or None)
+    ctx = trace_context(trace)
+    t0 = time.perf_counter()
+    llm = llm or get_llm()
+    if not llm:
+        raise RuntimeError("LLM not available for query decomposition.")
+    reranker = reranker or BGEReranker()
+    run = executor.run(query, store, k, reranker) if executor is not None else None
+    stats: Dict[str, Any] = {}
+    try:
+        gathered = ctx.run(_gather, query, store, k, reranker, llm, facts, run, evidence_budget, stats)
+        yield {"event": "sources", "query": query, "sub_queries": gathered["sub_queries"],
+               "sources": _sources(gathered["rows"])}
+
+        answer, ttft = AnswerStream(), None
+        sp = ctx.run(_synthesize_span, gathered)
+        ctx.run(sp.__enter__)
+        try:
+            deltas = ctx.run(synthesize_stream, llm, query, gathered["sub_queries"], gathered["evidence"])
+            while True:
+                delta = ctx.run(next, deltas, None)
+                if delta is None:
+                    break
+                text = answer.feed(delta)
+                if text:
+                    if ttft is None:
+                        ttft = time.perf_counter() - t0
+                        METRICS.observe_seconds("ttft", ttft)
+                        sp.set(ttft_seconds=round(ttft, 6))
+                    yield {"event": "token", "text": text}
+        finally:
+            ctx.run(sp.__exit__, *sys.exc_info())
+        resp = _response(query, gathered, parse_synthesis(answer.text) if answer.text else None)
+    finally:
+        if run is not None:
+            run.close()
+    resp["ttft_seconds"] = round(ttft, 6) if ttft is not None else None
+    resp["stats"] = stats
+    resp["partial"] = bool(run is not None and run.timed_out)
+    if resp["partial"]:
+        resp["timed_out"] = run.timed_out
+    if trace is not None:
+        resp["timings"] = trace.to_dict()
+    yield {"event": "done", "response": resp}
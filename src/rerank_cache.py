@@ -0,0 +1,81 @@
+import os, json, re, threading
+from collections import OrderedDict
+from typing import Dict, Tuple, Optional
+from .utils.constants import RERANK_CACHE_MAX_ENTRIES
+
+
+def normalize_query(q: str) -> str:
+    return re.sub(r"\s+", " ", q.lower()).strip(" ?.!")
+
+
+class RerankScoreCache:
+    """LRU cache of cross-encoder scores keyed by (normalized query, chunk ID).
+    Scoped to one reranker configuration (`model_key`) and one index version; a change of
+    either clears it. Optionally persisted as JSON at `path`.
+    """
+
+    def __init__(self, model_key: str, index_version: str | None = None,
+                 path: str | None = None, max_entries: int = RERANK_CACHE_MAX_ENTRIES):
+        self.model_key = model_key
+        self.index_version = index_version
+        self.path = path
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("model_key") == model_key and data.get("index_version") == index_version:
+                    for q, cid, score in data.get("entries", []):
+                        self.entries[(q, cid)] = score
+            except (OSError, ValueError):
+                pass
+
+    def set_index_version(self, index_version: str | None):
+        with self._lock:
+            if index_version != self.index_version:
+                self.entries.clear()
+                self.index_version = index_version
+
+    def get(self, key: Tuple[str, str]) -> Optional[float]:
+        with self._lock:
+            score = self.entries.get(key)
+            if score is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return score
+
+    def put(self, key: Tuple[str, str], score: float):
+        with self._lock:
+            self.entries[key] = score
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock:
+            entries = [[q, cid, s] for (q, cid), s in self.entries.items()]
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "model_key": self.model_key,
+                "index_version": self.index_version,
+                "entries": entries,
+            }, f)
+        os.replace(tmp, self.path)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self.entries),
+        }
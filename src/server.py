@@ -0,0 +1,181 @@
+import json, asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+from .pipeline import RAGPipeline
+from .streaming import aiterate
+from .tracing import METRICS
+from .utils.constants import SERVE_HOST, SERVE_PORT, SERVE_WORKERS, DFEAULT_TOP_K
+
+MAX_BODY_BYTES = 1 << 20
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class RAGServer:
+    """Minimal asyncio HTTP/1.1 front end for a loaded RAGPipeline.
+
+        POST /ask      {"question": "...", "k": 10}  -> run_query response JSON
+        POST /ask/stream  same body -> chunked NDJSON events (sources, answer tokens, done)
+        GET  /health   -> {"status": "ok"}
+        GET  /metrics  -> Prometheus text (stage metrics + batcher stats)
+
+    Each question runs on a worker thread (`workers` at a time), so Gemini round trips overlap.
+    Query embeddings and rerank pairs from concurrent questions meet in the pipeline's
+    micro-batchers (`RAGPipeline.enable_batching`), so the models run a few large forward
+    passes instead of many small ones.
+    """
+
+    def __init__(self, pipeline: RAGPipeline, host: str = SERVE_HOST, port: int = SERVE_PORT,
+                 workers: int = SERVE_WORKERS):
+        self.pipeline = pipeline
+        self.host, self.port = host, port
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-worker")
+        self.server: asyncio.AbstractServer | None = None
+        self.served = self.failed = 0
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Tuple[str, str, bytes]:
+        head = await reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        method, path, _ = lines[0].split(" ", 2)
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise ValueError("payload too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), path.split("?", 1)[0], body
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, body: bytes,
+                       content_type: str = "application/json"):
+        writer.write((f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+                      f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                      f"Connection: close\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    def _metrics(self) -> str:
+        lines = [METRICS.to_prometheus().rstrip("\n"),
+                 "# TYPE rag_server_requests_total counter",
+                 f'rag_server_requests_total{{status="ok"}} {self.served}',
+                 f'rag_server_requests_total{{status="error"}} {self.failed}',
+                 "# TYPE rag_batcher_items_total counter"]
+        stats = {name: b.stats() for name, b in self.pipeline.batchers.items()}
+        lines += [f'rag_batcher_items_total{{batcher="{name}"}} {st["items"]}' for name, st in stats.items()]
+        lines.append("# TYPE rag_batcher_batches_total counter")
+        lines += [f'rag_batcher_batches_total{{batcher="{name}"}} {st["batches"]}' for name, st in stats.items()]
+        return "\n".join(lines) + "\n"
+
+    async def _stream(self, writer: asyncio.StreamWriter, question: str, k: int):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                     b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+        failed = False
+        gen = self.pipeline.ask_stream(question, k)
+        try:
+            async for event in aiterate(gen, self.executor):
+                line = json.dumps(event, ensure_ascii=False).encode("utf-8") + b"\n"
+                writer.write(f"{len(line):x}\r\n".encode("latin-1") + line + b"\r\n")
+                await writer.drain()
+        except (ConnectionResetError, BrokenPipeError):
+            # The client went away; nothing left to send it.
+            self.served += 1
+            return
+        except Exception as e:
+            # Headers are already sent; report the failure as the last event.
+            failed = True
+            line = json.dumps({"event": "error", "error": str(e)}).encode() + b"\n"
+            writer.write(f"{len(line):x}\r\n".encode("latin-1") + line + b"\r\n")
+        finally:
+            # Stops an unfinished answer and releases its query state (see QueryRun.close).
+            try:
+                gen.close()
+            except ValueError:
+                pass  # a step is still running on the executor; it ends with that step
+        try:
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        if failed:
+            self.failed += 1
+        else:
+            self.served += 1
+
+    @staticmethod
+    def _parse_ask(body: bytes) -> Tuple[str, int]:
+        payload = json.loads(body or b"{}")
+        if not isinstance(payload, dict):
+            raise ValueError("expected a JSON object")
+        question = (payload.get("question") or "").strip()
+        if not question:
+            raise ValueError("missing 'question'")
+        return question, int(payload.get("k") or DFEAULT_TOP_K)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            try:
+                method, path, body = await self._read_request(reader)
+            except ValueError as e:
+                await self._respond(writer, 413 if "too large" in str(e) else 400,
+                                    json.dumps({"error": str(e)}).encode())
+                return
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return
+            if path == "/health":
+                await self._respond(writer, 200, b'{"status": "ok"}')
+            elif path == "/metrics":
+                await self._respond(writer, 200, self._metrics().encode(), "text/plain; version=0.0.4")
+            elif path in ("/ask", "/ask/stream"):
+                if method != "POST":
+                    await self._respond(writer, 405, b'{"error": "use POST"}')
+                    return
+                try:
+                    question, k = self._parse_ask(body)
+                except (ValueError, TypeError) as e:
+                    await self._respond(writer, 400, json.dumps({"error": str(e)}).encode())
+                    return
+                if path == "/ask/stream":
+                    await self._stream(writer, question, k)
+                    return
+                try:
+                    loop = asyncio.get_running_loop()
+                    resp = await loop.run_in_executor(self.executor, self.pipeline.ask, question, k)
+                except Exception as e:
+                    self.failed += 1
+                    await self._respond(writer, 500, json.dumps({"error": str(e)}).encode())
+                    return
+                self.served += 1
+                await self._respond(writer, 200, json.dumps(resp, ensure_ascii=False).encode("utf-8"))
+            else:
+                await self._respond(writer, 404, b'{"error": "not found"}')
+        finally:
+            writer.close()
+
+    async def start(self) -> "RAGServer":
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        print(f"[SERVE] Listening on http://{self.host}:{self.port} (POST /ask, POST /ask/stream, GET /health, GET /metrics)")
+        return self
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown(wait=True)
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+
+def serve(pipeline: RAGPipeline, host: str = SERVE_HOST, port: int = SERVE_PORT, workers: int = SERVE_WORKERS):
+    """Blocks serving HTTP until interrupted (Ctrl+C)."""
+    try:
+        asyncio.run(RAGServer(pipeline, host, port, workers).serve_forever())
+    except KeyboardInterrupt:
+        print("\n[SERVE] Stopped.")
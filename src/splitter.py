@@ -1,16 +1,106 @@
-from typing import List, Dict, Any
-from transformers import AutoTokenizer
-from .utils.constants import DEFAULT_EMBEDDING_MODEL
+from functools import lru_cache
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Iterator
+from .utils.constants import DEFAULT_EMBEDDING_MODEL, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, CHUNK_PAGE_BATCH
+from .utils.lazy import timed_import
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model_name: str = DEFAULT_EMBEDDING_MODEL):
+    """Process-level tokenizer cache: loaded once per model, not once per PDF."""
+    return timed_import("transformers").AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
+
+
+def iter_chunks(pages: Iterable[Dict[str, Any]],
+                model_name: str = DEFAULT_EMBEDDING_MODEL,
+                chunk_tokens: int = CHUNK_TOKENS,
+                overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                page_batch: int = CHUNK_PAGE_BATCH) -> Iterator[Dict[str, Any]]:
+    """Token-aware chunker across page records, yielding {text, page_start, page_end} chunks as
+    soon as they are complete. `pages` may be any iterable: it is consumed `page_batch` pages at
+    a time (one tokenizer call per group), so only those pages and the chunk being built are in
+    memory. Chunk text is sliced out of the page string by character offsets, so nothing is
+    decoded back from token IDs.
+    """
+    tok = get_tokenizer(model_name)
+    if not getattr(tok, "is_fast", False):
+        # Offset mappings need a fast (Rust) tokenizer.
+        yield from _chunk_markdown_pages_decode(pages, model_name, chunk_tokens, overlap_tokens)
+        return
+
+    buf = []
+    buf_tokens = 0
+    page_start = None
+    last_page = None
+
+    def flush(end_page):
+        nonlocal buf, buf_tokens, page_start
+        text = "\n".join(buf).strip() if buf else ""
+        chunk = {"text": text, "page_start": page_start, "page_end": end_page} if text else None
+        buf, buf_tokens, page_start = [], 0, None
+        return chunk
+
+    pages = iter(pages)
+    while True:
+        group = list(islice(pages, page_batch))
+        if not group:
+            break
+        last_page = group[-1]["page"]
+        parts = [(rec["page"], rec["text"].strip()) for rec in group]
+        parts = [(page, part) for page, part in parts if part]
+        if not parts:
+            continue
+        enc = tok([part for _, part in parts], add_special_tokens=False, return_offsets_mapping=True)
+
+        for (current_page, part), offsets in zip(parts, enc["offset_mapping"]):
+            n = len(offsets)
+            i = 0
+            while i < n:
+                space_left = chunk_tokens - buf_tokens
+                take = min(space_left, n - i)
+
+                piece = part[offsets[i][0]:offsets[i + take - 1][1]]
+                if page_start is None:
+                    page_start = current_page
+                buf.append(piece)
+                buf_tokens += take
+                i += take
+
+                if buf_tokens >= chunk_tokens:
+                    # flush and create overlap from end
+                    chunk = flush(current_page)
+                    if chunk:
+                        yield chunk
+                    # overlap: re-seed buffer with tail
+                    tail_start = max(0, i - overlap_tokens)
+                    if tail_start < i:
+                        buf = [part[offsets[tail_start][0]:offsets[i - 1][1]]]
+                        buf_tokens = i - tail_start
+                        page_start = current_page
+
+    # final flush
+    chunk = flush(last_page)
+    if chunk:
+        yield chunk
 
 
 def chunk_markdown_pages(pages: List[Dict[str, Any]],
                          model_name: str = DEFAULT_EMBEDDING_MODEL,
-                         chunk_tokens: int = 900,
-                         overlap_tokens: int = 100):
+                         chunk_tokens: int = CHUNK_TOKENS,
+                         overlap_tokens: int = CHUNK_OVERLAP_TOKENS):
     """Token-aware chunker across page records.
-    Returns list of dicts: {text, page_start, page_end}
+    Returns list of dicts: {text, page_start, page_end}; see `iter_chunks`.
     """
-    tok = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
+    return list(iter_chunks(pages, model_name, chunk_tokens, overlap_tokens))
+
+
+def _chunk_markdown_pages_decode(pages: Iterable[Dict[str, Any]],
+                                 model_name: str = DEFAULT_EMBEDDING_MODEL,
+                                 chunk_tokens: int = CHUNK_TOKENS,
+                                 overlap_tokens: int = CHUNK_OVERLAP_TOKENS):
+    """Original per-page encode/decode chunker. Fallback for slow tokenizers and the
+    reference implementation for benchmarks/bench_chunker.py."""
+    tok = get_tokenizer(model_name)
     chunks = []
     buf = []
     buf_tokens = 0
@@ -32,12 +122,12 @@ def chunk_markdown_pages(pages: List[Dict[str, Any]],
         if not part:
             continue
         tokens = tok.encode(part, add_special_tokens=False)
-        
+
         i = 0
         while i < len(tokens):
             space_left = chunk_tokens - buf_tokens
             take = min(space_left, len(tokens) - i)
-            
+
             # Decode token slice to text and append
             piece = tok.decode(tokens[i:i+take])
             if page_start is None:
@@ -45,7 +135,7 @@ def chunk_markdown_pages(pages: List[Dict[str, Any]],
             buf.append(piece)
             buf_tokens += take
             i += take
-            
+
             if buf_tokens >= chunk_tokens:
                 # flush and create overlap from end
                 flush(current_page)
@@ -56,7 +146,7 @@ def chunk_markdown_pages(pages: List[Dict[str, Any]],
                     buf = [tail_text]
                     buf_tokens = len(tail_tokens)
                     page_start = current_page
-    
+
     # final flush
     flush(current_page)
     return chunks
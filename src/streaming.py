@@ -0,0 +1,90 @@
+import re, json, asyncio
+from typing import Iterator, AsyncIterator, Any
+
+_ANSWER_START = re.compile(r'"answer"\s*:\s*"')
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class AnswerStream:
+    """Pulls the "answer" string out of a synthesis response while it is still being generated.
+
+    The LLM answers with a JSON object ({"answer": ..., "reasoning": ...}); `feed` takes each raw
+    text delta and returns the answer characters it completes, with JSON escapes decoded. An
+    escape split across deltas is held back until the rest arrives, and so is the low half of a
+    \\u surrogate pair (emitted as one character; an unpaired surrogate becomes U+FFFD). Text
+    before the "answer" key and everything after its closing quote is not emitted. `text` is the
+    full raw output, for the final parse.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.pos: int | None = None
+        self.done = False
+
+    def feed(self, delta: str) -> str:
+        self.text += delta
+        if self.done:
+            return ""
+        if self.pos is None:
+            m = _ANSWER_START.search(self.text)
+            if not m:
+                return ""
+            self.pos = m.end()
+        buf, i, out = self.text, self.pos, []
+        while i < len(buf):
+            c = buf[i]
+            if c == '"':
+                self.done = True
+                i += 1
+                break
+            if c == "\\":
+                if i + 1 >= len(buf):
+                    break
+                if buf[i + 1] == "u":
+                    if i + 6 > len(buf):
+                        break
+                    code = int(buf[i + 2:i + 6], 16)
+                    if 0xD800 <= code < 0xDC00:
+                        # High surrogate: wait for the low half and emit the combined code point.
+                        if i + 12 > len(buf):
+                            break
+                        if buf[i + 6:i + 8] == "\\u" and 0xDC00 <= int(buf[i + 8:i + 12], 16) < 0xE000:
+                            low = int(buf[i + 8:i + 12], 16)
+                            out.append(chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)))
+                            i += 12
+                            continue
+                        code = 0xFFFD
+                    elif 0xDC00 <= code < 0xE000:
+                        code = 0xFFFD  # lone low surrogate; not encodable as UTF-8
+                    out.append(chr(code))
+                    i += 6
+                    continue
+                out.append(_ESCAPES.get(buf[i + 1], buf[i + 1]))
+                i += 2
+                continue
+            out.append(c)
+            i += 1
+        self.pos = i
+        return "".join(out)
+
+
+def synthesize_stream(llm, query: str, sub_queries, rows) -> Iterator[str]:
+    """Raw synthesis output in deltas, for any LLM; ones without `synthesize_stream` yield their
+    whole (re-serialized) answer at once."""
+    if hasattr(llm, "synthesize_stream"):
+        yield from llm.synthesize_stream(query, sub_queries, rows)
+        return
+    out = llm.synthesize(query, sub_queries, rows)
+    if out:
+        yield json.dumps(out, ensure_ascii=False)
+
+
+async def aiterate(it: Iterator[Any], executor=None) -> AsyncIterator[Any]:
+    """Async view of a blocking iterator: each `next` runs on `executor` (default: the loop's)."""
+    loop = asyncio.get_running_loop()
+    done = object()
+    while True:
+        item = await loop.run_in_executor(executor, next, it, done)
+        if item is done:
+            return
+        yield item
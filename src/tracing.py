@@ -0,0 +1,208 @@
+import os, json, time, uuid, threading, contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+from .utils.constants import TRACE_PATH, METRICS_PATH
+
+# Numeric span attributes that are also accumulated as Prometheus counters.
+COUNTED_ATTRS = ("queries", "candidates", "pairs", "scored", "cache_hits", "tokens", "chunks", "pages", "rows", "tokens_saved")
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_CURRENT_TRACE: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("rag_trace", default=None)
+_CURRENT_SPAN: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("rag_span", default=None)
+
+
+class _NullSpan:
+    """Returned by `span` when no trace is active: every operation is a no-op."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ("trace", "id", "parent", "name", "attrs", "start", "seconds", "_token")
+
+    def __init__(self, trace: "Trace", name: str, attrs: Dict[str, Any]):
+        self.trace, self.name, self.attrs = trace, name, attrs
+        self.id = None
+        self.parent = None
+        self.start = self.seconds = 0.0
+
+    def __enter__(self):
+        self.parent = _CURRENT_SPAN.get()
+        self.id = self.trace._next_id()
+        self._token = _CURRENT_SPAN.set(self.id)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self.start
+        _CURRENT_SPAN.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.trace._finish(self)
+        return False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class Trace:
+    """Spans recorded for one question or one index build.
+    Spans opened through `span()` while the trace is active (see `activate`) attach to it,
+    nested by the context they were opened in. Finished spans also feed `METRICS`."""
+
+    def __init__(self, name: str, **attrs):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.spans: List[Span] = []
+        self.t0 = time.perf_counter()
+        self.started_at = time.time()
+        self._ids = 0
+        self._lock = threading.Lock()
+
+    def _next_id(self) -> int:
+        with self._lock:
+            self._ids += 1
+            return self._ids
+
+    def _finish(self, sp: Span):
+        with self._lock:
+            self.spans.append(sp)
+        METRICS.observe(sp)
+
+    def span(self, name: str, **attrs) -> Span:
+        return Span(self, name, attrs)
+
+    def stages(self) -> Dict[str, float]:
+        """Seconds per span name, summed, for top-level and nested spans alike."""
+        out: Dict[str, float] = {}
+        for sp in self.spans:
+            out[sp.name] = round(out.get(sp.name, 0.0) + sp.seconds, 6)
+        return out
+
+    def to_dict(self) -> Dict[str, Any]:
+        spans = sorted(self.spans, key=lambda s: s.start)
+        return {
+            "trace_id": self.id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "total_seconds": round(time.perf_counter() - self.t0, 6),
+            "stages": self.stages(),
+            "spans": [{"id": s.id, "parent": s.parent, "name": s.name,
+                       "offset_seconds": round(s.start - self.t0, 6), "seconds": round(s.seconds, 6),
+                       **({"attrs": s.attrs} if s.attrs else {})} for s in spans],
+            **({"attrs": self.attrs} if self.attrs else {}),
+        }
+
+
+@contextmanager
+def activate(trace: Optional[Trace]):
+    """Makes `trace` the target of `span()` calls in this context; a no-op for None."""
+    if trace is None:
+        yield None
+        return
+    token = _CURRENT_TRACE.set(trace)
+    try:
+        yield trace
+    finally:
+        _CURRENT_TRACE.reset(token)
+
+
+def span(name: str, **attrs):
+    """A span on the active trace, or the shared no-op span when tracing is off."""
+    trace = _CURRENT_TRACE.get()
+    if trace is None:
+        return NULL_SPAN
+    return Span(trace, name, attrs)
+
+
+def current_trace() -> Optional[Trace]:
+    return _CURRENT_TRACE.get()
+
+
+def trace_context(trace: Optional[Trace]) -> contextvars.Context:
+    """A copy of the current context with `trace` active. For work that is resumed step by step,
+    possibly on different threads (generators, async iterators): run each step with `ctx.run`."""
+    ctx = contextvars.copy_context()
+    if trace is not None:
+        ctx.run(_CURRENT_TRACE.set, trace)
+    return ctx
+
+
+_APPEND_LOCK = threading.Lock()
+
+
+def append_jsonl(trace: Trace, path: str = TRACE_PATH):
+    line = json.dumps(trace.to_dict(), ensure_ascii=False, default=str) + "\n"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with _APPEND_LOCK, open(path, "a", encoding="utf-8") as f:
+        f.write(line)
+
+
+class Metrics:
+    """Process-wide span histograms and attribute counters, exported in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hist: Dict[str, List[float]] = {}
+        self.sums: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.counters: Dict[tuple, float] = {}
+
+    def observe(self, sp: Span):
+        self.observe_seconds(sp.name, sp.seconds, sp.attrs)
+
+    def observe_seconds(self, stage: str, seconds: float, attrs: Dict[str, Any] | None = None):
+        """Records one duration for `stage`; also used for latencies that are not spans (e.g. TTFT)."""
+        with self._lock:
+            buckets = self.hist.setdefault(stage, [0] * len(HISTOGRAM_BUCKETS))
+            for i, le in enumerate(HISTOGRAM_BUCKETS):
+                if seconds <= le:
+                    buckets[i] += 1
+            self.sums[stage] = self.sums.get(stage, 0.0) + seconds
+            self.counts[stage] = self.counts.get(stage, 0) + 1
+            for attr in COUNTED_ATTRS:
+                v = (attrs or {}).get(attr)
+                if isinstance(v, (int, float)) and not isinstance(v, bool):
+                    self.counters[(stage, attr)] = self.counters.get((stage, attr), 0) + v
+
+    def reset(self):
+        with self._lock:
+            self.hist, self.sums, self.counts, self.counters = {}, {}, {}, {}
+
+    def to_prometheus(self) -> str:
+        with self._lock:
+            lines = ["# HELP rag_stage_seconds Wall time of pipeline stages.",
+                     "# TYPE rag_stage_seconds histogram"]
+            for stage in sorted(self.hist):
+                for le, n in zip(HISTOGRAM_BUCKETS, self.hist[stage]):
+                    lines.append(f'rag_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {n}')
+                lines.append(f'rag_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {self.counts[stage]}')
+                lines.append(f'rag_stage_seconds_sum{{stage="{stage}"}} {self.sums[stage]:.6f}')
+                lines.append(f'rag_stage_seconds_count{{stage="{stage}"}} {self.counts[stage]}')
+            lines += ["# HELP rag_stage_items_total Items processed by pipeline stages (candidates, pairs, cache hits, ...).",
+                      "# TYPE rag_stage_items_total counter"]
+            for (stage, attr), v in sorted(self.counters.items()):
+                lines.append(f'rag_stage_items_total{{stage="{stage}",item="{attr}"}} {v:g}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str = METRICS_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp, path)
+
+
+METRICS = Metrics()
@@ -6,3 +6,47 @@ DFEAULT_TOP_K = 10
 RERANK_TOP_K = 3
 DEFAULT_EMBEDDING_MODEL = "google/embeddinggemma-300m"
 DEFAULT_LLM_MODEL = "gemini-2.5-pro"
+COLLECTION_NAME = "uniqus_rag"
+CHUNK_TOKENS = 900
+CHUNK_OVERLAP_TOKENS = 100
+MANIFEST_PATH = "artifacts/index_manifest.json"
+INGEST_WORKERS = 1
+PDF_ENGINE = "pdfium"  # pdfium | pdfplumber
+CHUNK_PAGE_BATCH = 32  # pages per tokenizer call while chunking a page stream
+INGEST_EMBED_BATCH = 64  # chunks per embed + upsert batch during ingest
+EMBED_CACHE_DIR = "artifacts/embed_cache"
+EMBED_CACHE_MAX_ENTRIES = 100_000
+DEFAULT_RERANKER_MODEL = "BAAI/bge-reranker-large"
+RERANK_PRECISION = "fp32"  # fp32 | bf16 | int8
+RERANK_BATCH_SIZE = 16
+RERANK_THREADS = None  # None -> torch default
+RERANK_CACHE_PATH = "artifacts/rerank_cache.json"
+RERANK_CACHE_MAX_ENTRIES = 50_000
+LLM_CACHE_PATH = "artifacts/llm_cache.json"
+LLM_CACHE_TTL_SECONDS = 24 * 3600
+LLM_CACHE_MAX_ENTRIES = 1000
+LLM_CACHE_SIMILARITY = 0.97
+PLANNER_MIN_CONFIDENCE = 0.8
+FACTS_DB_PATH = "artifacts/facts.sqlite"
+BM25_INDEX_PATH = "artifacts/bm25_index.json"
+HYBRID_RERANK_K = 6  # fused candidates passed to the reranker per sub-query
+VECTOR_BACKEND = "chroma"  # chroma | numpy
+VECTOR_DTYPE = "float32"  # numpy backend storage: float32 | float16 | int8 (per-vector scale)
+EMBED_DIM = None  # Matryoshka truncation: None (full 768) | 512 | 256 | 128
+TRACE_ENABLED = False
+TRACE_PATH = "artifacts/traces.jsonl"
+METRICS_PATH = "artifacts/metrics.prom"
+SERVE_HOST = "127.0.0.1"
+SERVE_PORT = 8000
+SERVE_WORKERS = 8  # concurrent questions in server / batch mode
+BATCH_MAX_WAIT_MS = 10  # how long a batcher waits for more concurrent requests
+EMBED_MAX_BATCH = 64
+RERANK_MAX_BATCH = 128
+QUERY_WORKERS = 8  # threads running sub-query retrieval/rerank and LLM calls; 0 -> sequential
+# Per-stage timeouts in seconds (None waits indefinitely). Retrieve and rerank apply per plan.
+DECOMPOSE_TIMEOUT = None
+RETRIEVE_TIMEOUT = None
+RERANK_TIMEOUT = None
+SYNTHESIZE_TIMEOUT = None
+EVIDENCE_TOKEN_BUDGET = 1500  # approx. tokens of evidence text sent to synthesis; 0 -> whole chunks
+EVIDENCE_WINDOW = 1  # neighboring sentences/table rows kept around each match
@@ -0,0 +1,29 @@
+from typing import Any, Dict
+
+
+def matches_where(meta: Dict[str, Any], where: Dict[str, Any] | None) -> bool:
+    """Evaluates the subset of Chroma `where` syntax produced by `_build_where`
+    ({field: value}, {field: {"$eq"|"$ne"|"$in"|"$nin": ...}}, {"$and"|"$or": [...]}) against metadata."""
+    if not where:
+        return True
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(matches_where(meta, c) for c in cond):
+                return False
+        elif key == "$or":
+            if not any(matches_where(meta, c) for c in cond):
+                return False
+        elif isinstance(cond, dict):
+            val = meta.get(key)
+            for op, arg in cond.items():
+                if op == "$eq" and val != arg:
+                    return False
+                if op == "$ne" and val == arg:
+                    return False
+                if op == "$in" and val not in arg:
+                    return False
+                if op == "$nin" and val in arg:
+                    return False
+        elif meta.get(key) != cond:
+            return False
+    return True
@@ -0,0 +1,19 @@
+import sys, time, importlib
+from typing import Dict
+
+# Seconds spent importing each heavy dependency in this process, in import order.
+IMPORT_TIMINGS: Dict[str, float] = {}
+
+
+def timed_import(name: str):
+    """Imports `name` on first use and logs how long it took.
+    torch, transformers, sentence_transformers, chromadb, pdfplumber and google.generativeai are
+    imported through here, so each command pays only for the stages it runs."""
+    mod = sys.modules.get(name)
+    if mod is not None:
+        return mod
+    t0 = time.perf_counter()
+    mod = importlib.import_module(name)
+    IMPORT_TIMINGS[name] = time.perf_counter() - t0
+    print(f"[IMPORT] {name} in {IMPORT_TIMINGS[name]:.2f}s")
+    return mod
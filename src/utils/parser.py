@@ -12,6 +12,46 @@ COMPANY_ALIASES = {
 
 COMPANY_LIST = ["GOOGL", "MSFT", "NVDA"]
 
+METRIC_PATTERNS = [
+    # (metric_key, regex pattern, value_kind)
+    ("operating margin", r"operating margin[^\d%]*([0-9]{1,3}(?:\.[0-9]+)?)\s*%", "percent"),
+    ("gross margin",     r"gross margin[^\d%]*([0-9]{1,3}(?:\.[0-9]+)?)\s*%", "percent"),
+    ("cloud revenue",    r"(?:cloud|google cloud|microsoft cloud|azure|gcp)[^\$\d%]{0,40}(\$?[\d,\.]+)\s*(billion|million|thousand|bn|m|k)?", "money"),
+    ("data center revenue", r"data\s*center[^\$\d%]{0,40}(\$?[\d,\.]+)\s*(billion|million|thousand|bn|m|k)?", "money"),
+    ("total revenue",    r"total\s+revenue[^\$\d%]{0,40}(\$?[\d,\.]+)\s*(billion|million|thousand|bn|m|k)?", "money"),
+]
+
+UNIT_MULT = {
+    None: 1.0,
+    "billion": 1e9, "bn": 1e9,
+    "million": 1e6, "m": 1e6,
+    "thousand": 1e3, "k": 1e3,
+}
+
+def money_to_float(val: str, unit: str) -> float:
+    v = val.replace("$","").replace(",","")
+    try:
+        x = float(v)
+    except:
+        return float("nan")
+    mult = UNIT_MULT.get(unit.lower() if unit else None, 1.0)
+    return x * mult
+
+
+def find_metric_value(text: str, metric_key: str):
+    for key, pattern, kind in METRIC_PATTERNS:
+        if key == metric_key:
+            m = re.search(pattern, text, flags=re.I)
+            if not m:
+                continue
+            if kind == "percent":
+                value = float(m.group(1))
+                return {"kind": "percent", "value": value}
+            if kind == "money":
+                value = money_to_float(m.group(1), m.group(2) if len(m.groups())>1 else None)
+                return {"kind": "money", "value": value}
+    return None
+
 def parse_company_year_from_filename(path: str):
     """Expecting filenames like MSFT_2023.pdf (case-insensitive).
     Returns (company, year) or (None, None) if not parseable."""